@@ -0,0 +1,10 @@
+"""Offline benchmark harness for the invoice extraction pipeline.
+
+Run from ``backend/``::
+
+    python -m benchmarks.run_pipeline --invoices 50 --output bench.json
+
+No provider API keys or network access are needed: provider calls are
+replaced by :class:`benchmarks.fake_extractor.FakeInvoiceExtractor`, which
+simulates latency, jitter and errors deterministically from a seed.
+"""
@@ -0,0 +1,146 @@
+"""Deterministic synthetic invoice corpus.
+
+Each generated PDF comes with the invoice JSON it was rendered from (in the
+shared ``INVOICE_SCHEMA`` shape), so the fake extractor can return a correct
+answer and the validation/trust layer does the same work it does in
+production.
+"""
+
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from typing import List, Sequence
+
+import fitz  # type: ignore
+
+
+_VENDORS = (
+    ("Northwind Traders", "12 Harbour Rd, Seattle, WA 98101"),
+    ("Contoso Office Supply", "400 Market St, Denver, CO 80202"),
+    ("Fabrikam Industrial", "88 Mill Lane, Leeds LS1 4AP"),
+    ("Tailspin Logistics", "5 Airport Way, Austin, TX 73301"),
+)
+_PRODUCTS = (
+    "Office Chair", "Standing Desk", "Monitor Arm", "USB-C Dock", "Printer Paper A4",
+    "Toner Cartridge", "Whiteboard Markers", "Filing Cabinet", "Desk Lamp", "Cable Tray",
+)
+_ROWS_PER_PAGE = 28
+_TERMS = (
+    "All goods remain the property of the seller until paid in full. The seller shall not be "
+    "liable for indirect or consequential losses. Governing law and jurisdiction apply."
+)
+
+
+@dataclass
+class SyntheticInvoice:
+    filename: str
+    pdf_bytes: bytes
+    page_count: int
+    expected: dict
+
+
+def build_corpus(count: int, *, seed: int = 7, page_counts: Sequence[int] = (1, 1, 2, 3, 5)) -> List[SyntheticInvoice]:
+    """Generate ``count`` invoices cycling through ``page_counts``."""
+
+    rng = random.Random(seed)
+    return [
+        _build_invoice(index, page_counts[index % len(page_counts)], rng)
+        for index in range(count)
+    ]
+
+
+def _build_invoice(index: int, page_count: int, rng: random.Random) -> SyntheticInvoice:
+    vendor_name, vendor_address = _VENDORS[index % len(_VENDORS)]
+    invoice_number = f"INV-{10000 + index}"
+    date = f"2024-{(index % 12) + 1:02d}-{(index % 27) + 1:02d}"
+
+    # Leave room for the totals block on the last page
+    row_count = max(1, page_count * _ROWS_PER_PAGE - 8)
+    line_items = []
+    for row in range(row_count):
+        quantity = rng.randint(1, 9)
+        rate = round(rng.uniform(2, 400), 2)
+        line_items.append(
+            {
+                "item_name": _PRODUCTS[(index + row) % len(_PRODUCTS)],
+                "description": None,
+                "product_code": f"SKU-{index:04d}-{row:03d}",
+                "quantity": quantity,
+                "rate": rate,
+                "amount": round(quantity * rate, 2),
+            }
+        )
+
+    subtotal = round(sum(item["amount"] for item in line_items), 2)
+    shipping = round(rng.uniform(0, 50), 2)
+    tax = round(subtotal * 0.08, 2)
+    total = round(subtotal + shipping + tax, 2)
+    expected = {
+        "invoice_number": invoice_number,
+        "date": date,
+        "vendor": {"name": vendor_name, "address": vendor_address},
+        "customer": {"name": f"Customer {index % 13}", "billing_address": None},
+        "shipping_info": None,
+        "order_id": f"PO-{index:05d}",
+        "line_items": line_items,
+        "financial_summary": {
+            "subtotal": subtotal,
+            "discount": {"percent": None, "amount": None},
+            "shipping": shipping,
+            "tax": tax,
+            "total": total,
+            "balance_due": total,
+        },
+        "payment_terms": "Net 30",
+        "notes": None,
+    }
+
+    pdf_bytes, rendered_pages = _render_pdf(expected, page_count)
+    return SyntheticInvoice(
+        filename=f"bench_{index:04d}_{page_count}p.pdf",
+        pdf_bytes=pdf_bytes,
+        page_count=rendered_pages,
+        expected=expected,
+    )
+
+
+def _render_pdf(invoice: dict, page_count: int) -> tuple[bytes, int]:
+    document = fitz.open()
+    try:
+        rows = invoice["line_items"]
+        for page_index in range(page_count):
+            page = document.new_page()
+            lines = [
+                f"{invoice['vendor']['name']}  |  {invoice['vendor']['address']}",
+                f"Invoice {invoice['invoice_number']}    Date {invoice['date']}    PO {invoice['order_id']}",
+                f"Bill to: {invoice['customer']['name']}",
+                "",
+                "Item    SKU    Qty    Rate    Amount",
+            ]
+            page_rows = rows[page_index * _ROWS_PER_PAGE : (page_index + 1) * _ROWS_PER_PAGE]
+            for item in page_rows:
+                lines.append(
+                    f"{item['item_name']}    {item['product_code']}    {item['quantity']}    "
+                    f"{item['rate']:.2f}    {item['amount']:.2f}"
+                )
+            if page_index == page_count - 1:
+                summary = invoice["financial_summary"]
+                lines += [
+                    "",
+                    f"Subtotal {summary['subtotal']:.2f}",
+                    f"Shipping {summary['shipping']:.2f}",
+                    f"Tax {summary['tax']:.2f}",
+                    f"Total {summary['total']:.2f}",
+                    f"Terms: {invoice['payment_terms']}",
+                    _TERMS,
+                ]
+            lines.append(f"Page {page_index + 1} of {page_count}")
+
+            y = 36
+            for line in lines:
+                page.insert_text((36, y), line, fontsize=8)
+                y += 11
+        return document.tobytes(), len(document)
+    finally:
+        document.close()
@@ -0,0 +1,149 @@
+"""Local stand-in for a provider-backed invoice extractor."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import defaultdict
+from typing import Dict, Mapping
+
+from services.document_text import extract_text_from_document_async
+from services.json_recovery import JSONRecoveryError, parse_model_json
+from services.prompt_compaction import CHARS_PER_TOKEN, estimate_tokens
+
+RESPONSE_MODES = ("json", "prose")
+
+
+class FakeInvoiceExtractor:
+    """Implements ``InvoiceExtractorProtocol`` without calling any provider.
+
+    Local text extraction runs for real (so CPU cost and executor queueing
+    are measured); the provider round-trip is replaced by a sleep of
+    ``latency_ms + per_page_ms * pages`` plus Gaussian jitter. Latency and
+    errors are drawn from an RNG seeded by the document hash and call
+    number, so results do not depend on task scheduling order.
+
+    The answer is returned as response text and parsed like a real one:
+    ``response_mode="json"`` emits compact JSON (provider JSON mode),
+    ``"prose"`` the fenced, indented JSON the old prompts produced. Either
+    is cut at ``max_output_tokens`` the way ``max_tokens`` truncates.
+    """
+
+    name = "fake"
+    _model = "fake-model"
+    prompt_version = "benchmark"
+
+    def __init__(
+        self,
+        answers: Mapping[str, dict],
+        *,
+        latency_ms: float = 800.0,
+        per_page_ms: float = 150.0,
+        jitter_ms: float = 200.0,
+        error_rate: float = 0.0,
+        seed: int = 7,
+        response_mode: str = "json",
+        max_output_tokens: int = 4096,
+    ) -> None:
+        if response_mode not in RESPONSE_MODES:
+            raise ValueError(f"response_mode must be one of {RESPONSE_MODES}")
+        self._answers = answers
+        self._latency_ms = latency_ms
+        self._per_page_ms = per_page_ms
+        self._jitter_ms = jitter_ms
+        self._error_rate = error_rate
+        self._seed = seed
+        self._response_mode = response_mode
+        self._max_output_tokens = max_output_tokens
+        self._calls: Dict[str, int] = defaultdict(int)
+        self._response_stats: Dict[str, int] = defaultdict(int)
+
+    def reset(self) -> None:
+        """Forget call counts so the next run replays the same latencies and errors."""
+
+        self._calls.clear()
+        self._response_stats.clear()
+
+    def response_stats(self) -> Dict[str, float]:
+        """Responses, parse outcomes and output tokens since the last reset."""
+
+        stats = dict(self._response_stats)
+        responses = stats.get("responses", 0)
+        return {
+            "responses": responses,
+            "repaired": stats.get("repaired", 0),
+            "parse_failures": stats.get("failed", 0),
+            "parse_failure_rate": stats.get("failed", 0) / responses if responses else 0.0,
+            "output_tokens_mean": stats.get("output_tokens", 0) / responses if responses else 0.0,
+        }
+
+    def _response_text(self, answer: dict) -> str:
+        if self._response_mode == "json":
+            text = json.dumps(answer, ensure_ascii=False, separators=(",", ":"))
+        else:
+            text = "```json\n" + json.dumps(answer, ensure_ascii=False, indent=2) + "\n```"
+        return text[: self._max_output_tokens * CHARS_PER_TOKEN]
+
+    @staticmethod
+    def digest(file_bytes: bytes) -> str:
+        return hashlib.sha256(file_bytes).hexdigest()
+
+    async def extract_invoice(
+        self,
+        *,
+        file_bytes: bytes,
+        filename: str,
+        mime_type: str,
+    ) -> dict:
+        start = time.perf_counter()
+        text_result = await extract_text_from_document_async(file_bytes, mime_type)
+
+        digest = self.digest(file_bytes)
+        call_number = self._calls[digest]
+        self._calls[digest] += 1
+        rng = random.Random(f"{self._seed}:{digest}:{call_number}")
+
+        delay_ms = self._latency_ms + self._per_page_ms * text_result.page_count
+        delay_ms = max(0.0, delay_ms + rng.gauss(0.0, self._jitter_ms))
+        api_start = time.perf_counter()
+        await asyncio.sleep(delay_ms / 1000)
+        api_call_time = (time.perf_counter() - api_start) * 1000
+
+        if rng.random() < self._error_rate:
+            raise RuntimeError("Simulated provider error")
+
+        response_text = self._response_text(self._answers[digest])
+        output_tokens = estimate_tokens(response_text)
+        self._response_stats["responses"] += 1
+        self._response_stats["output_tokens"] += output_tokens
+
+        parse_start = time.perf_counter()
+        try:
+            parsed = parse_model_json(response_text, provider=self.name)
+            invoice_json = parsed.value
+            self._response_stats["repaired"] += parsed.repaired
+        except JSONRecoveryError as exc:
+            self._response_stats["failed"] += 1
+            invoice_json = {"error": f"Failed to parse JSON response: {exc}", "line_items": []}
+        json_parse_time = (time.perf_counter() - parse_start) * 1000
+
+        breakdown = {
+            "provider": self.name,
+            "model": self._model,
+            "text_extraction_time": text_result.perf_metrics.get("text_extraction_time", 0),
+            "text_queue_wait_time": text_result.perf_metrics.get("text_queue_wait_time", 0),
+            "api_call_time": api_call_time,
+            "json_parse_time": json_parse_time,
+            "output_tokens": output_tokens,
+        }
+        return {
+            "result_json": invoice_json,
+            "result_markdown": json.dumps(invoice_json, indent=2),
+            "pages": text_result.page_count,
+            "duration": round(time.perf_counter() - start, 2),
+            "images": {},
+            "performance": {**breakdown, "provider_breakdown": breakdown},
+        }
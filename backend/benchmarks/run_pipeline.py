@@ -0,0 +1,376 @@
+"""Benchmark the invoice pipeline stage by stage against a fake provider.
+
+Stages, each run over the same synthetic corpus:
+
+* ``text_extraction`` - local PyMuPDF text extraction on the CPU executor
+* ``extract_invoice`` - the fake extractor (text extraction + simulated provider call)
+* ``process_invoice`` - ``routers.ocr._process_invoice_bytes`` (save, extract, validate)
+* ``batch_endpoint``  - ``routers.ocr.extract_invoice_data_batch`` end to end
+
+For every stage the report has p50/p95/p99 per-invoice latency, invoices/sec
+over the stage's wall-clock time, errors, and peak RSS while the stage ran.
+Stages that call the fake provider also report its JSON parse failure rate
+and mean output tokens (``--response-mode`` picks JSON mode or the old
+fenced prose responses).
+Use ``--output`` to write JSON and ``--compare`` to diff against a report
+from another commit.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+# Keep the router import offline: no provider key check, no on-disk result cache
+os.environ.setdefault("DEEPSEEK_API_KEY", "offline-benchmark")
+os.environ.setdefault("OCR_CACHE_ENABLED", "false")
+
+from benchmarks.corpus import SyntheticInvoice, build_corpus  # noqa: E402
+from benchmarks.fake_extractor import RESPONSE_MODES, FakeInvoiceExtractor  # noqa: E402
+from services.app_logging import configure_logging  # noqa: E402
+from services.layout_extractor import LayoutInvoiceExtractor  # noqa: E402
+
+
+STAGES = ("text_extraction", "extract_invoice", "process_invoice", "batch_endpoint")
+
+
+class _RssSampler:
+    """Samples resident set size on a background thread while a stage runs."""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.start_bytes = 0
+        self.peak_bytes = 0
+
+    def __enter__(self) -> "_RssSampler":
+        self.start_bytes = self.peak_bytes = _current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, _current_rss())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self.peak_bytes = max(self.peak_bytes, _current_rss())
+
+
+def _current_rss() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Non-Linux: fall back to the lifetime high-water mark
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _percentile(sorted_values: Sequence[float], percentile: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * percentile / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def _summarise(latencies_ms: List[float], errors: int, wall_seconds: float, rss: _RssSampler) -> Dict[str, Any]:
+    ordered = sorted(latencies_ms)
+    completed = len(ordered)
+    return {
+        "invoices": completed + errors,
+        "errors": errors,
+        "wall_time_s": round(wall_seconds, 3),
+        "invoices_per_sec": round(completed / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(_percentile(ordered, 50), 2),
+            "p95": round(_percentile(ordered, 95), 2),
+            "p99": round(_percentile(ordered, 99), 2),
+            "max": round(ordered[-1], 2) if ordered else 0.0,
+        },
+        "peak_rss_mb": round(rss.peak_bytes / 2**20, 1),
+        "rss_growth_mb": round((rss.peak_bytes - rss.start_bytes) / 2**20, 1),
+    }
+
+
+async def _run_per_invoice(
+    corpus: Sequence[SyntheticInvoice],
+    concurrency: int,
+    call: Callable[[SyntheticInvoice], Awaitable[Any]],
+) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    latencies: List[float] = []
+    errors = 0
+
+    async def _timed(invoice: SyntheticInvoice) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(invoice)
+            except Exception:
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    with _RssSampler() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(_timed(invoice) for invoice in corpus))
+        wall = time.perf_counter() - start
+    return _summarise(latencies, errors, wall, rss)
+
+
+async def _run_batch_endpoint(ocr: Any, corpus: Sequence[SyntheticInvoice]) -> Dict[str, Any]:
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+
+    uploads = [
+        UploadFile(
+            file=io.BytesIO(invoice.pdf_bytes),
+            filename=invoice.filename,
+            headers=Headers({"content-type": "application/pdf"}),
+        )
+        for invoice in corpus
+    ]
+    # Time each invoice inside the batch by wrapping the per-invoice core
+    latencies: List[float] = []
+    process_invoice_bytes = ocr._process_invoice_bytes
+
+    async def _timed_process(*args: Any, **kwargs: Any) -> Dict[str, Any]:
+        start = time.perf_counter()
+        result = await process_invoice_bytes(*args, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+        return result
+
+    ocr._process_invoice_bytes = _timed_process
+    try:
+        with _RssSampler() as rss:
+            start = time.perf_counter()
+            response = await ocr.extract_invoice_data_batch(uploads)
+            wall = time.perf_counter() - start
+    finally:
+        ocr._process_invoice_bytes = process_invoice_bytes
+
+    body = json.loads(response.body)
+    errors = len(body["summary"]["processing_errors"])
+    return _summarise(latencies, errors, wall, rss)
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    from services.document_text import extract_text_from_document_async
+
+    page_counts = [int(value) for value in args.page_counts.split(",")]
+    corpus_start = time.perf_counter()
+    corpus = build_corpus(args.invoices, seed=args.seed, page_counts=page_counts)
+    corpus_time = time.perf_counter() - corpus_start
+
+    fake = FakeInvoiceExtractor(
+        {FakeInvoiceExtractor.digest(invoice.pdf_bytes): invoice.expected for invoice in corpus},
+        latency_ms=args.latency_ms,
+        per_page_ms=args.per_page_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        response_mode=args.response_mode,
+    )
+    extractor = LayoutInvoiceExtractor(fake) if args.layout_fast_path else fake
+
+    import routers.ocr as ocr
+
+    real_extractor = ocr._invoice_extractor
+    ocr._invoice_extractor = extractor
+    stages: Dict[str, Dict[str, Any]] = {}
+    selected = [stage for stage in STAGES if stage in args.stages]
+    try:
+        for stage in selected:
+            fake.reset()
+            if stage == "text_extraction":
+                result = await _run_per_invoice(
+                    corpus,
+                    args.concurrency,
+                    lambda inv: extract_text_from_document_async(inv.pdf_bytes, "application/pdf"),
+                )
+            elif stage == "extract_invoice":
+                result = await _run_per_invoice(
+                    corpus,
+                    args.concurrency,
+                    lambda inv: extractor.extract_invoice(
+                        file_bytes=inv.pdf_bytes, filename=inv.filename, mime_type="application/pdf"
+                    ),
+                )
+            elif stage == "process_invoice":
+                result = await _run_per_invoice(
+                    corpus,
+                    args.concurrency,
+                    lambda inv: ocr._process_invoice_bytes(
+                        inv.pdf_bytes, inv.filename, "application/pdf", extractor
+                    ),
+                )
+            else:
+                result = await _run_batch_endpoint(ocr, corpus)
+            provider_output = fake.response_stats()
+            if provider_output["responses"]:
+                result["provider_output"] = provider_output
+            stages[stage] = result
+    finally:
+        ocr._invoice_extractor = real_extractor
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus": {
+                "invoices": len(corpus),
+                "pages": sum(invoice.page_count for invoice in corpus),
+                "page_counts": page_counts,
+                "bytes": sum(len(invoice.pdf_bytes) for invoice in corpus),
+                "generation_time_s": round(corpus_time, 3),
+            },
+            "config": {
+                "seed": args.seed,
+                "concurrency": args.concurrency,
+                "latency_ms": args.latency_ms,
+                "per_page_ms": args.per_page_ms,
+                "jitter_ms": args.jitter_ms,
+                "error_rate": args.error_rate,
+                "layout_fast_path": args.layout_fast_path,
+                "response_mode": args.response_mode,
+            },
+        },
+        "stages": stages,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    meta = report["meta"]
+    corpus = meta["corpus"]
+    print(f"\n{'═' * 78}")
+    print(
+        f"📊 PIPELINE BENCHMARK  commit={meta['commit'] or 'n/a'}  "
+        f"invoices={corpus['invoices']}  pages={corpus['pages']}  concurrency={meta['config']['concurrency']}"
+    )
+    print(f"{'═' * 78}")
+    print(f"{'stage':<17}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'inv/s':>9}{'errors':>8}{'peak RSS':>11}")
+    for stage, result in report["stages"].items():
+        latency = result["latency_ms"]
+        print(
+            f"{stage:<17}{latency['p50']:>10.1f}{latency['p95']:>10.1f}{latency['p99']:>10.1f}"
+            f"{result['invoices_per_sec']:>9.2f}{result['errors']:>8}{result['peak_rss_mb']:>9.1f}MB"
+        )
+        previous = (baseline or {}).get("stages", {}).get(stage)
+        if previous:
+            print(
+                f"{'  vs baseline':<17}{_delta(latency['p50'], previous['latency_ms']['p50']):>10}"
+                f"{_delta(latency['p95'], previous['latency_ms']['p95']):>10}"
+                f"{_delta(latency['p99'], previous['latency_ms']['p99']):>10}"
+                f"{_delta(result['invoices_per_sec'], previous['invoices_per_sec']):>9}"
+                f"{'':>8}{_delta(result['peak_rss_mb'], previous['peak_rss_mb']):>11}"
+            )
+    outputs = {stage: result["provider_output"] for stage, result in report["stages"].items() if "provider_output" in result}
+    if outputs:
+        print(f"{'─' * 78}")
+        print(f"{'provider output':<17}{'responses':>10}{'repaired':>10}{'failed':>10}{'fail %':>9}{'out tok/resp':>14}")
+        for stage, output in outputs.items():
+            print(
+                f"{stage:<17}{output['responses']:>10}{output['repaired']:>10}{output['parse_failures']:>10}"
+                f"{output['parse_failure_rate'] * 100:>8.1f}%{output['output_tokens_mean']:>14.0f}"
+            )
+    print(f"{'═' * 78}\n")
+
+
+def _delta(current: float, previous: float) -> str:
+    if not previous:
+        return "n/a"
+    return f"{(current - previous) / previous * 100:+.1f}%"
+
+
+def _parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--invoices", type=int, default=40, help="number of synthetic invoices")
+    parser.add_argument("--page-counts", default="1,1,2,3,5", help="page counts to cycle through")
+    parser.add_argument("--concurrency", type=int, default=8, help="in-flight invoices for per-invoice stages")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="simulated provider base latency")
+    parser.add_argument("--per-page-ms", type=float, default=150.0, help="simulated latency added per page")
+    parser.add_argument("--jitter-ms", type=float, default=200.0, help="std-dev of simulated latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of provider calls that fail")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument(
+        "--layout-fast-path", action="store_true", help="put the deterministic layout extractor in front of the fake provider"
+    )
+    parser.add_argument(
+        "--response-mode", choices=RESPONSE_MODES, default="json", help="fake provider output: JSON mode or fenced prose"
+    )
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of stages")
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    parser.add_argument("--compare", type=Path, help="baseline JSON report to diff against")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's own console output")
+    args = parser.parse_args(argv)
+    args.stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = _parse_args(argv)
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    output = args.output.resolve() if args.output else None
+
+    # uploads/ is written relative to the working directory; keep it out of the tree
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="invoice-bench-") as workdir:
+        os.chdir(workdir)
+        try:
+            if not args.verbose:
+                # The log writer thread holds the real stdout, so redirecting is not enough
+                configure_logging("OFF")
+            quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with quiet:
+                report = asyncio.run(run_benchmark(args))
+        finally:
+            os.chdir(original_cwd)
+
+    _print_report(report, baseline)
+    if output is not None:
+        output.write_text(json.dumps(report, indent=2))
+        print(f"Report written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
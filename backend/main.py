@@ -1,11 +1,27 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from routers import ocr, telemetry, files
+from routers import ocr, telemetry, files, metrics
+from services.app_logging import RequestDebugMiddleware, shutdown_logging
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="Insight-First Reading API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Resume durable batch jobs left unfinished by a previous run
+    ocr.start_job_workers()
+    yield
+    await ocr.stop_job_workers()
+    # Close pooled provider connections so shutdown doesn't leak sockets
+    await ocr.close_invoice_extractor()
+    # Drain the background log writer before the process exits
+    shutdown_logging()
+
+
+app = FastAPI(title="Insight-First Reading API", lifespan=lifespan)
 
 
 # Allow CORS for frontend dev 
@@ -16,10 +32,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# X-Debug-Log: 1 (or ?debug_log=1) turns on DEBUG logs for that request only
+app.add_middleware(RequestDebugMiddleware)
+
 # Register routers 
 app.include_router(ocr.router, prefix="/ocr", tags=["OCR"])
 app.include_router(telemetry.router, prefix="/telemetry", tags=["Telemetry"])
 app.include_router(files.router, tags=["Files"])
+app.include_router(metrics.router, tags=["Metrics"])
 
 @app.get("/")
 def read_root():
@@ -10,29 +10,303 @@ Manages temporary file cleanup (future)
 
 ENDPOINTS:
 ==========
-GET /files/{filename} - Serve PDF file for viewer
+GET /files/invoices/{invoice_uid} - Serve an invoice's PDF by its uid
+GET /files/invoices/{invoice_uid}/pages/{page} - Rendered page image (PNG/WebP)
+GET /files/assets/{asset} - Stored OCR image referenced from /ocr/analyze
+GET /files/{filename} - Serve PDF file for viewer (most recent upload with that name)
+
+STORAGE:
+========
+Uploads live in the content-addressed BlobStore (services/blob_store.py):
+uploads/<sha[0:2]>/<sha[2:4]>/<sha256>.pdf plus an index mapping
+invoice_uid → blob, so every lookup here is a single indexed query.
+
+CACHING:
+========
+Responses carry an ETag (the content hash for stored blobs) and
+Cache-Control, answer If-None-Match with 304, and honour single byte-range
+requests with 206 so pdf.js can fetch only the pages it renders.
 """
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
-import os
+import asyncio
+import re
+import uuid
+from typing import Iterator, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pathlib import Path
 
+from services.app_logging import get_logger
+from services.blob_store import BlobRecord, blob_extension, get_blob_store
+from services.cpu_pool import run_cpu_bound
+from services.image_assets import ASSET_MEDIA_TYPES
+from services.page_renders import (
+    DEFAULT_DPI,
+    MAX_DPI,
+    MIN_DPI,
+    RENDER_FORMATS,
+    PageNotFound,
+    get_page_render_cache,
+    render_page,
+)
+
 router = APIRouter()
+logger = get_logger(__name__)
 
 # Configure upload directory
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+_blob_store = get_blob_store()
+UPLOAD_DIR = _blob_store.root
+_render_cache = get_page_render_cache()
+
+
+# invoice_uid → blob never changes, so those URLs can be cached for good;
+# a filename can be re-uploaded with new content, so revalidate every time.
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+_RANGE_CHUNK_SIZE = 64 * 1024
+_BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_ASSET_NAME = re.compile(r"^(?P<sha256>[0-9a-f]{64})(?P<ext>\.[a-z]+)$")
+
+# Serve the file with CORS headers (exposing the ones pdf.js reads for ranges)
+_CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET",
+    "Access-Control-Allow-Headers": "*",
+    "Access-Control-Expose-Headers": "Accept-Ranges, Content-Range, Content-Length, ETag",
+}
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as RFC 9110 specifies for If-None-Match."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def _if_range_matches(if_range: Optional[str], etag: str) -> bool:
+    """Strong comparison, as RFC 9110 requires for If-Range: weak tags never match."""
+    if not if_range:
+        return True
+    tag = if_range.strip()
+    return not tag.startswith("W/") and not etag.startswith("W/") and tag == etag
+
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single "bytes=" range into inclusive (start, end).
+    
+    Returns None for anything we choose not to honour (multiple ranges,
+    other units), which means "send the whole file". Raises 416 when the
+    range cannot be satisfied.
+    """
+    match = _BYTE_RANGE.match(range_header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _iter_file_range(path: Path, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(_RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _file_response(
+    request: Request,
+    path: Path,
+    *,
+    etag: str,
+    cache_control: str,
+    media_type: str,
+    filename: Optional[str] = None,
+) -> Response:
+    """FileResponse with ETag/Cache-Control, 304 on If-None-Match and 206 for byte ranges."""
+    headers = {
+        **_CORS_HEADERS,
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    size = path.stat().st_size
+    range_header = request.headers.get("range")
+    # If-Range with a stale (or weak) validator means "send the whole file"
+    if range_header and _if_range_matches(request.headers.get("if-range"), etag):
+        byte_range = _parse_range(range_header, size)
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _iter_file_range(path, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers=headers,
+            )
+    
+    return FileResponse(path=path, media_type=media_type, filename=filename, headers=headers)
+
+
+def _serve_record(request: Request, record: BlobRecord, cache_control: str) -> Response:
+    if not record.path.is_file():
+        logger.error("Indexed blob missing on disk: %s", record.path)
+        raise HTTPException(status_code=404, detail="File not found")
+    return _file_response(
+        request,
+        record.path,
+        etag=f'"{record.sha256}"',
+        cache_control=cache_control,
+        media_type=record.mime_type or "application/octet-stream",
+        filename=Path(record.filename or record.path.name).name,
+    )
+
+
+@router.get("/files/invoices/{invoice_uid}")
+async def get_invoice_pdf(invoice_uid: str, request: Request):
+    """
+    Serve the PDF behind a processed invoice.
+    
+    DATA FLOW:
+    ----------
+    1. Frontend requests GET /files/invoices/<invoice_uid> (the "pdf_url"
+       returned with each invoice)
+    2. Backend resolves invoice_uid → blob with one index lookup
+    3. Returns file with proper Content-Type
+    
+    Unlike /files/{filename}, two uploads that share a filename each keep
+    pointing at their own document, so the response is cacheable forever.
+    """
+    record = await asyncio.to_thread(_blob_store.lookup, invoice_uid)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Unknown invoice: {invoice_uid}")
+    return _serve_record(request, record, IMMUTABLE_CACHE_CONTROL)
+
+
+@router.get("/files/invoices/{invoice_uid}/pages/{page}")
+async def get_invoice_page_image(
+    invoice_uid: str,
+    page: int,
+    request: Request,
+    dpi: int = DEFAULT_DPI,
+    format: str = "png",
+):
+    """
+    Serve one page of an invoice's PDF as an image for the review UI.
+    
+    DATA FLOW:
+    ----------
+    1. Frontend requests GET /files/invoices/<invoice_uid>/pages/1?dpi=110&format=webp
+    2. Backend resolves invoice_uid → blob and checks the render cache
+       (keyed on blob hash, page, DPI and format)
+    3. On a miss the page is rendered with PyMuPDF on the CPU executor and
+       written to the cache, evicting least recently served renders
+    4. The image is served with an immutable Cache-Control and ETag, so the
+       browser only asks again after its own cache drops it
+    
+    PARAMETERS:
+    -----------
+    page: 1-based page number
+    dpi: Render resolution, clamped to 36-300
+    format: "png" or "webp"
+    
+    ERRORS:
+    -------
+    400: Unsupported format or the invoice is not a PDF
+    404: Unknown invoice or page
+    """
+    fmt = format.lower()
+    if fmt not in RENDER_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    dpi = min(max(dpi, MIN_DPI), MAX_DPI)
+    
+    record = await asyncio.to_thread(_blob_store.lookup, invoice_uid)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Unknown invoice: {invoice_uid}")
+    if record.path.suffix != ".pdf":
+        raise HTTPException(status_code=400, detail="Only PDF invoices can be rendered")
+    if not record.path.is_file():
+        logger.error("Indexed blob missing on disk: %s", record.path)
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    key = _render_cache.key(record.sha256, page - 1, dpi, fmt)
+    path = await asyncio.to_thread(_render_cache.get, key)
+    if path is None:
+        try:
+            image_bytes, timings = await run_cpu_bound(render_page, str(record.path), page - 1, dpi, fmt)
+        except PageNotFound as exc:
+            raise HTTPException(status_code=404, detail=str(exc))
+        path = await asyncio.to_thread(_render_cache.put, key, image_bytes)
+        logger.debug("Rendered %s in %.2fms (%s bytes)", key, timings['compute_time'], len(image_bytes))
+    
+    return _file_response(
+        request,
+        path,
+        etag=f'"{key}"',
+        cache_control=IMMUTABLE_CACHE_CONTROL,
+        media_type=RENDER_FORMATS[fmt],
+    )
+
+
+@router.get("/files/assets/{asset}")
+async def get_image_asset(asset: str, request: Request):
+    """
+    Serve an image that an OCR response referenced instead of inlining it.
+    
+    The name is "<sha256><ext>" straight from the blob store, so the content
+    behind a URL never changes and is cached for good.
+    """
+    match = _ASSET_NAME.match(asset)
+    if match is None or match.group("ext") not in ASSET_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid asset name")
+    
+    path = _blob_store.blob_path(match.group("sha256"), match.group("ext"))
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail=f"Asset not found: {asset}")
+    return _file_response(
+        request,
+        path,
+        etag=f'"{match.group("sha256")}"',
+        cache_control=IMMUTABLE_CACHE_CONTROL,
+        media_type=ASSET_MEDIA_TYPES[match.group("ext")],
+    )
+
 
 @router.get("/files/{filename}")
-async def get_pdf_file(filename: str):
+async def get_pdf_file(filename: str, request: Request):
     """
     Serve PDF files for the PDF viewer.
     
     DATA FLOW:
     ----------
     1. Frontend requests PDF: GET /files/invoice_123.pdf
-    2. Backend checks if file exists in uploads/
+    2. Backend looks the name up in the upload index (falls back to a
+       legacy uploads/<filename> file saved before the blob store)
     3. Returns file with proper Content-Type
     4. Frontend PDF viewer displays it
     
@@ -48,12 +322,14 @@ async def get_pdf_file(filename: str):
     
     RETURNS:
     --------
-    FileResponse with PDF content
+    FileResponse with PDF content (206 for a Range request, 304 when the
+    client's If-None-Match still matches)
     
     ERRORS:
     -------
     404: File not found
     400: Invalid file type
+    416: Requested range not satisfiable
     """
     
     # Security: Prevent directory traversal
@@ -64,32 +340,28 @@ async def get_pdf_file(filename: str):
     if not filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
-    # Construct file path
+    # Indexed lookup: most recent upload with this name
+    record = await asyncio.to_thread(_blob_store.lookup_filename, filename)
+    if record is not None:
+        logger.debug("Serving file: %s", record.path)
+        return _serve_record(request, record, REVALIDATE_CACHE_CONTROL)
+    
+    # Files saved by name before the blob store existed
     file_path = UPLOAD_DIR / filename
+    if not file_path.is_file():
+        logger.error("File not found: %s", filename)
+        raise HTTPException(status_code=404, detail=f"File not found: {filename}")
     
-    # Check if file exists
-    if not file_path.exists() or not file_path.is_file():
-        # Debug: List available files
-        available_files = list(UPLOAD_DIR.glob("*.pdf"))
-        print(f"ERROR: File not found: {filename}")
-        print(f"DEBUG: Available files: {[f.name for f in available_files]}")
-        raise HTTPException(
-            status_code=404, 
-            detail=f"File not found: {filename}. Available files: {[f.name for f in available_files]}"
-        )
-    
-    print(f"DEBUG: Serving file: {file_path}")
-    
-    # Serve the file with CORS headers
-    return FileResponse(
-        path=file_path,
+    logger.debug("Serving legacy file: %s", file_path)
+    # Not content-addressed: weak validator from size and mtime
+    stat = file_path.stat()
+    return _file_response(
+        request,
+        file_path,
+        etag=f'W/"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+        cache_control=REVALIDATE_CACHE_CONTROL,
         media_type="application/pdf",
         filename=filename,
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET",
-            "Access-Control-Allow-Headers": "*",
-        }
     )
 
 
@@ -103,10 +375,18 @@ async def save_uploaded_file(file_bytes: bytes, filename: str):
     
     INTERNAL USE ONLY - Not exposed to frontend directly.
     """
-    file_path = UPLOAD_DIR / filename
-    
-    with open(file_path, "wb") as f:
-        f.write(file_bytes)
+    ext = blob_extension(filename)
+    sha256, file_path = await asyncio.to_thread(_blob_store.put_bytes, file_bytes, ext)
+    invoice_uid = str(uuid.uuid4())
+    await asyncio.to_thread(
+        _blob_store.register,
+        invoice_uid,
+        sha256=sha256,
+        ext=ext,
+        filename=filename,
+        mime_type=None,
+        size=len(file_bytes),
+    )
     
-    return {"filename": filename, "path": str(file_path)}
+    return {"filename": filename, "invoice_uid": invoice_uid, "path": str(file_path)}
 
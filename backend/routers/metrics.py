@@ -0,0 +1,41 @@
+# routers/metrics.py
+"""
+Metrics Router - Prometheus-style scrape endpoint
+
+DATA FLOW:
+==========
+INPUT: Scrape request (Prometheus, curl, Grafana agent)
+PROCESS: Render the in-process registry (services/metrics.py)
+OUTPUT: Text exposition format 0.0.4
+
+SERIES:
+=======
+- invoice_stage_duration_seconds{stage, provider, model} - histogram per
+  pipeline stage (file_save, text_queue_wait, text_extraction, api_call,
+  json_parse, ocr, validation, total, aggregation)
+- invoices_processed_total{provider, status} - review status or "error"
+- invoice_extraction_path_total{path} - provider, cache, layout, template, coalesced
+- invoices_in_flight - invoices currently being processed
+- invoice_batches_total / invoice_batch_duration_seconds{endpoint}
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from services.metrics import REGISTRY
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Current value of every registered metric.
+    
+    Values accumulate for the life of the process, so rates and quantiles
+    are computed by the scraper, not per request.
+    """
+    return PlainTextResponse(
+        REGISTRY.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
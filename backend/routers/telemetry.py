@@ -29,7 +29,10 @@ from pydantic import BaseModel
 from typing import Optional
 import time 
 
+from services.app_logging import get_logger
+
 router = APIRouter()
+logger = get_logger(__name__)
 
 class EngagementEvent(BaseModel):
     """
@@ -76,7 +79,7 @@ async def track_engagement(event: EngagementEvent):
     
     #In production, you'd stroe this in a database
     #For now, we'll just log it 
-    print(f"Engagement event: {event}")
+    logger.info("Engagement event: %s", event)
     
     return {"status": "recorded"}
 
@@ -0,0 +1,187 @@
+"""Leveled, non-blocking logging for the backend, replacing bare ``print`` calls.
+
+Every module gets its logger from :func:`get_logger`; all of them hang off
+one ``invoicextractor`` parent configured from ``LOG_LEVEL`` (default
+``INFO``; ``DEBUG`` restores the old per-invoice trace, ``OFF`` silences
+everything). Messages use ``%``-style arguments so nothing is formatted for
+levels that are switched off.
+
+Console I/O never happens on the calling thread: records go through a
+``QueueHandler`` and a ``QueueListener`` thread writes them to stdout, so a
+slow terminal or pipe cannot stall the event loop. Two extras on top of the
+standard logger:
+
+- :meth:`AppLogger.sampled` logs only every ``LOG_SAMPLE_EVERY``-th call of
+  a high-volume message (per line item, per table row).
+- :func:`request_debug` turns on DEBUG output, unsampled, for the current
+  request only. With ``LOG_REQUEST_DEBUG=true`` (off by default: it lets
+  any caller flood the log with line items and amounts),
+  :class:`RequestDebugMiddleware` enables it for requests carrying
+  ``X-Debug-Log: 1`` or ``?debug_log=1``.
+
+:func:`shutdown_logging` drains the queue and puts a direct stdout handler
+back, so records logged after shutdown (atexit hooks, late tasks) still
+appear.
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextlib
+import contextvars
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+
+APP_LOGGER = "invoicextractor"
+DEBUG_HEADER = "x-debug-log"
+DEBUG_QUERY_PARAM = "debug_log"
+
+_configured = False
+_configure_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_sample_every = 20
+_sample_counters: Dict[str, Iterator[int]] = {}
+
+_request_debug: contextvars.ContextVar[bool] = contextvars.ContextVar("request_debug", default=False)
+
+_TRUTHY = {"1", "true", "yes", "on"}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def configure_logging(level: str | None = None) -> None:
+    """(Re)configure the app logger; ``level`` defaults to ``LOG_LEVEL``."""
+
+    global _configured, _listener, _sample_every
+    with _configure_lock:
+        name = (level or os.getenv("LOG_LEVEL", "INFO")).strip().upper()
+        _sample_every = max(1, _env_int("LOG_SAMPLE_EVERY", 20))
+        root = logging.getLogger(APP_LOGGER)
+        root.propagate = False
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if name in {"OFF", "NONE", "0", "FALSE"}:
+            # Above CRITICAL: children inherit it, so nothing is even formatted
+            # (per-request debug still gets through, see AppLogger)
+            root.setLevel(logging.CRITICAL + 1)
+        else:
+            root.setLevel(getattr(logging, name, logging.INFO))
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(records))
+        _listener = logging.handlers.QueueListener(records, _stream_handler())
+        _listener.start()
+        _configured = True
+
+
+def _stream_handler() -> logging.Handler:
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    return stream
+
+
+def shutdown_logging() -> None:
+    """Flush queued records, stop the writer thread and log directly from then on."""
+
+    global _listener
+    with _configure_lock:
+        if _listener is None:
+            return
+        root = logging.getLogger(APP_LOGGER)
+        for handler in list(root.handlers):
+            if isinstance(handler, logging.handlers.QueueHandler):
+                root.removeHandler(handler)
+        _listener.stop()
+        _listener = None
+        root.addHandler(_stream_handler())
+
+
+atexit.register(shutdown_logging)
+
+
+@contextlib.contextmanager
+def request_debug(enabled: bool = True) -> Iterator[None]:
+    """Force DEBUG logging (unsampled) for code running in this context."""
+
+    token = _request_debug.set(enabled)
+    try:
+        yield
+    finally:
+        _request_debug.reset(token)
+
+
+class AppLogger(logging.LoggerAdapter):
+    """Logger honouring the per-request debug switch, plus sampled logging."""
+
+    def __init__(self, logger: logging.Logger) -> None:
+        super().__init__(logger, {})
+
+    def isEnabledFor(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level) or _request_debug.get()
+
+    def log(self, level: int, msg: Any, *args: Any, **kwargs: Any) -> None:
+        if self.isEnabledFor(level):
+            # Skip Logger.log(), which would re-check the logger's own level
+            self.logger._log(level, msg, args, **kwargs)
+
+    def sampled(self, level: int, msg: str, *args: Any, **kwargs: Any) -> None:
+        """Log the 1st, then every ``LOG_SAMPLE_EVERY``-th call with this ``msg``."""
+
+        if not self.isEnabledFor(level):
+            return
+        if not _request_debug.get() and _sample_every > 1:
+            counter = _sample_counters.get(msg)
+            if counter is None:
+                counter = _sample_counters.setdefault(msg, itertools.count())
+            if next(counter) % _sample_every:
+                return
+        self.log(level, msg, *args, **kwargs)
+
+
+def get_logger(name: str) -> AppLogger:
+    if not _configured:
+        configure_logging()
+    return AppLogger(logging.getLogger(f"{APP_LOGGER}.{name}"))
+
+
+class RequestDebugMiddleware:
+    """ASGI middleware enabling :func:`request_debug` for flagged requests."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+        self.enabled = os.getenv("LOG_REQUEST_DEBUG", "false").strip().lower() in _TRUTHY
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if not self.enabled or scope["type"] != "http" or not _wants_debug(scope):
+            await self.app(scope, receive, send)
+            return
+        with request_debug():
+            await self.app(scope, receive, send)
+
+
+def _wants_debug(scope: Dict[str, Any]) -> bool:
+    for key, value in scope.get("headers") or ():
+        if key == DEBUG_HEADER.encode() and value.decode("latin-1").strip().lower() in _TRUTHY:
+            return True
+    query = scope.get("query_string") or b""
+    if DEBUG_QUERY_PARAM.encode() not in query:
+        return False
+    for pair in query.decode("latin-1").split("&"):
+        key, _, value = pair.partition("=")
+        if key == DEBUG_QUERY_PARAM and value.lower() in _TRUTHY:
+            return True
+    return False
@@ -0,0 +1,171 @@
+"""Content-addressed storage for uploaded invoice files.
+
+Files are stored once per distinct content at
+``<root>/<sha[0:2]>/<sha[2:4]>/<sha256><ext>``. The two-level shard keeps any
+single directory to a few thousand entries even with millions of files, and
+the client's filename is never used as a path, so two different
+``invoice.pdf`` uploads can no longer overwrite each other.
+
+A small SQLite index maps each processed invoice (``invoice_uid``) to its
+blob, so the PDF viewer resolves a document with one primary-key lookup
+instead of scanning the upload directory.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_index (
+    invoice_uid TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    filename TEXT,
+    mime_type TEXT,
+    size_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS upload_index_filename ON upload_index (filename, created_at);
+"""
+
+
+@dataclass(frozen=True)
+class BlobRecord:
+    invoice_uid: str
+    sha256: str
+    path: Path
+    filename: Optional[str]
+    mime_type: Optional[str]
+    size: int
+
+
+def blob_extension(filename: Optional[str]) -> str:
+    """Lower-cased extension from a client filename, restricted to a safe charset."""
+
+    suffix = Path(filename or "").suffix.lower()
+    if not suffix or len(suffix) > 8 or not suffix[1:].isalnum():
+        return ".bin"
+    return suffix
+
+
+class BlobStore:
+    """Sharded content-addressed file store with an invoice_uid index."""
+
+    def __init__(self, root: Path) -> None:
+        self._root = Path(root)
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._incoming = self._root / ".incoming"
+        self._incoming.mkdir(exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self._root / "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    def blob_path(self, sha256: str, ext: str) -> Path:
+        return self._root / sha256[:2] / sha256[2:4] / f"{sha256}{ext}"
+
+    def incoming_path(self) -> Path:
+        """Fresh temporary path on the same filesystem, for writers that hash as they go."""
+        return self._incoming / f"{uuid.uuid4().hex}.part"
+
+    def adopt(self, temp_path: Path, sha256: str, ext: str) -> Path:
+        """Move a fully written temporary file into place; drop it if the blob exists."""
+
+        target = self.blob_path(sha256, ext)
+        if target.exists():
+            temp_path.unlink(missing_ok=True)
+            return target
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temp_path, target)
+        return target
+
+    def put_bytes(self, contents: bytes, ext: str) -> tuple[str, Path]:
+        sha256 = hashlib.sha256(contents).hexdigest()
+        target = self.blob_path(sha256, ext)
+        if target.exists():
+            return sha256, target
+        temp_path = self.incoming_path()
+        try:
+            temp_path.write_bytes(contents)
+            return sha256, self.adopt(temp_path, sha256, ext)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    def register(
+        self,
+        invoice_uid: str,
+        *,
+        sha256: str,
+        ext: str,
+        filename: Optional[str],
+        mime_type: Optional[str],
+        size: int,
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO upload_index "
+                "(invoice_uid, sha256, ext, filename, mime_type, size_bytes, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (invoice_uid, sha256, ext, filename, mime_type, size, time.time()),
+            )
+            self._conn.commit()
+
+    def lookup(self, invoice_uid: str) -> Optional[BlobRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT invoice_uid, sha256, ext, filename, mime_type, size_bytes "
+                "FROM upload_index WHERE invoice_uid = ?",
+                (invoice_uid,),
+            ).fetchone()
+        return self._record(row)
+
+    def lookup_filename(self, filename: str) -> Optional[BlobRecord]:
+        """Most recent upload with this client filename (legacy viewer links)."""
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT invoice_uid, sha256, ext, filename, mime_type, size_bytes "
+                "FROM upload_index WHERE filename = ? ORDER BY created_at DESC LIMIT 1",
+                (filename,),
+            ).fetchone()
+        return self._record(row)
+
+    def _record(self, row) -> Optional[BlobRecord]:
+        if row is None:
+            return None
+        invoice_uid, sha256, ext, filename, mime_type, size = row
+        return BlobRecord(
+            invoice_uid=invoice_uid,
+            sha256=sha256,
+            path=self.blob_path(sha256, ext),
+            filename=filename,
+            mime_type=mime_type,
+            size=size,
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+@lru_cache(maxsize=1)
+def get_blob_store() -> BlobStore:
+    """Process-wide store rooted at ``UPLOAD_DIR`` (default ``uploads``)."""
+
+    return BlobStore(Path(os.getenv("UPLOAD_DIR", "uploads")))
@@ -0,0 +1,161 @@
+"""Process-wide adaptive concurrency limiting for OCR provider calls.
+
+A per-request ``asyncio.Semaphore`` lets two simultaneous batches each use
+the full ``OCR_MAX_CONCURRENCY`` against the provider, while a lone batch can
+never use spare capacity. :class:`AdaptiveConcurrencyLimiter` is shared by
+every request in the process and sizes its window AIMD-style:
+
+* each successful call grows the window by roughly one slot per window's
+  worth of successes (additive increase);
+* a 429/5xx response or a timeout halves it (multiplicative decrease);
+* a latency spike well above the running average shrinks it gently.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from .tracing import span
+
+
+class LimiterSlot:
+    """Handle for one admitted call; used to report how the call went."""
+
+    __slots__ = ("overloaded", "succeeded")
+
+    def __init__(self) -> None:
+        self.overloaded = False
+        self.succeeded = False
+
+    def record_status(self, status_code: int) -> None:
+        if status_code == 429 or status_code >= 500:
+            self.overloaded = True
+        elif status_code < 400:
+            self.succeeded = True
+
+    def record_overload(self) -> None:
+        self.overloaded = True
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency window shared by all provider calls in the process."""
+
+    def __init__(
+        self,
+        *,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: int,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+    ) -> None:
+        self._min = max(1, min_limit)
+        self._max = max(self._min, max_limit)
+        self._window = float(min(max(initial, self._min), self._max))
+        self._decrease_factor = decrease_factor
+        self._latency_tolerance = latency_tolerance
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._ewma_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._counters: Dict[str, int] = {
+            "admitted": 0,
+            "succeeded": 0,
+            "overloaded": 0,
+            "increases": 0,
+            "decreases": 0,
+        }
+
+    @property
+    def limit(self) -> int:
+        return max(self._min, int(self._window))
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[LimiterSlot]:
+        """Wait for a free slot, then hold it for the duration of one call."""
+
+        with span("provider.limiter_slot") as traced:
+            wait_start = time.perf_counter()
+            await self._acquire()
+            slot = LimiterSlot()
+            start = time.perf_counter()
+            traced.set_wait((start - wait_start) * 1000)
+            try:
+                yield slot
+            finally:
+                self._release(slot, (time.perf_counter() - start) * 1000)
+
+    async def _acquire(self) -> None:
+        if self._in_flight < self.limit and not self._waiters:
+            self._in_flight += 1
+            self._counters["admitted"] += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                # Slot was handed over just as we were cancelled; give it back
+                self._in_flight -= 1
+                self._wake_waiters()
+            raise
+        self._counters["admitted"] += 1
+
+    def _release(self, slot: LimiterSlot, latency_ms: float) -> None:
+        self._in_flight -= 1
+        if slot.overloaded:
+            self._counters["overloaded"] += 1
+            self._decrease(self._decrease_factor)
+        elif slot.succeeded:
+            self._counters["succeeded"] += 1
+            self._observe_success(latency_ms)
+        self._wake_waiters()
+
+    def _observe_success(self, latency_ms: float) -> None:
+        baseline = self._ewma_latency
+        self._ewma_latency = latency_ms if baseline is None else 0.8 * baseline + 0.2 * latency_ms
+        if baseline is not None and latency_ms > baseline * self._latency_tolerance:
+            self._decrease(0.9)
+            return
+        if self._window < self._max:
+            self._window = min(float(self._max), self._window + 1.0 / self._window)
+            self._counters["increases"] += 1
+
+    def _decrease(self, factor: float) -> None:
+        # One congestion event often fails several in-flight calls at once;
+        # only back off once per typical round-trip.
+        now = time.monotonic()
+        cooldown = (self._ewma_latency or 1000.0) / 1000
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self._window = max(float(self._min), self._window * factor)
+        self._counters["decreases"] += 1
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._in_flight += 1
+            waiter.set_result(None)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "window": round(self._window, 2),
+            "limit": self.limit,
+            "min_limit": self._min,
+            "max_limit": self._max,
+            "in_flight": self._in_flight,
+            "queue_depth": len(self._waiters),
+            "ewma_latency_ms": round(self._ewma_latency, 2) if self._ewma_latency is not None else None,
+            **self._counters,
+        }
@@ -0,0 +1,96 @@
+"""Executor for CPU-bound document work (PyMuPDF text extraction, OCR).
+
+``asyncio.to_thread`` keeps PyMuPDF and pytesseract off the event loop but
+not off the GIL, so heavy scanned batches serialise and starve request
+handling. When ``OCR_TEXT_WORKERS`` is positive, :func:`run_cpu_bound` runs
+work in a process pool instead. Workers are recycled after
+``OCR_TEXT_WORKER_MAX_TASKS`` documents to cap memory growth from
+long-lived PyMuPDF/Tesseract state.
+
+Every call reports how long it waited for a worker versus how long the work
+itself took, so queueing shows up separately from extraction cost.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+from .tracing import span
+
+
+T = TypeVar("T")
+
+_executor: Optional[ProcessPoolExecutor] = None
+_workers = 0
+_max_tasks_per_child: Optional[int] = None
+
+
+def configure_cpu_pool(workers: int, max_tasks_per_child: int) -> None:
+    """Select the backend: ``workers <= 0`` keeps the default thread pool."""
+
+    global _workers, _max_tasks_per_child
+    shutdown_cpu_pool()
+    _workers = max(0, workers)
+    _max_tasks_per_child = max_tasks_per_child if max_tasks_per_child > 0 else None
+
+
+def _get_executor() -> Optional[ProcessPoolExecutor]:
+    global _executor
+    if _workers <= 0:
+        return None
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=_workers,
+            max_tasks_per_child=_max_tasks_per_child,
+        )
+    return _executor
+
+
+def shutdown_cpu_pool() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _timed_call(func: Callable[..., T], args: Tuple[Any, ...]) -> Tuple[T, float, float]:
+    # Runs inside the worker; wall-clock start is comparable across processes
+    started_at = time.time()
+    compute_start = time.perf_counter()
+    result = func(*args)
+    return result, started_at, (time.perf_counter() - compute_start) * 1000
+
+
+async def run_cpu_bound(func: Callable[..., T], *args: Any) -> Tuple[T, Dict[str, float]]:
+    """Run ``func(*args)`` on the CPU executor.
+
+    ``func`` and its arguments must be picklable (module-level functions)
+    when the process pool is enabled. Returns the result together with
+    ``queue_wait_time`` and ``compute_time`` in milliseconds.
+    """
+
+    loop = asyncio.get_running_loop()
+    with span(f"cpu:{getattr(func, '__name__', 'task')}", backend="process" if _workers > 0 else "thread") as traced:
+        submitted_at = time.time()
+        result, started_at, compute_ms = await loop.run_in_executor(
+            _get_executor(),
+            functools.partial(_timed_call, func, args),
+        )
+        timings = {
+            "queue_wait_time": max(0.0, (started_at - submitted_at) * 1000),
+            "compute_time": compute_ms,
+        }
+        traced.set_wait(timings["queue_wait_time"])
+    return result, timings
+
+
+def cpu_pool_stats() -> Dict[str, Any]:
+    return {
+        "backend": "process" if _workers > 0 else "thread",
+        "workers": _workers,
+        "max_tasks_per_child": _max_tasks_per_child,
+    }
@@ -30,17 +30,31 @@ DEEPSEEK SETUP:
 
 import os
 import asyncio
+import hashlib
 import time
-import re
-from typing import Dict
+from typing import Dict, Optional
 from dotenv import load_dotenv
 import requests
+import httpx
 import json
 
-from .document_text import extract_text_from_document
+from .concurrency import AdaptiveConcurrencyLimiter
+from .document_text import (
+    TextExtractionResult,
+    extract_text_from_document,
+    extract_text_from_document_async,
+    format_pages,
+)
+from .invoice_schema import SCHEMA_VERSION, schema_text
+from .json_recovery import JSONRecoveryError, parse_model_json
+from .prompt_compaction import DEFAULT_TOKEN_BUDGET, compact_pages, enforce_token_budget
+from .tracing import span
+from .app_logging import get_logger
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 
 if not DEEPSEEK_API_KEY:
@@ -48,6 +62,56 @@ if not DEEPSEEK_API_KEY:
 
 # DeepSeek API endpoint
 DEEPSEEK_API_URL = "https://api.deepseek.com/chat/completions"
+DEEPSEEK_MODEL = "deepseek-chat"
+
+
+DEEPSEEK_SYSTEM_PROMPT = """You are an expert at analyzing and structuring invoice data for accounting purposes.
+You will be given raw text extracted from an invoice document.
+Your task is to extract ALL invoice data and return it as a valid JSON object.
+
+CRITICAL RULES:
+1. Extract EVERY field you can find - shipping, discounts, customer info, order IDs, etc.
+2. Use null for missing fields - NEVER make up data
+3. Use exact numbers from the invoice - do not round or modify
+4. Return ONLY valid JSON - no markdown, no explanations, just JSON
+5. For line items, extract item name, description, product code if available
+6. For financial fields, use numbers (not strings with $ symbols)
+
+TRUST IS PARAMOUNT - missing data is better than incorrect data."""
+
+
+# Compact one-line example generated from the shared schema (services/invoice_schema.py)
+DEEPSEEK_JSON_SCHEMA = schema_text()
+
+
+DEEPSEEK_USER_PROMPT_TEMPLATE = """Here is the raw text extracted from an invoice document:
+
+---
+{document}
+---
+
+Analyze this invoice and extract ALL data into a json object with this structure:
+{json_schema}
+
+CRITICAL INSTRUCTIONS FOR LINE ITEMS:
+- quantity = HOW MANY items (e.g., if invoice says "2 chairs", quantity = 2)
+- rate = UNIT PRICE (price for ONE item, e.g., $50.00 per chair)
+- amount = TOTAL PRICE for that line (quantity × rate, e.g., 2 × $50 = $100)
+- EXAMPLE: "3 Office Desks @ $200 each = $600"
+  → quantity: 3, rate: 200, amount: 600
+
+OTHER IMPORTANT FIELDS:
+- Extract shipping amount if present (critical for accounting)
+- Extract discount percentage AND amount if present
+- Extract all line items with quantity, rate, and amount
+- Use null for any field you cannot find
+- Preserve exact numbers from the invoice - do not calculate or modify"""
+
+
+# Fingerprint of the prompt text; part of the extraction cache key.
+PROMPT_VERSION = hashlib.sha256(
+    (DEEPSEEK_SYSTEM_PROMPT + SCHEMA_VERSION + DEEPSEEK_USER_PROMPT_TEMPLATE).encode("utf-8")
+).hexdigest()[:12]
 
 
 def run_deepseek_ocr_direct(file_bytes: bytes, mime_type: str = "application/pdf") -> dict:
@@ -58,7 +122,13 @@ def run_deepseek_ocr_direct(file_bytes: bytes, mime_type: str = "application/pdf
     raise NotImplementedError("DeepSeek chat API doesn't support image input. Use run_deepseek_ocr() with PDF conversion.")
 
 
-def run_deepseek_ocr(file_bytes: bytes, mime_type: str = "application/pdf") -> dict:
+def run_deepseek_ocr(
+    file_bytes: bytes,
+    mime_type: str = "application/pdf",
+    *,
+    compact_prompt: bool = True,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+) -> dict:
     """
     Process document with DeepSeek by converting PDFs to images first.
     
@@ -82,6 +152,8 @@ def run_deepseek_ocr(file_bytes: bytes, mime_type: str = "application/pdf") -> d
     -----------
     file_bytes: Raw bytes of PDF or image file
     mime_type: MIME type (e.g., "application/pdf", "image/png", "image/jpeg")
+    compact_prompt: Strip repeated headers/footers and boilerplate before sending
+    token_budget: Approximate cap on document tokens per request (0 = no cap)
     
     RETURNS:
     --------
@@ -102,138 +174,205 @@ def run_deepseek_ocr(file_bytes: bytes, mime_type: str = "application/pdf") -> d
     start = time.time()
     perf_metrics: Dict[str, float] = {}
     
-    print(f"DEBUG: DeepSeek OCR starting...")
-    print(f"DEBUG: File size: {len(file_bytes)} bytes, type: {mime_type}")
+    logger.debug("DeepSeek OCR starting: %s bytes, type: %s", len(file_bytes), mime_type)
+    
+    text_result = _extract_document_text(file_bytes, mime_type, perf_metrics)
+    page_count = text_result.page_count
+    if text_result.is_blank():
+        return _empty_document_result(page_count, start)
+    
+    # Step 2: Use DeepSeek to structure the extracted text
+    document = _prepare_document(text_result, perf_metrics, compact=compact_prompt, token_budget=token_budget)
+    payload = _build_request_payload(document)
     
     try:
-        text_result = extract_text_from_document(file_bytes, mime_type)
-    except Exception as exc:
-        print(f"ERROR: Text extraction failed: {exc}")
-        raise RuntimeError(f"Failed to extract text from document: {str(exc)}")
+        api_call_start = time.time()
+        response = requests.post(
+            DEEPSEEK_API_URL,
+            headers=_request_headers(),
+            json=payload,
+            timeout=120  # 2 minute timeout
+        )
+        
+        perf_metrics['api_call_time'] = (time.time() - api_call_start) * 1000
+        logger.debug("DeepSeek API response status: %s (%.2fms)", response.status_code, perf_metrics['api_call_time'])
+        
+        if response.status_code != 200:
+            raise RuntimeError(f"DeepSeek API error: {response.status_code} - {response.text}")
+        
+        invoice_json = _parse_completion(response.json(), perf_metrics)
+        return _build_ocr_result(invoice_json, page_count, start, perf_metrics)
+    
+    except requests.exceptions.Timeout:
+        raise RuntimeError("DeepSeek API request timed out after 120 seconds")
+    except requests.exceptions.RequestException as e:
+        raise RuntimeError(f"DeepSeek API request failed: {str(e)}")
+    except Exception as e:
+        raise RuntimeError(f"DeepSeek OCR failed: {str(e)}")
+
 
-    raw_text = text_result.text
+async def run_deepseek_ocr_async(
+    file_bytes: bytes,
+    mime_type: str,
+    *,
+    client: httpx.AsyncClient,
+    limiter: AdaptiveConcurrencyLimiter,
+    max_retries: int = 3,
+    compact_prompt: bool = True,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+) -> dict:
+    """
+    Async counterpart of run_deepseek_ocr() used by DeepseekInvoiceExtractor.
+    
+    Only local text extraction runs off the loop (thread or process pool,
+    see services/cpu_pool.py); the DeepSeek call
+    itself goes through the caller's pooled httpx client so a large batch
+    shares keep-alive connections instead of parking one thread per socket.
+    Timeouts come from the client; 429/5xx responses and transport errors
+    are retried up to max_retries times with capped exponential backoff.
+    Every attempt holds a slot in the shared provider limiter, which uses
+    the outcome to grow or shrink its window.
+    """
+    start = time.time()
+    perf_metrics: Dict[str, float] = {}
+    
+    logger.debug("DeepSeek OCR starting (async): %s bytes, type: %s", len(file_bytes), mime_type)
+    
+    text_result = await _extract_document_text_async(file_bytes, mime_type, perf_metrics)
     page_count = text_result.page_count
-    perf_metrics.update(text_result.perf_metrics)
-    print(
-        f"DEBUG: Extracted {len(raw_text)} characters from {page_count} page(s) "
-        f"({perf_metrics.get('text_extraction_time', 0):.2f}ms)"
-    )
+    if text_result.is_blank():
+        return _empty_document_result(page_count, start)
     
-    if not raw_text.strip():
-        print("WARNING: No text extracted from document")
-        empty_json = {
-            "error": "No text could be extracted from this document",
-            "line_items": []
-        }
-        return {
-            "result_json": empty_json,
-            "result_markdown": json.dumps(empty_json, indent=2),
-            "pages": page_count,
-            "duration": round(time.time() - start, 2),
-            "images": {}
-        }
+    document = _prepare_document(text_result, perf_metrics, compact=compact_prompt, token_budget=token_budget)
+    payload = _build_request_payload(document)
+    attempts = max(1, max_retries)
+    last_error: Optional[Exception] = None
     
-    # Step 2: Use DeepSeek to structure the extracted text
-    print(f"DEBUG: Sending extracted text to DeepSeek for structuring...")
+    api_call_start = time.time()
+    for attempt in range(1, attempts + 1):
+        try:
+            async with limiter.slot() as slot:
+                with span("deepseek.request", attempt=attempt) as request_span:
+                    try:
+                        response = await client.post(DEEPSEEK_API_URL, headers=_request_headers(), json=payload)
+                    except httpx.TimeoutException:
+                        slot.record_overload()
+                        raise
+                    slot.record_status(response.status_code)
+                    request_span.set(status=response.status_code)
+            if response.status_code == 200:
+                perf_metrics['api_call_time'] = (time.time() - api_call_start) * 1000
+                perf_metrics['api_attempts'] = attempt
+                logger.debug("DeepSeek API response status: 200 (%.2fms, attempt %s)", perf_metrics['api_call_time'], attempt)
+                with span("deepseek.parse"):
+                    invoice_json = _parse_completion(response.json(), perf_metrics)
+                return _build_ocr_result(invoice_json, page_count, start, perf_metrics)
+            
+            last_error = RuntimeError(f"DeepSeek API error: {response.status_code} - {response.text}")
+            if response.status_code != 429 and response.status_code < 500:
+                break
+        except httpx.TimeoutException:
+            last_error = RuntimeError("DeepSeek API request timed out")
+        except httpx.RequestError as e:
+            last_error = RuntimeError(f"DeepSeek API request failed: {str(e)}")
+        
+        if attempt < attempts:
+            with span("retry_backoff", attempt=attempt):
+                await asyncio.sleep(min(2 ** attempt, 5))
     
-    headers = {
+    assert last_error is not None
+    raise last_error
+
+
+def _request_headers() -> Dict[str, str]:
+    return {
         "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
         "Content-Type": "application/json"
     }
-    
-    # Craft a prompt to structure the raw text as JSON invoice data
-    # TRUST-FIRST: Request comprehensive JSON to avoid regex parsing errors
-    system_prompt = """You are an expert at analyzing and structuring invoice data for accounting purposes.
-You will be given raw text extracted from an invoice document.
-Your task is to extract ALL invoice data and return it as a valid JSON object.
 
-CRITICAL RULES:
-1. Extract EVERY field you can find - shipping, discounts, customer info, order IDs, etc.
-2. Use null for missing fields - NEVER make up data
-3. Use exact numbers from the invoice - do not round or modify
-4. Return ONLY valid JSON - no markdown, no explanations, just JSON
-5. For line items, extract item name, description, product code if available
-6. For financial fields, use numbers (not strings with $ symbols)
 
-TRUST IS PARAMOUNT - missing data is better than incorrect data."""
+def _extract_document_text(file_bytes: bytes, mime_type: str, perf_metrics: Dict[str, float]) -> TextExtractionResult:
+    """Run local text extraction and record its timing into perf_metrics."""
+    try:
+        text_result = extract_text_from_document(file_bytes, mime_type)
+    except Exception as exc:
+        logger.error("Text extraction failed: %s", exc)
+        raise RuntimeError(f"Failed to extract text from document: {str(exc)}")
+    return _record_text_result(text_result, perf_metrics)
 
-    json_schema = """{
-  "invoice_number": "string or null",
-  "date": "string (format as found in invoice) or null",
-  "vendor": {
-    "name": "string or null",
-    "address": "string or null"
-  },
-  "customer": {
-    "name": "string or null",
-    "billing_address": "string or null"
-  },
-  "shipping_info": {
-    "address": "string or null",
-    "city": "string or null",
-    "state": "string or null",
-    "country": "string or null",
-    "postal_code": "string or null",
-    "ship_mode": "string or null"
-  },
-  "order_id": "string or null",
-  "line_items": [
-    {
-      "item_name": "string (required - product or service name)",
-      "description": "string or null (category or additional details)",
-      "product_code": "string or null (SKU/product code if present)",
-      "quantity": number (required - HOW MANY units, e.g., 2, 5, 1)",
-      "rate": number (required - UNIT PRICE, price PER ITEM, NOT total)",
-      "amount": number (required - TOTAL for this line: quantity × rate)"
-    }
-  ],
-  "financial_summary": {
-    "subtotal": number or null,
-    "discount": {
-      "percent": number or null,
-      "amount": number or null
-    },
-    "shipping": number or null,
-    "tax": number or null,
-    "total": number (required if found),
-    "balance_due": number or null
-  },
-  "payment_terms": "string or null",
-  "notes": "string or null"
-}"""
-
-    user_prompt = f"""Here is the raw text extracted from an invoice document:
 
----
-{raw_text}
----
+async def _extract_document_text_async(file_bytes: bytes, mime_type: str, perf_metrics: Dict[str, float]) -> TextExtractionResult:
+    """Like _extract_document_text(), but on the shared CPU executor (see services/cpu_pool.py)."""
+    try:
+        text_result = await extract_text_from_document_async(file_bytes, mime_type)
+    except Exception as exc:
+        logger.error("Text extraction failed: %s", exc)
+        raise RuntimeError(f"Failed to extract text from document: {str(exc)}")
+    return _record_text_result(text_result, perf_metrics)
 
-Analyze this invoice and extract ALL data into the JSON structure below.
-Return ONLY valid JSON - no markdown code fences, no explanations, just the JSON object.
 
-Required JSON structure:
-{json_schema}
+def _record_text_result(text_result: TextExtractionResult, perf_metrics: Dict[str, float]) -> TextExtractionResult:
+    perf_metrics.update(text_result.perf_metrics)
+    logger.debug(
+        "Extracted %s characters from %s page(s) (%.2fms)",
+        text_result.char_count, text_result.page_count, perf_metrics.get('text_extraction_time', 0),
+    )
+    return text_result
+
+
+def _prepare_document(
+    text_result: TextExtractionResult,
+    perf_metrics: Dict[str, float],
+    *,
+    compact: bool,
+    token_budget: int,
+) -> str:
+    """Compact the extracted text for the prompt and record before/after sizes."""
+    if not compact:
+        return text_result.text
+    
+    compaction_start = time.time()
+    with span("prompt_compaction", pages=text_result.page_count):
+        pages, stats = compact_pages(text_result.pages)
+        document, _ = enforce_token_budget(format_pages(pages), token_budget, stats)
+    perf_metrics['prompt_compaction_time'] = (time.time() - compaction_start) * 1000
+    perf_metrics.update(stats.as_metrics())
+    logger.debug(
+        "Prompt compaction: %s -> %s chars (~%s tokens, truncated=%s)",
+        stats.chars_before, stats.chars_after, perf_metrics['document_tokens_after'], stats.truncated,
+    )
+    return document
 
-CRITICAL INSTRUCTIONS FOR LINE ITEMS:
-- quantity = HOW MANY items (e.g., if invoice says "2 chairs", quantity = 2)
-- rate = UNIT PRICE (price for ONE item, e.g., $50.00 per chair)
-- amount = TOTAL PRICE for that line (quantity × rate, e.g., 2 × $50 = $100)
-- EXAMPLE: "3 Office Desks @ $200 each = $600"
-  → quantity: 3, rate: 200, amount: 600
 
-OTHER IMPORTANT FIELDS:
-- Extract shipping amount if present (critical for accounting)
-- Extract discount percentage AND amount if present
-- Extract all line items with quantity, rate, and amount
-- Use null for any field you cannot find
-- Preserve exact numbers from the invoice - do not calculate or modify"""
+def _empty_document_result(page_count: int, start: float) -> dict:
+    logger.warning("No text extracted from document")
+    empty_json = {
+        "error": "No text could be extracted from this document",
+        "line_items": []
+    }
+    return {
+        "result_json": empty_json,
+        "result_markdown": json.dumps(empty_json, indent=2),
+        "pages": page_count,
+        "duration": round(time.time() - start, 2),
+        "images": {}
+    }
+
+
+def _build_request_payload(raw_text: str) -> dict:
+    # Craft a prompt to structure the raw text as JSON invoice data
+    # TRUST-FIRST: Request comprehensive JSON to avoid regex parsing errors
+    user_prompt = DEEPSEEK_USER_PROMPT_TEMPLATE.format(
+        document=raw_text,
+        json_schema=DEEPSEEK_JSON_SCHEMA,
+    )
     
-    payload = {
-        "model": "deepseek-chat",
+    return {
+        "model": DEEPSEEK_MODEL,
         "messages": [
             {
                 "role": "system",
-                "content": system_prompt
+                "content": DEEPSEEK_SYSTEM_PROMPT
             },
             {
                 "role": "user",
@@ -241,109 +380,103 @@ OTHER IMPORTANT FIELDS:
             }
         ],
         "temperature": 0.1,  # Low temperature for consistent extraction
-        "max_tokens": 4096
+        "max_tokens": 4096,
+        # JSON mode: the reply is a bare JSON object (the prompt must mention "json")
+        "response_format": {"type": "json_object"},
     }
+
+
+def _parse_completion(result: dict, perf_metrics: Dict[str, float]) -> dict:
+    """Pull the invoice JSON out of a chat completion response."""
+    json_parse_start = time.time()
+    if not ("choices" in result and len(result["choices"]) > 0):
+        logger.debug("No content in DeepSeek response")
+        return {
+            "error": "No content in DeepSeek response",
+            "line_items": []
+        }
+    
+    usage = result.get("usage") or {}
+    perf_metrics['input_tokens'] = int(usage.get("prompt_tokens") or 0)
+    perf_metrics['output_tokens'] = int(usage.get("completion_tokens") or 0)
+    response_text = result["choices"][0]["message"]["content"] or ""
+    logger.debug("DeepSeek returned %s characters", len(response_text))
     
     try:
-        api_call_start = time.time()
-        print("DEBUG: Sending request to DeepSeek API...")
-        response = requests.post(
-            DEEPSEEK_API_URL,
-            headers=headers,
-            json=payload,
-            timeout=120  # 2 minute timeout
-        )
-        
-        perf_metrics['api_call_time'] = (time.time() - api_call_start) * 1000
-        print(f"DEBUG: DeepSeek API response status: {response.status_code} ({perf_metrics['api_call_time']:.2f}ms)")
-        
-        if response.status_code != 200:
-            print(f"DEBUG: DeepSeek API error: {response.text}")
-            raise RuntimeError(f"DeepSeek API error: {response.status_code} - {response.text}")
-        
-        result = response.json()
-        
-        # Extract the JSON text from the response
-        json_parse_start = time.time()
-        response_text = ""
-        if "choices" in result and len(result["choices"]) > 0:
-            response_text = result["choices"][0]["message"]["content"]
-            print(f"DEBUG: Extracted {len(response_text)} characters of text")
-            
-            # Try to extract JSON (might be wrapped in markdown code fences)
-            json_text = response_text.strip()
-            
-            # Remove markdown code fences if present
-            if json_text.startswith("```"):
-                # Find the first newline after ```
-                first_newline = json_text.find("\n")
-                if first_newline != -1:
-                    json_text = json_text[first_newline:].strip()
-                # Remove trailing ```
-                json_text = re.sub(r'```\s*$', '', json_text).strip()
-            
-            # Try to parse as JSON
-            try:
-                invoice_json = json.loads(json_text)
-                perf_metrics['json_parse_time'] = (time.time() - json_parse_start) * 1000
-                print(f"DEBUG: Successfully parsed JSON with {len(invoice_json.get('line_items', []))} line items ({perf_metrics['json_parse_time']:.2f}ms)")
-                print(f"DEBUG: JSON keys: {list(invoice_json.keys())}")
-            except json.JSONDecodeError as e:
-                print(f"DEBUG: JSON parse error: {e}")
-                print(f"DEBUG: Response text (first 500 chars): {response_text[:500]}")
-                # Return error structure
-                invoice_json = {
-                    "error": "Failed to parse JSON response",
-                    "raw_response": response_text[:1000],  # First 1000 chars for debugging
-                    "line_items": []
-                }
-        else:
-            print("DEBUG: No content in DeepSeek response")
-            invoice_json = {
-                "error": "No content in DeepSeek response",
-                "line_items": []
-            }
-            response_text = json.dumps(invoice_json)
-        
-        # Calculate duration
-        duration = round(time.time() - start, 2)
-        
-        # Print performance summary
-        print(f"DEBUG: DeepSeek OCR complete in {duration}s")
-        print(f"DEBUG: Performance breakdown:")
-        print(f"  - Text Extraction: {perf_metrics.get('text_extraction_time', 0):.2f}ms")
-        print(f"  - API Call:        {perf_metrics.get('api_call_time', 0):.2f}ms")
-        print(f"  - JSON Parsing:    {perf_metrics.get('json_parse_time', 0):.2f}ms")
-        
-        performance = {
-            "provider": "deepseek",
-            "model": "deepseek-chat",
-            "provider_model": "deepseek-chat",
-            "provider_breakdown": {
-                "text_extraction_time": perf_metrics.get("text_extraction_time", 0),
-                "api_call_time": perf_metrics.get("api_call_time", 0),
-                "json_parse_time": perf_metrics.get("json_parse_time", 0),
-            },
-            **perf_metrics,
+        parsed = parse_model_json(response_text, provider="deepseek")
+    except JSONRecoveryError as e:
+        logger.debug("JSON parse error: %s; response starts with: %.500s", e, response_text)
+        return {
+            "error": "Failed to parse JSON response",
+            "raw_response": response_text[:1000],  # First 1000 chars for debugging
+            "line_items": []
         }
-
-        # Return both JSON and markdown (for backward compatibility)
-        # The markdown is now just a stringified version of the JSON for debugging
+    if not isinstance(parsed.value, dict):
         return {
-            "result_json": invoice_json,  # NEW: Structured JSON data
-            "result_markdown": json.dumps(invoice_json, indent=2) if isinstance(invoice_json, dict) else response_text,  # Keep for backward compat
-            "pages": page_count,
-            "duration": duration,
-            "images": {},  # Not extracting page images with DeepSeek
-            "performance": performance  # NEW: Performance breakdown
+            "error": "DeepSeek JSON response is not an object",
+            "raw_response": response_text[:1000],
+            "line_items": []
         }
     
-    except requests.exceptions.Timeout:
-        raise RuntimeError("DeepSeek API request timed out after 120 seconds")
-    except requests.exceptions.RequestException as e:
-        raise RuntimeError(f"DeepSeek API request failed: {str(e)}")
-    except Exception as e:
-        raise RuntimeError(f"DeepSeek OCR failed: {str(e)}")
+    invoice_json = parsed.value
+    perf_metrics['json_parse_time'] = (time.time() - json_parse_start) * 1000
+    if parsed.repaired:
+        logger.debug("Repaired DeepSeek JSON (%s)", ", ".join(parsed.repairs))
+    logger.debug("Parsed JSON with %s line items (%.2fms)", len(invoice_json.get('line_items', [])), perf_metrics['json_parse_time'])
+    return invoice_json
+
+
+_COMPACTION_METRICS = (
+    "prompt_compaction_time",
+    "document_chars_before",
+    "document_chars_after",
+    "document_tokens_before",
+    "document_tokens_after",
+    "header_footer_lines_removed",
+    "boilerplate_lines_removed",
+    "boilerplate_removed",
+    "prompt_truncated",
+)
+
+
+def _build_ocr_result(invoice_json: dict, page_count: int, start: float, perf_metrics: Dict[str, float]) -> dict:
+    # Calculate duration
+    duration = round(time.time() - start, 2)
+    
+    logger.debug(
+        "DeepSeek OCR complete in %ss (text extraction %.2fms, API call %.2fms, JSON parsing %.2fms)",
+        duration,
+        perf_metrics.get('text_extraction_time', 0),
+        perf_metrics.get('api_call_time', 0),
+        perf_metrics.get('json_parse_time', 0),
+    )
+    
+    performance = {
+        "provider": "deepseek",
+        "model": DEEPSEEK_MODEL,
+        "provider_model": DEEPSEEK_MODEL,
+        "provider_breakdown": {
+            "text_extraction_time": perf_metrics.get("text_extraction_time", 0),
+            "api_call_time": perf_metrics.get("api_call_time", 0),
+            "json_parse_time": perf_metrics.get("json_parse_time", 0),
+            "text_queue_wait_time": perf_metrics.get("text_queue_wait_time", 0),
+            "input_tokens": perf_metrics.get("input_tokens", 0),
+            "output_tokens": perf_metrics.get("output_tokens", 0),
+            **{key: perf_metrics[key] for key in _COMPACTION_METRICS if key in perf_metrics},
+        },
+        **perf_metrics,
+    }
+
+    # Return both JSON and markdown (for backward compatibility)
+    # The markdown is now just a stringified version of the JSON for debugging
+    return {
+        "result_json": invoice_json,  # NEW: Structured JSON data
+        "result_markdown": json.dumps(invoice_json, indent=2),  # Keep for backward compat
+        "pages": page_count,
+        "duration": duration,
+        "images": {},  # Not extracting page images with DeepSeek
+        "performance": performance  # NEW: Performance breakdown
+    }
 
 
 # Alternative function that handles PDFs by converting to images first
@@ -365,17 +498,16 @@ def run_deepseek_ocr_with_pdf_conversion(file_bytes: bytes, mime_type: str = "ap
         start = time.time()
         
         if mime_type == "application/pdf":
-            print("DEBUG: Converting PDF to images...")
             
             # Convert PDF pages to images
             images = convert_from_bytes(file_bytes, dpi=200)
-            print(f"DEBUG: PDF converted to {len(images)} page(s)")
+            logger.debug("PDF converted to %s page image(s)", len(images))
             
             all_markdown = []
             
             # Process each page
             for i, img in enumerate(images):
-                print(f"DEBUG: Processing page {i+1}/{len(images)}...")
+                logger.debug("Processing page %s/%s...", i + 1, len(images))
                 
                 # Convert PIL Image to bytes
                 img_byte_arr = io.BytesIO()
@@ -401,12 +533,13 @@ def run_deepseek_ocr_with_pdf_conversion(file_bytes: bytes, mime_type: str = "ap
             return run_deepseek_ocr(file_bytes, mime_type)
     
     except ImportError:
-        print("WARNING: pdf2image not installed. Falling back to direct PDF processing.")
-        print("Install with: pip install pdf2image")
-        print("Also install poppler: brew install poppler (macOS) or apt-get install poppler-utils (Linux)")
+        logger.warning(
+            "pdf2image not installed; falling back to direct PDF processing "
+            "(pip install pdf2image, plus poppler-utils)"
+        )
         return run_deepseek_ocr(file_bytes, mime_type)
     except Exception as e:
-        print(f"WARNING: PDF conversion failed: {e}. Falling back to direct processing.")
+        logger.warning("PDF conversion failed: %s. Falling back to direct processing.", e)
         return run_deepseek_ocr(file_bytes, mime_type)
 
 
@@ -414,6 +547,49 @@ class DeepseekInvoiceExtractor:
     """Adapter that exposes DeepSeek OCR via the common extractor interface."""
 
     name = "deepseek"
+    _model = DEEPSEEK_MODEL
+    prompt_version = PROMPT_VERSION
+
+    def __init__(
+        self,
+        *,
+        timeout: float = 120.0,
+        max_retries: int = 3,
+        max_connections: int = 10,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        compact_prompts: bool = True,
+        prompt_token_budget: int = DEFAULT_TOKEN_BUDGET,
+    ) -> None:
+        self._timeout = timeout
+        self._max_retries = max(1, max_retries)
+        self._max_connections = max(1, max_connections)
+        self.limiter = limiter or AdaptiveConcurrencyLimiter(
+            initial=self._max_connections, max_limit=self._max_connections
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._compact_prompts = compact_prompts
+        self._prompt_token_budget = prompt_token_budget
+        if compact_prompts:
+            self.prompt_version = f"{PROMPT_VERSION}-compact{prompt_token_budget}"
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the long-lived keep-alive client, creating it on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self._timeout,
+                limits=httpx.Limits(
+                    max_connections=self._max_connections,
+                    max_keepalive_connections=self._max_connections,
+                    keepalive_expiry=60.0,
+                ),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP client (called on application shutdown)."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
 
     async def extract_invoice(
         self,
@@ -422,10 +598,15 @@ class DeepseekInvoiceExtractor:
         filename: str,
         mime_type: str,
     ) -> dict:
-        def _blocking_call() -> dict:
-            return run_deepseek_ocr(file_bytes, mime_type)
-
-        result = await asyncio.to_thread(_blocking_call)
+        result = await run_deepseek_ocr_async(
+            file_bytes,
+            mime_type,
+            client=self._get_client(),
+            limiter=self.limiter,
+            max_retries=self._max_retries,
+            compact_prompt=self._compact_prompts,
+            token_budget=self._prompt_token_budget,
+        )
         performance = result.get("performance") or {}
         performance.setdefault("provider", self.name)
         result["performance"] = performance
@@ -4,17 +4,69 @@ from __future__ import annotations
 
 import io
 import time
-from dataclasses import dataclass
-from typing import Dict, Optional
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from .cpu_pool import run_cpu_bound
 
 
 @dataclass
 class TextExtractionResult:
-    """Container for raw text extraction results."""
+    """Container for raw text extraction results.
 
-    text: str
+    Only the per-page text is stored; :attr:`text` joins it on access, so a
+    long statement is not held in memory twice.
+    """
+
+    # Per-page text, in page order
+    pages: List[str]
+    perf_metrics: Dict[str, float] = field(default_factory=dict)
+    # PDF pages are joined with ``=== Page N ===`` markers; an image is one bare page
+    page_markers: bool = True
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+
+    @property
+    def text(self) -> str:
+        return format_pages(self.pages) if self.page_markers else "".join(self.pages)
+
+    @property
+    def char_count(self) -> int:
+        return sum(len(page) for page in self.pages)
+
+    def is_blank(self) -> bool:
+        return not any(page.strip() for page in self.pages)
+
+
+@dataclass
+class PageText:
+    """One page of extracted text, as yielded by :func:`iter_document_pages`."""
+
+    index: int
     page_count: int
-    perf_metrics: Dict[str, float]
+    text: str
+    extraction_time: float
+
+
+def iter_document_pages(file_bytes: bytes, mime_type: str) -> Iterator[PageText]:
+    """Yield the text of a PDF or image document one page at a time.
+
+    Pages are extracted lazily, so a consumer can start on page 1 while the
+    rest is still unparsed and only holds the pages it keeps. The PDF is
+    closed when the generator is exhausted or closed early.
+    ``extraction_time`` is per page, in milliseconds.
+    """
+
+    if mime_type == "application/pdf":
+        yield from _iter_pdf_pages(file_bytes)
+    elif mime_type.startswith("image/"):
+        start = time.time()
+        raw_text, _ = _extract_text_from_image(file_bytes)
+        yield PageText(index=0, page_count=1, text=raw_text, extraction_time=(time.time() - start) * 1000)
+    else:
+        raise ValueError(f"Unsupported mime type: {mime_type}")
 
 
 def extract_text_from_document(file_bytes: bytes, mime_type: str) -> TextExtractionResult:
@@ -26,22 +78,36 @@ def extract_text_from_document(file_bytes: bytes, mime_type: str) -> TextExtract
 
     perf_metrics: Dict[str, float] = {}
     text_extract_start = time.time()
-    raw_text = ""
-    page_count = 1
+    pages = [page.text for page in iter_document_pages(file_bytes, mime_type)]
+    perf_metrics["text_extraction_time"] = (time.time() - text_extract_start) * 1000
 
-    if mime_type == "application/pdf":
-        raw_text, page_count = _extract_text_from_pdf(file_bytes)
-    elif mime_type.startswith("image/"):
-        raw_text, page_count = _extract_text_from_image(file_bytes)
-    else:
-        raise ValueError(f"Unsupported mime type: {mime_type}")
+    return TextExtractionResult(
+        pages=pages,
+        perf_metrics=perf_metrics,
+        page_markers=mime_type == "application/pdf",
+    )
 
-    perf_metrics["text_extraction_time"] = (time.time() - text_extract_start) * 1000
 
-    return TextExtractionResult(text=raw_text, page_count=page_count, perf_metrics=perf_metrics)
+async def extract_text_from_document_async(file_bytes: bytes, mime_type: str) -> TextExtractionResult:
+    """Run :func:`extract_text_from_document` on the CPU executor.
+
+    Uses the process pool when ``OCR_TEXT_WORKERS`` is set, otherwise the
+    default thread pool. Adds ``text_queue_wait_time`` (time spent waiting
+    for a free worker) alongside the usual ``text_extraction_time``.
+    """
+
+    result, timings = await run_cpu_bound(extract_text_from_document, file_bytes, mime_type)
+    result.perf_metrics["text_queue_wait_time"] = timings["queue_wait_time"]
+    return result
 
 
-def _extract_text_from_pdf(file_bytes: bytes) -> tuple[str, int]:
+def format_pages(pages: List[str]) -> str:
+    """Join per-page text with the ``=== Page N ===`` markers used in prompts."""
+
+    return "".join(f"\n\n=== Page {number} ===\n\n{text}" for number, text in enumerate(pages, start=1))
+
+
+def _iter_pdf_pages(file_bytes: bytes) -> Iterator[PageText]:
     try:
         import fitz  # type: ignore
     except ImportError as exc:  # pragma: no cover - library availability
@@ -52,17 +118,18 @@ def _extract_text_from_pdf(file_bytes: bytes) -> tuple[str, int]:
     pdf_document = fitz.open(stream=file_bytes, filetype="pdf")
     try:
         page_count = len(pdf_document)
-        raw_text_parts = []
         for page_num in range(page_count):
-            page = pdf_document[page_num]
-            raw_text_parts.append(f"\n\n=== Page {page_num + 1} ===\n\n")
-            raw_text_parts.append(page.get_text())
-        raw_text = "".join(raw_text_parts)
+            page_start = time.time()
+            text = pdf_document[page_num].get_text()
+            yield PageText(
+                index=page_num,
+                page_count=page_count,
+                text=text,
+                extraction_time=(time.time() - page_start) * 1000,
+            )
     finally:
         pdf_document.close()
 
-    return raw_text, page_count
-
 
 def _extract_text_from_image(file_bytes: bytes) -> tuple[str, int]:
     try:
@@ -19,19 +19,81 @@ RETURNS TO:
 """
 
 import re 
-from typing import List, Dict 
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+# Individual patterns. Most start at a word boundary; the \b is added where
+# they are used so the scanner below can test it once per group.
+_DATE_NUMERIC = r'\d{1,2}[-/]\d{1,2}[-/]\d{2,4}\b'  # MM-DD-YYYY
+_DATE_WORDS = r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{1,2},? \d{4}\b'  # Month DD, YYYY
+_DATE_ISO = r'\d{4}[-/]\d{1,2}[-/]\d{1,2}\b'  # YYYY-MM-DD
+_MONEY_SYMBOL = r'\$\d{1,3}(?:,\d{3})*(?:\.\d{2})?\b'  # $1,000.00
+_MONEY_WORDS = r'\d+(?:\.\d{2})?\s*(?:dollars|USD)\b'  # 100.00 dollars
+_PERCENT = r'\d+(?:\.\d+)?%'
+_EMAIL = r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+_URL = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+[/\w\.-]*\??[/\w\.-=&%]*'
+_CLAUSE = r'[Cc]lause\s+\d+(?:\.\d+)*'
+_SECTION = r'[Ss]ection\s+\d+(?:\.\d+)*'
+
+# Patterns per entity type; when two types match at the same position the
+# one listed first wins.
+ENTITY_PATTERNS = {
+    "DATE": [rf'\b{_DATE_NUMERIC}', rf'\b{_DATE_WORDS}', rf'\b{_DATE_ISO}'],
+    "MONEY": [_MONEY_SYMBOL, rf'\b{_MONEY_WORDS}'],
+    "PERCENT": [rf'\b{_PERCENT}'],
+    "EMAIL": [rf'\b{_EMAIL}'],
+    "URL": [_URL],
+    "CLAUSE": [_CLAUSE, _SECTION],
+}
+
+# Scanner branches grouped by the character an entity can start with, each
+# group in ENTITY_PATTERNS priority order. Python's re tries every
+# alternative at every position, so sharing the \b test and dispatching on
+# the first character lets most positions (inside a word or number) fail
+# after one or two checks.
+_WORD_START_DIGIT = [
+    ("DATE", _DATE_NUMERIC),
+    ("DATE", _DATE_ISO),
+    ("MONEY", _MONEY_WORDS),
+    ("PERCENT", _PERCENT),
+    ("EMAIL", _EMAIL),
+]
+_WORD_START_LETTER = [("DATE", _DATE_WORDS), ("EMAIL", _EMAIL)]
+_ANY_START = [("MONEY", _MONEY_SYMBOL)]
+_ANY_START_HCS = [("URL", _URL), ("CLAUSE", _CLAUSE), ("CLAUSE", _SECTION)]
+_WORD_START_SYMBOL = [("EMAIL", _EMAIL)]  # e.g. "_billing@..." or ".ops@..."
+
+_GROUP_TYPES: Dict[str, str] = {}
+
+
+def _branches(patterns: List[Tuple[str, str]]) -> str:
+    parts = []
+    for entity_type, pattern in patterns:
+        group = f"{entity_type}_{len(_GROUP_TYPES)}"
+        _GROUP_TYPES[group] = entity_type
+        parts.append(f"(?P<{group}>{pattern})")
+    return "|".join(parts)
+
+
+_ENTITY_SCANNER = re.compile(
+    rf"\b(?:(?=\d)(?:{_branches(_WORD_START_DIGIT)})|(?=[a-z])(?:{_branches(_WORD_START_LETTER)}))"
+    rf"|{_branches(_ANY_START)}"
+    rf"|(?=[hcs])(?:{_branches(_ANY_START_HCS)})"
+    rf"|\b(?=[._%+-])(?:{_branches(_WORD_START_SYMBOL)})",
+    re.IGNORECASE,
+)
 
 
 def extract_entities(text: str) -> List[Dict]:
     """
-    Extract entities using regex patterns.
+    Extract entities using a single precompiled regex pass.
     
     DATA FLOW:
     ----------
-    1. Apply regex patterns for each entity type
-    2. Find all matches in text
+    1. Scan the text once with the combined entity pattern
+    2. The named group that matched gives the entity type (_GROUP_TYPES)
     3. Record match position and text
-    4. Return list of all entities found
+    4. Return list of all entities found, ordered by position
     
     CALLED BY:
     - _process_single_invoice() in routers/ocr.py (to find dates)
@@ -61,52 +123,38 @@ def extract_entities(text: str) -> List[Dict]:
     - EMAIL: Email addresses
     - URL: Web URLs
     - CLAUSE: Legal clauses (Clause 1, Section 2.3)
-    """
-    entities = []
     
-    #Date patterns 
-    date_patterns = [
-        r'\b\d{1,2}[-/]\d{1,2}[-/]\d{2,4}\b',  # MM-DD-YYYY
-        r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{1,2},? \d{4}\b',  # Month DD, YYYY
-        r'\b\d{4}[-/]\d{1,2}[-/]\d{1,2}\b'  # YYYY-MM-DD
-    ]
-    
-    # Money patterns
-    money_patterns = [
-        r'\$\d{1,3}(?:,\d{3})*(?:\.\d{2})?\b',  # $1,000.00
-        r'\b\d+(?:\.\d{2})?\s*(?:dollars|USD)\b'  # 100.00 dollars
-    ]
-    
-    # Percent patterns
-    percent_patterns = [r'\b\d+(?:\.\d+)?%']
-    
-    # Email patterns
-    email_patterns = [r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b']
-    
-    # URL patterns
-    url_patterns = [r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+[/\w\.-]*\??[/\w\.-=&%]*']
-    
-    # Clause patterns
-    clause_patterns = [r'[Cc]lause\s+\d+(?:\.\d+)*', r'[Ss]ection\s+\d+(?:\.\d+)*']
-    
-    patterns = {
-        "DATE": date_patterns,
-        "MONEY": money_patterns,
-        "PERCENT": percent_patterns,
-        "EMAIL": email_patterns,
-        "URL": url_patterns,
-        "CLAUSE": clause_patterns
-    }
+    NOTE: Matches never overlap. Where two types could match at the same
+    position, the one listed first in ENTITY_PATTERNS wins.
+    """
+    return list(_scan(text, 0))
+
+
+def iter_entities(pages: Iterable[str]) -> Iterator[Dict]:
+    """
+    Incremental variant of extract_entities() for page-by-page text.
     
-    for entity_type, pattern_list in patterns.items():
-        for pattern in pattern_list:
-            for match in re.finditer(pattern, text, re.IGNORECASE):
-                entities.append({
-                    "type": entity_type,
-                    "offsetStart": match.start(),
-                    "offsetEnd": match.end(),
-                    "text": match.group()
-                })
+    Entities are yielded as each page is scanned, with offsets into the
+    concatenation of all pages and a zero-based "page" index. An entity
+    split across a page boundary is not detected.
     
-    return entities
-    
\ No newline at end of file
+    CALLED BY: callers that consume text page by page (e.g. from
+               iter_document_pages() in services/document_text.py) and want
+               entities before the whole document has been read
+    """
+    offset = 0
+    for page_index, page_text in enumerate(pages):
+        for entity in _scan(page_text, offset):
+            entity["page"] = page_index
+            yield entity
+        offset += len(page_text)
+
+
+def _scan(text: str, offset: int) -> Iterator[Dict]:
+    for match in _ENTITY_SCANNER.finditer(text):
+        yield {
+            "type": _GROUP_TYPES[match.lastgroup],
+            "offsetStart": match.start() + offset,
+            "offsetEnd": match.end() + offset,
+            "text": match.group()
+        }
@@ -0,0 +1,221 @@
+"""Content-addressed cache for invoice extraction results.
+
+Re-uploading the same PDF (re-runs after review, duplicate emails) should not
+pay for another LLM round-trip. :class:`CachedInvoiceExtractor` wraps any
+``InvoiceExtractorProtocol`` implementation and keys results on a hash of the
+file bytes plus the provider, model and prompt version, so a prompt or model
+change naturally invalidates old entries.
+
+Entries live in a small SQLite database on local disk. Expired entries are
+dropped on write and the least recently used entries are evicted once the
+store grows past its byte budget.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .tracing import traced_to_thread
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extraction_cache (
+    cache_key TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+)
+"""
+
+
+@dataclass
+class CacheStats:
+    """Lifetime counters for a cache instance."""
+
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class ExtractionCache:
+    """SQLite-backed key/value store with TTL and size-based LRU eviction."""
+
+    def __init__(self, path: Path, *, max_bytes: int, ttl_seconds: float) -> None:
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self._path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        self.stats = CacheStats()
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM extraction_cache WHERE cache_key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            payload, created_at = row
+            if self._ttl_seconds > 0 and now - created_at > self._ttl_seconds:
+                self._conn.execute("DELETE FROM extraction_cache WHERE cache_key = ?", (key,))
+                self._conn.commit()
+                self.stats.misses += 1
+                self.stats.evictions += 1
+                return None
+            self._conn.execute(
+                "UPDATE extraction_cache SET last_access = ? WHERE cache_key = ?",
+                (now, key),
+            )
+            self._conn.commit()
+            self.stats.hits += 1
+        return json.loads(payload)
+
+    def put(self, key: str, value: dict) -> None:
+        payload = json.dumps(value)
+        size = len(payload.encode("utf-8"))
+        if self._max_bytes > 0 and size > self._max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache "
+                "(cache_key, payload, size_bytes, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, size, now, now),
+            )
+            self.stats.stores += 1
+            self._evict_locked(now)
+            self._conn.commit()
+
+    def _evict_locked(self, now: float) -> None:
+        if self._ttl_seconds > 0:
+            cursor = self._conn.execute(
+                "DELETE FROM extraction_cache WHERE created_at < ?",
+                (now - self._ttl_seconds,),
+            )
+            self.stats.evictions += max(cursor.rowcount, 0)
+
+        if self._max_bytes <= 0:
+            return
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size_bytes), 0) FROM extraction_cache"
+        ).fetchone()
+        if total <= self._max_bytes:
+            return
+
+        overflow = total - self._max_bytes
+        victims = []
+        for cache_key, size_bytes in self._conn.execute(
+            "SELECT cache_key, size_bytes FROM extraction_cache ORDER BY last_access ASC"
+        ):
+            victims.append((cache_key,))
+            overflow -= size_bytes
+            if overflow <= 0:
+                break
+        self._conn.executemany("DELETE FROM extraction_cache WHERE cache_key = ?", victims)
+        self.stats.evictions += len(victims)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM extraction_cache"
+            ).fetchone()
+        return {**self.stats.as_dict(), "entries": entries, "size_bytes": total}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedInvoiceExtractor:
+    """Wraps an invoice extractor and replays results for identical inputs."""
+
+    accepts_content_sha256 = True
+
+    def __init__(self, inner: Any, cache: ExtractionCache) -> None:
+        self._inner = inner
+        self._cache = cache
+        self.name = inner.name
+        self._model = getattr(inner, "_model", None)
+        self.prompt_version = getattr(inner, "prompt_version", "unversioned")
+
+    @property
+    def cache(self) -> ExtractionCache:
+        return self._cache
+
+    @property
+    def inner(self) -> Any:
+        return self._inner
+
+    async def aclose(self) -> None:
+        close = getattr(self._inner, "aclose", None)
+        if close is not None:
+            await close()
+        self._cache.close()
+
+    def cache_key(self, file_bytes: bytes, mime_type: str, content_sha256: Optional[str] = None) -> str:
+        digest = content_sha256 or hashlib.sha256(file_bytes).hexdigest()
+        parts = [digest, mime_type or "", self.name, self._model or "", self.prompt_version]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    async def extract_invoice(
+        self,
+        *,
+        file_bytes: bytes,
+        filename: str,
+        mime_type: str,
+        content_sha256: Optional[str] = None,
+    ) -> dict:
+        lookup_start = time.perf_counter()
+        key = self.cache_key(file_bytes, mime_type, content_sha256)
+        cached = await traced_to_thread("cache.get", self._cache.get, key)
+        lookup_time = (time.perf_counter() - lookup_start) * 1000
+
+        if cached is not None:
+            performance = cached.get("performance") or {}
+            performance["cache_hit"] = True
+            performance["cache_lookup_time"] = lookup_time
+            cached["performance"] = performance
+            cached["duration"] = round(lookup_time / 1000, 2)
+            return cached
+
+        result = await self._inner.extract_invoice(
+            file_bytes=file_bytes,
+            filename=filename,
+            mime_type=mime_type,
+        )
+
+        result_json = result.get("result_json")
+        if isinstance(result_json, dict) and not result_json.get("error"):
+            await traced_to_thread("cache.put", self._cache.put, key, result)
+
+        performance = result.get("performance") or {}
+        performance["cache_hit"] = False
+        performance["cache_lookup_time"] = lookup_time
+        result["performance"] = performance
+        return result
@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
 import time
 from dataclasses import dataclass
@@ -10,6 +11,26 @@ from typing import Dict, List, Optional, Sequence
 
 import httpx
 
+from .app_logging import get_logger
+from .concurrency import AdaptiveConcurrencyLimiter
+from .cpu_pool import run_cpu_bound
+from .document_text import iter_document_pages
+from .invoice_schema import SCHEMA_VERSION, gemini_response_schema
+from .json_recovery import JSONRecoveryError, parse_model_json
+from .prompt_compaction import (
+    DEFAULT_TOKEN_BUDGET,
+    CompactionStats,
+    compact_pages,
+    enforce_token_budget,
+)
+from .tracing import span
+
+try:
+    import h2  # type: ignore  # noqa: F401
+
+    _HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover - falls back to HTTP/1.1 keep-alive
+    _HTTP2_AVAILABLE = False
 
 try:
     import fitz  # type: ignore
@@ -24,6 +45,9 @@ except ImportError:
     pytesseract = None  # type: ignore
 
 
+logger = get_logger(__name__)
+
+
 GEMINI_ENDPOINT_TEMPLATE = (
     "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
 )
@@ -32,56 +56,10 @@ GEMINI_ENDPOINT_TEMPLATE = (
 SYSTEM_PROMPT = """You are an expert financial document analyst. Extract EVERY data point from invoices with absolute precision."""
 
 
-JSON_SCHEMA = """{
-  "invoice_number": "string or null",
-  "date": "string",
-  "vendor": {
-    "name": "string or null",
-    "address": "string or null"
-  },
-  "customer": {
-    "name": "string or null",
-    "billing_address": "string or null"
-  },
-  "shipping_info": {
-    "address": "string or null",
-    "city": "string or null",
-    "state": "string or null",
-    "country": "string or null",
-    "postal_code": "string or null",
-    "ship_mode": "string or null"
-  },
-  "order_id": "string or null",
-  "line_items": [
-    {
-      "item_name": "string",
-      "description": "string or null",
-      "product_code": "string or null",
-      "quantity": number,
-      "rate": number,
-      "amount": number
-    }
-  ],
-  "financial_summary": {
-    "subtotal": number or null,
-    "discount": {
-      "percent": number or null,
-      "amount": number or null
-    },
-    "shipping": number or null,
-    "tax": number or null,
-    "total": number or null,
-    "balance_due": number or null
-  },
-  "payment_terms": "string or null",
-  "notes": "string or null"
-}"""
-
-
-USER_PROMPT_TEMPLATE = """You will receive text extracted from an invoice document. Analyse it carefully and return a single VALID JSON object matching the schema below. Do not include markdown fences or commentary. Use null for any missing field and preserve exact numeric values.
-
-JSON schema:
-{json_schema}
+RESPONSE_SCHEMA = gemini_response_schema()
+
+
+USER_PROMPT_TEMPLATE = """You will receive text extracted from an invoice document. Analyse it carefully and return the invoice as JSON in the response schema. Use null for any missing field and preserve exact numeric values.
 
 CRITICAL RULES:
 - `quantity` is how many units.
@@ -95,12 +73,57 @@ SOURCE DOCUMENT:
 """
 
 
+PAGE_GROUP_NOTE = """NOTE: This text covers pages {first}-{last} of a {total}-page invoice. The other pages are processed separately. Extract only the line items printed on these pages, and fill header or summary fields only if they appear on these pages (use null otherwise).
+
+"""
+
+
+# Bump automatically whenever the prompt or schema text changes so cached
+# extractions produced by an older prompt are never replayed.
+PROMPT_VERSION = hashlib.sha256(
+    (SYSTEM_PROMPT + SCHEMA_VERSION + USER_PROMPT_TEMPLATE + PAGE_GROUP_NOTE).encode("utf-8")
+).hexdigest()[:12]
+
+
 @dataclass
 class _PageText:
     index: int
     content: str
 
 
+def _extract_pages(file_bytes: bytes, mime_type: str) -> List[_PageText]:
+    # Module-level so it can be shipped to the process pool (services/cpu_pool.py)
+    if mime_type == "application/pdf":
+        return _extract_pdf_pages(file_bytes)
+    if mime_type.startswith("image/"):
+        text = _extract_image_text(file_bytes)
+        return [_PageText(index=0, content=text)] if text else []
+    # Fallback: treat as binary text
+    try:
+        content = file_bytes.decode("utf-8", errors="ignore")
+    except Exception:
+        content = ""
+    return [_PageText(index=0, content=content)] if content else []
+
+
+def _extract_pdf_pages(file_bytes: bytes) -> List[_PageText]:
+    pages: List[_PageText] = []
+    for page in iter_document_pages(file_bytes, "application/pdf"):
+        page_text = page.text.strip()
+        if page_text:
+            pages.append(_PageText(index=page.index, content=page_text))
+    return pages
+
+
+def _extract_image_text(file_bytes: bytes) -> str:
+    if not Image or not pytesseract:
+        return ""
+    import io
+
+    with Image.open(io.BytesIO(file_bytes)) as img:
+        return pytesseract.image_to_string(img)
+
+
 class GeminiInvoiceExtractor:
     name = "gemini"
 
@@ -112,12 +135,60 @@ class GeminiInvoiceExtractor:
         timeout: float,
         max_retries: int,
         fan_out_pages: bool,
+        max_connections: int = 10,
+        page_group_size: int = 4,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        compact_prompts: bool = True,
+        prompt_token_budget: int = DEFAULT_TOKEN_BUDGET,
     ) -> None:
         self._api_key = api_key
         self._model = model or "gemini-flash-latest"
         self._timeout = timeout
         self._max_retries = max(1, max_retries)
         self._fan_out_pages = fan_out_pages
+        self._page_group_size = max(1, page_group_size)
+        self._compact_prompts = compact_prompts
+        self._prompt_token_budget = prompt_token_budget
+        self.prompt_version = PROMPT_VERSION
+        if fan_out_pages:
+            self.prompt_version += f"-fanout{self._page_group_size}"
+        if compact_prompts:
+            self.prompt_version += f"-compact{prompt_token_budget}"
+        self._max_connections = max(1, max_connections)
+        self.limiter = limiter or AdaptiveConcurrencyLimiter(
+            initial=self._max_connections, max_limit=self._max_connections
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._pool_stats: Dict[str, int] = {
+            "requests": 0,
+            "new_connections": 0,
+            "reused_connections": 0,
+        }
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the long-lived pooled client, creating it on first use."""
+
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self._timeout,
+                http2=_HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=self._max_connections,
+                    max_keepalive_connections=self._max_connections,
+                    keepalive_expiry=60.0,
+                ),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP client (called on application shutdown)."""
+
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    def pool_stats(self) -> Dict[str, object]:
+        return {**self._pool_stats, "http2": _HTTP2_AVAILABLE, "max_connections": self._max_connections}
 
     async def extract_invoice(
         self,
@@ -130,9 +201,9 @@ class GeminiInvoiceExtractor:
         perf_metadata: Dict[str, str] = {"provider": self.name, "model": self._model}
         start_time = time.time()
 
-        text_start = time.perf_counter()
-        pages = await asyncio.to_thread(self._extract_pages, file_bytes, mime_type)
-        perf["text_extraction_time"] = (time.perf_counter() - text_start) * 1000
+        pages, text_timings = await run_cpu_bound(_extract_pages, file_bytes, mime_type)
+        perf["text_extraction_time"] = text_timings["compute_time"]
+        perf["text_queue_wait_time"] = text_timings["queue_wait_time"]
 
         if not pages:
             duration = round(time.time() - start_time, 2)
@@ -154,15 +225,41 @@ class GeminiInvoiceExtractor:
                 "performance": {**perf, **perf_metadata},
             }
 
-        payload = self._build_payload(pages)
+        compaction: Optional[CompactionStats] = None
+        if self._compact_prompts:
+            compaction_start = time.perf_counter()
+            # Header/footer detection needs every page, so compact before grouping
+            with span("prompt_compaction", pages=len(pages)):
+                compacted, compaction = compact_pages([page.content for page in pages])
+            pages = [
+                _PageText(index=page.index, content=content)
+                for page, content in zip(pages, compacted)
+            ]
+            perf["prompt_compaction_time"] = (time.perf_counter() - compaction_start) * 1000
+
+        groups = self._page_groups(pages)
+        if len(groups) > 1:
+            api_start = time.perf_counter()
+            invoice_json, group_stats, connection_stats = await self._extract_page_groups(
+                groups, total_pages=len(pages), compaction=compaction
+            )
+            perf["api_call_time"] = (time.perf_counter() - api_start) * 1000
+            perf["json_parse_time"] = sum(g["json_parse_time"] for g in group_stats)
+            for key in ("input_tokens", "output_tokens"):
+                perf[key] = sum(g.get(key, 0) for g in group_stats)
+        else:
+            group_stats = []
+            payload = self._build_payload(pages, compaction=compaction)
 
-        api_start = time.perf_counter()
-        response_json = await self._call_gemini(payload)
-        perf["api_call_time"] = (time.perf_counter() - api_start) * 1000
+            api_start = time.perf_counter()
+            response_json, connection_stats = await self._call_gemini(payload)
+            perf["api_call_time"] = (time.perf_counter() - api_start) * 1000
+            perf.update(_token_usage(response_json))
 
-        parse_start = time.perf_counter()
-        invoice_json = self._parse_response(response_json)
-        perf["json_parse_time"] = (time.perf_counter() - parse_start) * 1000
+            parse_start = time.perf_counter()
+            with span("gemini.parse"):
+                invoice_json = self._parse_response(response_json)
+            perf["json_parse_time"] = (time.perf_counter() - parse_start) * 1000
 
         duration = round(time.time() - start_time, 2)
 
@@ -173,7 +270,16 @@ class GeminiInvoiceExtractor:
             "text_extraction_time": perf.get("text_extraction_time", 0),
             "api_call_time": perf.get("api_call_time", 0),
             "json_parse_time": perf.get("json_parse_time", 0),
+            "text_queue_wait_time": perf.get("text_queue_wait_time", 0),
+            "input_tokens": perf.get("input_tokens", 0),
+            "output_tokens": perf.get("output_tokens", 0),
+            **connection_stats,
         }
+        if compaction is not None:
+            performance["provider_breakdown"]["prompt_compaction_time"] = perf["prompt_compaction_time"]
+            performance["provider_breakdown"].update(compaction.as_metrics())
+        if group_stats:
+            performance["provider_breakdown"]["page_groups"] = group_stats
 
         return {
             "result_json": invoice_json,
@@ -184,40 +290,101 @@ class GeminiInvoiceExtractor:
             "performance": performance,
         }
 
-    def _extract_pages(self, file_bytes: bytes, mime_type: str) -> List[_PageText]:
-        if mime_type == "application/pdf":
-            return self._extract_pdf_pages(file_bytes)
-        if mime_type.startswith("image/"):
-            text = self._extract_image_text(file_bytes)
-            return [_PageText(index=0, content=text)] if text else []
-        # Fallback: treat as binary text
-        try:
-            content = file_bytes.decode("utf-8", errors="ignore")
-        except Exception:
-            content = ""
-        return [_PageText(index=0, content=content)] if content else []
-
-    def _extract_pdf_pages(self, file_bytes: bytes) -> List[_PageText]:
-        document = fitz.open(stream=file_bytes, filetype="pdf")
-        pages: List[_PageText] = []
+    def _page_groups(self, pages: Sequence[_PageText]) -> List[Sequence[_PageText]]:
+        if not self._fan_out_pages or len(pages) <= self._page_group_size:
+            return [pages]
+        size = self._page_group_size
+        return [pages[i : i + size] for i in range(0, len(pages), size)]
+
+    async def _extract_page_groups(
+        self,
+        groups: Sequence[Sequence[_PageText]],
+        *,
+        total_pages: int,
+        compaction: Optional[CompactionStats] = None,
+    ) -> tuple[dict, List[dict], Dict[str, int]]:
+        """Send page groups concurrently and merge them into one invoice."""
+
+        async def _run_group(group: Sequence[_PageText]) -> tuple[dict, dict, Dict[str, int]]:
+            note = PAGE_GROUP_NOTE.format(
+                first=group[0].index + 1,
+                last=group[-1].index + 1,
+                total=total_pages,
+            )
+            with span("gemini.page_group", lane=f"pages {group[0].index + 1}-{group[-1].index + 1}"):
+                group_start = time.perf_counter()
+                response_json, connection_stats = await self._call_gemini(
+                    self._build_payload(group, page_note=note, compaction=compaction)
+                )
+                api_call_time = (time.perf_counter() - group_start) * 1000
+
+                parse_start = time.perf_counter()
+                with span("gemini.parse"):
+                    part = self._parse_response(response_json)
+            stats = {
+                "pages": [page.index + 1 for page in group],
+                "api_call_time": api_call_time,
+                "json_parse_time": (time.perf_counter() - parse_start) * 1000,
+                "line_items": len(part.get("line_items") or []),
+                **_token_usage(response_json),
+            }
+            if part.get("error"):
+                stats["error"] = part["error"]
+            return part, stats, connection_stats
+
+        tasks = [asyncio.ensure_future(_run_group(group)) for group in groups]
         try:
-            for page_index, page in enumerate(document):
-                page_text = page.get_text().strip()
-                if page_text:
-                    pages.append(_PageText(index=page_index, content=page_text))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # One failed group fails the invoice: stop paying for the others
+                if any(task.exception() is not None or task.result()[1].get("error") for task in done):
+                    break
         finally:
-            document.close()
-        return pages
-
-    def _extract_image_text(self, file_bytes: bytes) -> str:
-        if not Image or not pytesseract:
-            return ""
-        import io
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        for task in tasks:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+        outcomes = [task.result() for task in tasks if not task.cancelled()]
+        parts = [part for part, _, _ in outcomes]
+        group_stats = [
+            task.result()[1] if not task.cancelled()
+            else {"pages": [page.index + 1 for page in group], "cancelled": True}
+            for task, group in zip(tasks, groups)
+        ]
+        connection_stats = {"new_connections": 0, "reused_connections": 0}
+        for _, _, group_connections in outcomes:
+            for key in connection_stats:
+                connection_stats[key] += group_connections.get(key, 0)
+
+        failed = [stats for stats in group_stats if stats.get("error")]
+        if failed:
+            # Trust-first: a silently missing page of line items is worse than a failed invoice
+            first = failed[0]
+            return (
+                {
+                    "error": f"Pages {first['pages'][0]}-{first['pages'][-1]} failed: {first['error']}",
+                    "line_items": [],
+                },
+                group_stats,
+                connection_stats,
+            )
 
-        with Image.open(io.BytesIO(file_bytes)) as img:
-            return pytesseract.image_to_string(img)
+        merge_start = time.perf_counter()
+        merged = _merge_page_group_results(parts)
+        group_stats[-1]["json_parse_time"] += (time.perf_counter() - merge_start) * 1000
+        return merged, group_stats, connection_stats
 
-    def _build_payload(self, pages: Sequence[_PageText]) -> dict:
+    def _build_payload(
+        self,
+        pages: Sequence[_PageText],
+        page_note: str = "",
+        compaction: Optional[CompactionStats] = None,
+    ) -> dict:
         if self._fan_out_pages and len(pages) > 1:
             document_sections = []
             for page in pages:
@@ -226,10 +393,13 @@ class GeminiInvoiceExtractor:
         else:
             document_text = "\n\n".join(page.content for page in pages)
 
-        user_prompt = USER_PROMPT_TEMPLATE.format(
-            json_schema=JSON_SCHEMA,
-            document=document_text,
-        )
+        if self._compact_prompts:
+            # The budget is per request, so each page group gets the full allowance
+            document_text, _ = enforce_token_budget(
+                document_text, self._prompt_token_budget, compaction
+            )
+
+        user_prompt = USER_PROMPT_TEMPLATE.format(document=page_note + document_text)
 
         return {
             "systemInstruction": {
@@ -245,20 +415,45 @@ class GeminiInvoiceExtractor:
             "generationConfig": {
                 "temperature": 0.1,
                 "maxOutputTokens": 4096,
+                # Native JSON mode: no fences or prose, schema enforced server-side
+                "responseMimeType": "application/json",
+                "responseSchema": RESPONSE_SCHEMA,
             },
         }
 
-    async def _call_gemini(self, payload: dict) -> dict:
+    async def _call_gemini(self, payload: dict) -> tuple[dict, Dict[str, int]]:
         url = GEMINI_ENDPOINT_TEMPLATE.format(model=self._model)
         headers = {"x-goog-api-key": self._api_key}
+        client = self._get_client()
+        connection_stats = {"new_connections": 0, "reused_connections": 0}
         last_error: Optional[Exception] = None
 
         for attempt in range(1, self._max_retries + 1):
+            opened = False
+
+            async def _trace(event_name: str, info: dict) -> None:
+                nonlocal opened
+                if event_name == "connection.connect_tcp.started":
+                    opened = True
+
             try:
-                async with httpx.AsyncClient(timeout=self._timeout) as client:
-                    response = await client.post(url, headers=headers, json=payload)
+                async with self.limiter.slot() as slot:
+                    with span("gemini.request", attempt=attempt) as request_span:
+                        try:
+                            response = await client.post(
+                                url,
+                                headers=headers,
+                                json=payload,
+                                extensions={"trace": _trace},
+                            )
+                        except httpx.TimeoutException:
+                            slot.record_overload()
+                            raise
+                        slot.record_status(response.status_code)
+                        request_span.set(status=response.status_code, new_connection=opened)
+                self._record_connection(opened, connection_stats)
                 if response.status_code == 200:
-                    return response.json()
+                    return response.json(), connection_stats
                 error_payload = response.text
                 last_error = RuntimeError(
                     f"Gemini API error {response.status_code}: {error_payload}"
@@ -267,11 +462,18 @@ class GeminiInvoiceExtractor:
                 last_error = exc
 
             if attempt < self._max_retries:
-                await asyncio.sleep(min(2 ** attempt, 5))
+                with span("retry_backoff", attempt=attempt):
+                    await asyncio.sleep(min(2 ** attempt, 5))
 
         assert last_error is not None
         raise last_error
 
+    def _record_connection(self, opened: bool, connection_stats: Dict[str, int]) -> None:
+        key = "new_connections" if opened else "reused_connections"
+        connection_stats[key] += 1
+        self._pool_stats[key] += 1
+        self._pool_stats["requests"] += 1
+
     def _parse_response(self, response_json: dict) -> dict:
         candidates = response_json.get("candidates") or []
         if not candidates:
@@ -295,20 +497,120 @@ class GeminiInvoiceExtractor:
             }
 
         try:
-            return json.loads(response_text)
-        except json.JSONDecodeError:
-            # Attempt to clean accidental markdown fences
-            cleaned = response_text
-            if cleaned.startswith("```"):
-                cleaned = cleaned.split("\n", 1)[-1]
-            cleaned = cleaned.rstrip("`")
-            try:
-                return json.loads(cleaned)
-            except json.JSONDecodeError:
-                return {
-                    "error": "Failed to parse Gemini JSON response",
-                    "raw_response": response_text[:1000],
-                    "line_items": [],
-                }
+            parsed = parse_model_json(response_text, provider=self.name)
+        except JSONRecoveryError as exc:
+            return {
+                "error": f"Failed to parse Gemini JSON response: {exc}",
+                "raw_response": response_text[:1000],
+                "line_items": [],
+            }
+        if parsed.repaired:
+            logger.debug(
+                "Repaired Gemini JSON (%s, finishReason=%s)",
+                ", ".join(parsed.repairs), candidate.get("finishReason"),
+            )
+        if not isinstance(parsed.value, dict):
+            return {
+                "error": "Gemini JSON response is not an object",
+                "raw_response": response_text[:1000],
+                "line_items": [],
+            }
+        return parsed.value
+
+
+
+
+def _token_usage(response_json: dict) -> Dict[str, int]:
+    usage = response_json.get("usageMetadata") or {}
+    return {
+        "input_tokens": int(usage.get("promptTokenCount") or 0),
+        "output_tokens": int(usage.get("candidatesTokenCount") or 0),
+    }
+
+
+# Header sections are taken from the earliest page group that has them;
+# totals usually sit on the last page, so the summary prefers later groups.
+_LATEST_WINS_FIELDS = {"financial_summary", "payment_terms", "notes"}
+
+
+def _merge_page_group_results(parts: Sequence[dict]) -> dict:
+    """Merge per-page-group invoice JSON into a single invoice."""
+
+    merged: dict = {}
+    for field in _field_order(parts):
+        ordered = reversed(parts) if field in _LATEST_WINS_FIELDS else parts
+        values = [part.get(field) for part in ordered if field in part]
+        merged[field] = _first_present(values)
+
+    groups = [[item for item in part.get("line_items") or [] if isinstance(item, dict)] for part in parts]
+    all_items = [item for items in groups for item in items]
+    line_items: List[dict] = list(groups[0]) if groups else []
+    for items in groups[1:]:
+        # Only rows repeated across the page break (the previous group's last
+        # rows reappearing as this group's first rows) are the same row seen
+        # twice; an identical line further down is a genuine repeat purchase.
+        line_items.extend(items[_boundary_overlap(line_items, items):])
+
+    if len(line_items) != len(all_items):
+        # ...unless only the un-deduplicated rows add up to the printed subtotal
+        subtotal = _as_number((merged.get("financial_summary") or {}).get("subtotal"))
+        if subtotal is not None and _sums_to(all_items, subtotal) and not _sums_to(line_items, subtotal):
+            line_items = all_items
+
+    merged["line_items"] = line_items
+    return merged
+
+
+def _line_key(item: dict) -> tuple:
+    return (
+        item.get("item_name"),
+        item.get("product_code"),
+        item.get("quantity"),
+        item.get("rate"),
+        item.get("amount"),
+    )
+
+
+def _boundary_overlap(previous: Sequence[dict], items: Sequence[dict]) -> int:
+    """Length of the longest run of ``items`` that repeats the tail of ``previous``."""
+
+    for size in range(min(len(previous), len(items)), 0, -1):
+        if [_line_key(item) for item in previous[-size:]] == [_line_key(item) for item in items[:size]]:
+            return size
+    return 0
+
+
+def _as_number(value: object) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _sums_to(items: Sequence[dict], total: float) -> bool:
+    amounts = [_as_number(item.get("amount")) for item in items]
+    return None not in amounts and abs(sum(amounts) - total) <= 0.01
+
+
+def _field_order(parts: Sequence[dict]) -> List[str]:
+    fields: List[str] = []
+    for part in parts:
+        for field in part:
+            if field != "line_items" and field not in fields:
+                fields.append(field)
+    return fields
+
 
+def _first_present(values: Sequence[object]) -> object:
+    """Pick the first non-empty value; nested objects are merged field by field."""
 
+    dicts = [value for value in values if isinstance(value, dict)]
+    if dicts:
+        merged: dict = {}
+        for key in _field_order(dicts):
+            merged[key] = _first_present([d.get(key) for d in dicts if key in d])
+        return merged
+    for value in values:
+        if value not in (None, ""):
+            return value
+    return None
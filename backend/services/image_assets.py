@@ -0,0 +1,82 @@
+"""Page images stored as blobs and referenced by URL instead of inlined.
+
+OCR providers that return page images (Mistral with
+``include_image_base64=True``) hand back base64 strings, and embedding those
+in a JSON response makes every analysis several megabytes to serialise,
+send and parse. :func:`store_inline_images` decodes each image once, writes
+it to the content-addressed :class:`~services.blob_store.BlobStore` and
+returns small ``{"id", "url", "bytes"}`` references served by
+``GET /files/assets/{asset}``.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import re
+from typing import Any, Dict, Optional, Tuple
+
+from .blob_store import BlobStore
+
+
+IMAGE_MODES = ("assets", "inline", "none")
+
+ASSET_MEDIA_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+}
+
+_DATA_URI = re.compile(r"^data:image/(?P<subtype>[\w.+-]+);base64,", re.I)
+_MAGIC = (
+    (b"\x89PNG", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF8", ".gif"),
+)
+
+
+def asset_url(sha256: str, ext: str) -> str:
+    return f"/files/assets/{sha256}{ext}"
+
+
+def _decode_image(value: str) -> Optional[Tuple[bytes, str]]:
+    ext = None
+    match = _DATA_URI.match(value)
+    if match:
+        ext = "." + match.group("subtype").lower()
+        value = value[match.end():]
+    try:
+        data = base64.b64decode(value, validate=False)
+    except (binascii.Error, ValueError):
+        return None
+    if not data:
+        return None
+    if ext not in ASSET_MEDIA_TYPES:
+        ext = next((suffix for magic, suffix in _MAGIC if data.startswith(magic)), None)
+        if ext is None and data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            ext = ".webp"
+    if ext is None:
+        return None
+    return data, ext
+
+
+def store_inline_images(images: Dict[Any, Any], store: BlobStore) -> Dict[str, Any]:
+    """Replace base64 image values with blob references.
+
+    Keys are preserved (as strings, matching their JSON form). Values that
+    cannot be decoded as a known image type are dropped rather than inlined.
+    """
+
+    references: Dict[str, Any] = {}
+    for key, value in (images or {}).items():
+        if not isinstance(value, str):
+            continue
+        decoded = _decode_image(value)
+        if decoded is None:
+            continue
+        data, ext = decoded
+        sha256, _ = store.put_bytes(data, ext)
+        references[str(key)] = {"id": sha256, "url": asset_url(sha256, ext), "bytes": len(data)}
+    return references
@@ -4,9 +4,18 @@ from __future__ import annotations
 
 import os
 from dataclasses import dataclass
+from pathlib import Path
 from typing import Optional, Protocol
 
+from .concurrency import AdaptiveConcurrencyLimiter
+from .cpu_pool import configure_cpu_pool
 from .deepseek_ocr import DeepseekInvoiceExtractor
+from .extraction_cache import CachedInvoiceExtractor, ExtractionCache
+from .layout_extractor import LayoutInvoiceExtractor
+from .prompt_compaction import DEFAULT_TOKEN_BUDGET
+from .single_flight import CoalescingInvoiceExtractor
+from .tracing import configure_tracing
+from .vendor_templates import TemplateInvoiceExtractor, TemplateStore
 
 try:
     from .gemini_invoice_extractor import GeminiInvoiceExtractor
@@ -35,9 +44,28 @@ class OCRSettings:
     model: Optional[str]
     gemini_api_key: Optional[str]
     max_concurrency: int
+    limiter_max_concurrency: int
     request_timeout: float
     max_retries: int
     page_fanout: bool
+    page_group_size: int
+    cache_enabled: bool
+    cache_path: str
+    cache_max_bytes: int
+    cache_ttl_seconds: float
+    job_store_dir: str
+    job_workers: int
+    job_max_attempts: int
+    text_workers: int
+    text_worker_max_tasks: int
+    prompt_compaction: bool
+    prompt_token_budget: int
+    layout_fast_path: bool
+    layout_min_confidence: float
+    templates_enabled: bool
+    template_path: str
+    trace_dir: str
+    trace_keep: int
 
 
 def get_ocr_settings() -> OCRSettings:
@@ -47,23 +75,91 @@ def get_ocr_settings() -> OCRSettings:
     model = os.getenv("GEMINI_MODEL", "gemini-flash-latest").strip()
     api_key = os.getenv("GEMINI_API_KEY")
     max_concurrency = int(os.getenv("OCR_MAX_CONCURRENCY", "3"))
+    limiter_max_concurrency = int(
+        os.getenv("OCR_LIMITER_MAX_CONCURRENCY", str(max(1, max_concurrency) * 4))
+    )
     request_timeout = float(os.getenv("OCR_REQUEST_TIMEOUT", "60"))
     max_retries = int(os.getenv("OCR_MAX_RETRIES", "3"))
     page_fanout = os.getenv("OCR_PAGE_FANOUT", "true").strip().lower() in {"1", "true", "yes"}
+    page_group_size = int(os.getenv("OCR_PAGE_GROUP_SIZE", "4"))
+    cache_enabled = os.getenv("OCR_CACHE_ENABLED", "true").strip().lower() in {"1", "true", "yes"}
+    cache_path = os.getenv("OCR_CACHE_PATH", ".cache/extractions.sqlite3").strip()
+    cache_max_bytes = int(os.getenv("OCR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+    cache_ttl_seconds = float(os.getenv("OCR_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    job_store_dir = os.getenv("OCR_JOB_STORE_DIR", ".jobs").strip()
+    job_workers = int(os.getenv("OCR_JOB_WORKERS", str(max_concurrency)))
+    job_max_attempts = int(os.getenv("OCR_JOB_MAX_ATTEMPTS", "3"))
+    text_workers = int(os.getenv("OCR_TEXT_WORKERS", "0"))
+    text_worker_max_tasks = int(os.getenv("OCR_TEXT_WORKER_MAX_TASKS", "50"))
+    prompt_compaction = os.getenv("OCR_PROMPT_COMPACTION", "true").strip().lower() in {"1", "true", "yes"}
+    prompt_token_budget = int(os.getenv("OCR_PROMPT_TOKEN_BUDGET", str(DEFAULT_TOKEN_BUDGET)))
+    layout_fast_path = os.getenv("OCR_LAYOUT_FAST_PATH", "true").strip().lower() in {"1", "true", "yes"}
+    layout_min_confidence = float(os.getenv("OCR_LAYOUT_MIN_CONFIDENCE", "0.9"))
+    templates_enabled = os.getenv("OCR_TEMPLATES_ENABLED", "true").strip().lower() in {"1", "true", "yes"}
+    template_path = os.getenv("OCR_TEMPLATE_PATH", ".cache/vendor_templates.sqlite3").strip()
+    trace_dir = os.getenv("OCR_TRACE_DIR", "").strip()
+    trace_keep = int(os.getenv("OCR_TRACE_KEEP", "50"))
 
     return OCRSettings(
         provider=provider,
         model=model,
         gemini_api_key=api_key,
         max_concurrency=max_concurrency,
+        limiter_max_concurrency=limiter_max_concurrency,
         request_timeout=request_timeout,
         max_retries=max_retries,
         page_fanout=page_fanout,
+        page_group_size=page_group_size,
+        cache_enabled=cache_enabled,
+        cache_path=cache_path,
+        cache_max_bytes=cache_max_bytes,
+        cache_ttl_seconds=cache_ttl_seconds,
+        job_store_dir=job_store_dir,
+        job_workers=job_workers,
+        job_max_attempts=job_max_attempts,
+        text_workers=text_workers,
+        text_worker_max_tasks=text_worker_max_tasks,
+        prompt_compaction=prompt_compaction,
+        prompt_token_budget=prompt_token_budget,
+        layout_fast_path=layout_fast_path,
+        layout_min_confidence=layout_min_confidence,
+        templates_enabled=templates_enabled,
+        template_path=template_path,
+        trace_dir=trace_dir,
+        trace_keep=trace_keep,
     )
 
 
 def get_invoice_extractor(settings: OCRSettings) -> InvoiceExtractorProtocol:
-    """Instantiate the configured invoice extractor implementation."""
+    """Instantiate the configured invoice extractor behind the local fast paths and result cache.
+
+    Layers, outermost first: single-flight coalescing → result cache →
+    layout fast path → vendor templates → provider.
+    """
+
+    configure_cpu_pool(settings.text_workers, settings.text_worker_max_tasks)
+    configure_tracing(settings.trace_dir, settings.trace_keep)
+    extractor = _build_provider_extractor(settings)
+    if settings.templates_enabled:
+        extractor = TemplateInvoiceExtractor(extractor, TemplateStore(Path(settings.template_path)))
+    if settings.layout_fast_path:
+        extractor = LayoutInvoiceExtractor(extractor, min_confidence=settings.layout_min_confidence)
+    if settings.cache_enabled:
+        cache = ExtractionCache(
+            Path(settings.cache_path),
+            max_bytes=settings.cache_max_bytes,
+            ttl_seconds=settings.cache_ttl_seconds,
+        )
+        extractor = CachedInvoiceExtractor(extractor, cache)
+    return CoalescingInvoiceExtractor(extractor)
+
+
+def _build_provider_extractor(settings: OCRSettings) -> InvoiceExtractorProtocol:
+    # One limiter per process: every request's provider calls share its window
+    limiter = AdaptiveConcurrencyLimiter(
+        initial=settings.max_concurrency,
+        max_limit=settings.limiter_max_concurrency,
+    )
 
     if settings.provider == "gemini":
         if GeminiInvoiceExtractor is None:
@@ -78,9 +174,21 @@ def get_invoice_extractor(settings: OCRSettings) -> InvoiceExtractorProtocol:
             timeout=settings.request_timeout,
             max_retries=settings.max_retries,
             fan_out_pages=settings.page_fanout,
+            max_connections=settings.limiter_max_concurrency,
+            page_group_size=settings.page_group_size,
+            limiter=limiter,
+            compact_prompts=settings.prompt_compaction,
+            prompt_token_budget=settings.prompt_token_budget,
         )
 
     # Default to DeepSeek implementation
-    return DeepseekInvoiceExtractor()
+    return DeepseekInvoiceExtractor(
+        timeout=settings.request_timeout,
+        max_retries=settings.max_retries,
+        max_connections=settings.limiter_max_concurrency,
+        limiter=limiter,
+        compact_prompts=settings.prompt_compaction,
+        prompt_token_budget=settings.prompt_token_budget,
+    )
 
 
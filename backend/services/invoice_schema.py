@@ -0,0 +1,137 @@
+"""The invoice JSON shape, defined once for every provider.
+
+Gemini and DeepSeek used to carry their own pretty-printed schema strings
+in the prompt and were asked in prose to "return ONLY valid JSON". Both now
+use their native JSON output modes, generated from :data:`INVOICE_SCHEMA`:
+
+- :func:`gemini_response_schema` is the OpenAPI-style ``responseSchema``
+  Gemini enforces with ``responseMimeType="application/json"`` (so the
+  prompt no longer repeats the schema),
+- :func:`schema_text` is a one-line example for providers that only offer a
+  plain JSON mode (DeepSeek's ``response_format={"type": "json_object"}``
+  still needs the shape spelled out in the prompt).
+
+Output is compact JSON either way, which keeps responses further below the
+``max_tokens`` limit that used to truncate long invoices.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Dict, NamedTuple, Optional
+
+
+class Field(NamedTuple):
+    type: str
+    nullable: bool = True
+    note: Optional[str] = None
+
+
+# Nested dicts are objects (nullable unless listed in _NON_NULL_OBJECTS); a
+# one-element list is an array of that object, whose elements are never
+# null. Key order is the order providers are asked to emit.
+INVOICE_SCHEMA: Dict[str, Any] = {
+    "invoice_number": Field("string"),
+    "date": Field("string", note="as printed"),
+    "vendor": {
+        "name": Field("string"),
+        "address": Field("string"),
+    },
+    "customer": {
+        "name": Field("string"),
+        "billing_address": Field("string"),
+    },
+    "shipping_info": {
+        "address": Field("string"),
+        "city": Field("string"),
+        "state": Field("string"),
+        "country": Field("string"),
+        "postal_code": Field("string"),
+        "ship_mode": Field("string"),
+    },
+    "order_id": Field("string"),
+    "line_items": [
+        {
+            "item_name": Field("string", nullable=False),
+            "description": Field("string"),
+            "product_code": Field("string", note="SKU"),
+            # Null when not printed (e.g. service lines): validate_invoice_math
+            # flags the gap instead of the model being forced to invent a number
+            "quantity": Field("number", note="units"),
+            "rate": Field("number", note="unit price"),
+            "amount": Field("number", note="line total"),
+        }
+    ],
+    "financial_summary": {
+        "subtotal": Field("number"),
+        "discount": {
+            "percent": Field("number"),
+            "amount": Field("number"),
+        },
+        "shipping": Field("number"),
+        "tax": Field("number"),
+        "total": Field("number"),
+        "balance_due": Field("number"),
+    },
+    "payment_terms": Field("string"),
+    "notes": Field("string"),
+}
+
+
+# Objects the router reads fields from unconditionally: Gemini enforces the
+# schema, so a nullable object here could legally come back as null
+_NON_NULL_OBJECTS = {"financial_summary"}
+
+
+def _gemini_node(node: Any, nullable: bool = True) -> Dict[str, Any]:
+    if isinstance(node, Field):
+        schema: Dict[str, Any] = {"type": node.type.upper()}
+        if node.nullable:
+            schema["nullable"] = True
+        if node.note:
+            schema["description"] = node.note
+        return schema
+    if isinstance(node, list):
+        return {"type": "ARRAY", "items": _gemini_node(node[0], nullable=False)}
+    schema = {
+        "type": "OBJECT",
+        "properties": {
+            name: _gemini_node(child, nullable=name not in _NON_NULL_OBJECTS) for name, child in node.items()
+        },
+        "propertyOrdering": list(node),
+    }
+    if nullable:
+        schema["nullable"] = True
+    required = [name for name, child in node.items() if isinstance(child, Field) and not child.nullable]
+    if required:
+        schema["required"] = required
+    return schema
+
+
+def gemini_response_schema() -> Dict[str, Any]:
+    schema = _gemini_node(INVOICE_SCHEMA, nullable=False)
+    # Every top-level key is emitted (null when absent), as the old prompt asked
+    schema["required"] = list(INVOICE_SCHEMA)
+    return schema
+
+
+def _example_node(node: Any) -> Any:
+    if isinstance(node, Field):
+        text = node.type + ("|null" if node.nullable else "")
+        return f"{text} ({node.note})" if node.note else text
+    if isinstance(node, list):
+        return [_example_node(node[0])]
+    return {name: _example_node(child) for name, child in node.items()}
+
+
+def schema_text() -> str:
+    """One-line JSON example of the shape, e.g. ``{"invoice_number":"string|null",...}``."""
+    return json.dumps(_example_node(INVOICE_SCHEMA), separators=(",", ":"))
+
+
+# Part of each provider's PROMPT_VERSION, so cached extractions made under a
+# different schema (either rendering of it) are never replayed
+SCHEMA_VERSION = hashlib.sha256(
+    (schema_text() + json.dumps(gemini_response_schema(), sort_keys=True)).encode("utf-8")
+).hexdigest()[:12]
@@ -0,0 +1,359 @@
+"""Durable batch job queue for long-running invoice extraction.
+
+Month-end batches can outlive a single HTTP request (proxy timeouts, client
+disconnects). Jobs are submitted once, persisted to a local SQLite database
+together with the uploaded bytes, and worked off by a pool of asyncio
+workers. Clients poll for progress and fetch results when the job is done.
+
+Items left ``running`` by a crash or restart are put back to ``pending`` when
+the pool starts, so no OCR spend is lost beyond the in-flight documents. An
+item that has already been claimed ``max_attempts`` times (a document that
+keeps killing the worker, e.g. OOM or a PyMuPDF segfault) is failed instead
+of being retried on every restart.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from .app_logging import get_logger
+
+
+logger = get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    item_index INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    mime_type TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, item_index)
+);
+CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (status, job_id, item_index);
+"""
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+@dataclass
+class JobItem:
+    job_id: str
+    item_index: int
+    filename: str
+    mime_type: str
+    path: Path
+
+
+ProcessItem = Callable[[bytes, str, str], Awaitable[Dict[str, Any]]]
+
+
+class JobStore:
+    """SQLite persistence for jobs, their items and per-item results."""
+
+    def __init__(self, root: Path, *, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> None:
+        self._root = Path(root)
+        self._max_attempts = max(1, max_attempts)
+        self._files_dir = self._root / "files"
+        self._files_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self._root / "jobs.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def new_job(self) -> str:
+        """Reserve a job id and its file directory; see :meth:`item_path`."""
+
+        job_id = uuid.uuid4().hex
+        (self._files_dir / job_id).mkdir(parents=True, exist_ok=True)
+        return job_id
+
+    def item_path(self, job_id: str, index: int) -> Path:
+        """Where the bytes of item ``index`` are written before :meth:`create_job`."""
+
+        return self._files_dir / job_id / f"{index:05d}"
+
+    def discard_job_files(self, job_id: str) -> None:
+        shutil.rmtree(self._files_dir / job_id, ignore_errors=True)
+
+    def create_job(self, job_id: str, items: Sequence[Tuple[str, str]]) -> str:
+        """Enqueue one item per ``(filename, mime_type)`` already written to :meth:`item_path`."""
+
+        now = time.time()
+        rows = [
+            (job_id, index, filename, mime_type, str(self.item_path(job_id, index)), PENDING, now)
+            for index, (filename, mime_type) in enumerate(items)
+        ]
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, status, total, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, len(rows), now),
+            )
+            self._conn.executemany(
+                "INSERT INTO job_items (job_id, item_index, filename, mime_type, path, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+        return job_id
+
+    def requeue_running(self, *, release_attempt: bool = False) -> int:
+        """Return items orphaned by a previous process to the pending state.
+
+        Items that already used ``max_attempts`` claims are failed instead.
+        ``release_attempt`` gives back the attempt of items cancelled by a
+        clean shutdown, which did not crash on them.
+        """
+
+        now = time.time()
+        with self._lock:
+            if release_attempt:
+                self._conn.execute(
+                    "UPDATE job_items SET attempts = MAX(attempts - 1, 0) WHERE status = ?",
+                    (RUNNING,),
+                )
+            exhausted = self._fail_exhausted_locked(RUNNING, now)
+            cursor = self._conn.execute(
+                "UPDATE job_items SET status = ?, updated_at = ? WHERE status = ?",
+                (PENDING, now, RUNNING),
+            )
+            finished_jobs = self._finalize_jobs_locked({job_id for job_id, _, _ in exhausted}, now)
+            self._conn.commit()
+        self._remove_files(exhausted, finished_jobs)
+        return max(cursor.rowcount, 0)
+
+    def claim_next(self) -> Optional[JobItem]:
+        """Atomically mark the oldest pending item as running and return it."""
+
+        now = time.time()
+        with self._lock:
+            # Pending items can be over the limit if max_attempts was lowered
+            exhausted = self._fail_exhausted_locked(PENDING, now)
+            finished_jobs = self._finalize_jobs_locked({job_id for job_id, _, _ in exhausted}, now)
+            if exhausted:
+                self._conn.commit()
+            row = self._conn.execute(
+                "SELECT i.job_id, i.item_index, i.filename, i.mime_type, i.path "
+                "FROM job_items i JOIN jobs j ON j.job_id = i.job_id "
+                "WHERE i.status = ? ORDER BY j.created_at, i.item_index LIMIT 1",
+                (PENDING,),
+            ).fetchone()
+            if row is not None:
+                job_id, item_index, filename, mime_type, path = row
+                self._conn.execute(
+                    "UPDATE job_items SET status = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE job_id = ? AND item_index = ?",
+                    (RUNNING, now, job_id, item_index),
+                )
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = COALESCE(started_at, ?) WHERE job_id = ?",
+                    (JOB_RUNNING, now, job_id),
+                )
+                self._conn.commit()
+        self._remove_files(exhausted, finished_jobs)
+        if row is None:
+            return None
+        return JobItem(job_id, item_index, filename, mime_type, Path(path))
+
+    def finish_item(
+        self,
+        item: JobItem,
+        *,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        status = FAILED if error is not None else SUCCEEDED
+        payload = json.dumps(result) if result is not None else None
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_items SET status = ?, result = ?, error = ?, updated_at = ? "
+                "WHERE job_id = ? AND item_index = ?",
+                (status, payload, error, now, item.job_id, item.item_index),
+            )
+            finished_jobs = self._finalize_jobs_locked({item.job_id}, now)
+            self._conn.commit()
+        self._remove_files([(item.job_id, item.item_index, str(item.path))], finished_jobs)
+
+    def _fail_exhausted_locked(self, status: str, now: float) -> List[Tuple[str, int, str]]:
+        """Fail ``status`` items that already used up their attempts."""
+
+        rows = self._conn.execute(
+            "SELECT job_id, item_index, path FROM job_items WHERE status = ? AND attempts >= ?",
+            (status, self._max_attempts),
+        ).fetchall()
+        if rows:
+            error = f"Gave up after {self._max_attempts} attempt(s): the worker stopped while processing this file"
+            self._conn.executemany(
+                "UPDATE job_items SET status = ?, error = ?, updated_at = ? WHERE job_id = ? AND item_index = ?",
+                [(FAILED, error, now, job_id, item_index) for job_id, item_index, _ in rows],
+            )
+            for job_id, item_index, _ in rows:
+                logger.warning("Job %s item %s failed after %s attempt(s)", job_id, item_index, self._max_attempts)
+        return rows
+
+    def _finalize_jobs_locked(self, job_ids: Set[str], now: float) -> List[str]:
+        """Mark jobs with no pending or running items left as completed."""
+
+        finished = []
+        for job_id in job_ids:
+            (remaining,) = self._conn.execute(
+                "SELECT COUNT(*) FROM job_items WHERE job_id = ? AND status IN (?, ?)",
+                (job_id, PENDING, RUNNING),
+            ).fetchone()
+            if remaining == 0:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = COALESCE(finished_at, ?) WHERE job_id = ?",
+                    (JOB_COMPLETED, now, job_id),
+                )
+                finished.append(job_id)
+        return finished
+
+    def _remove_files(self, items: Sequence[Tuple[str, int, str]], finished_jobs: Sequence[str]) -> None:
+        for _, _, path in items:
+            Path(path).unlink(missing_ok=True)
+        for job_id in finished_jobs:
+            self.discard_job_files(job_id)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT status, total, created_at, started_at, finished_at FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+            if job is None:
+                return None
+            counts = dict(
+                self._conn.execute(
+                    "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status",
+                    (job_id,),
+                ).fetchall()
+            )
+        status, total, created_at, started_at, finished_at = job
+        return {
+            "job_id": job_id,
+            "status": status,
+            "progress": {
+                "total": total,
+                "pending": counts.get(PENDING, 0),
+                "running": counts.get(RUNNING, 0),
+                "succeeded": counts.get(SUCCEEDED, 0),
+                "failed": counts.get(FAILED, 0),
+            },
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+
+    def get_results(self, job_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT item_index, filename, status, result, error FROM job_items "
+                "WHERE job_id = ? ORDER BY item_index",
+                (job_id,),
+            ).fetchall()
+        return [
+            {
+                "index": item_index,
+                "filename": filename,
+                "status": status,
+                "result": json.loads(result) if result else None,
+                "error": error,
+            }
+            for item_index, filename, status, result, error in rows
+        ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobWorkerPool:
+    """Fixed pool of asyncio workers draining the job store."""
+
+    def __init__(self, store: JobStore, process_item: ProcessItem, *, workers: int) -> None:
+        self._store = store
+        self._process_item = process_item
+        self._workers = max(1, workers)
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    @property
+    def store(self) -> JobStore:
+        return self._store
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        requeued = self._store.requeue_running()
+        if requeued:
+            logger.info("Job queue: resuming %s unfinished item(s)", requeued)
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self._workers)]
+
+    def notify(self) -> None:
+        """Wake idle workers after new items were enqueued."""
+
+        self._wakeup.set()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Anything cancelled mid-flight is picked up again on next start,
+        # without counting the interrupted run against its attempts
+        self._store.requeue_running(release_attempt=True)
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            item = await asyncio.to_thread(self._store.claim_next)
+            if item is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=5.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                contents = await asyncio.to_thread(item.path.read_bytes)
+                result = await self._process_item(contents, item.filename, item.mime_type)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                await asyncio.to_thread(self._store.finish_item, item, error=str(exc))
+            else:
+                await asyncio.to_thread(self._store.finish_item, item, result=result)
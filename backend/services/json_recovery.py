@@ -0,0 +1,195 @@
+"""Tolerant parsing of the JSON documents returned by LLM providers.
+
+Models asked for "only JSON" still wrap it in markdown fences, add a line of
+prose, leave trailing commas or stop mid-object when they hit their output
+token limit. Failing the whole invoice on any of these means paying for
+another full extraction, so :func:`parse_model_json` tries a strict parse
+first (``orjson`` when installed) and only on failure runs one repair pass
+over the text:
+
+- strips code fences and any text before the first ``{``/``[`` or after the
+  matching closing bracket,
+- drops trailing commas before ``}``/``]``,
+- closes a truncated document at the last complete value (a value cut off
+  mid-string or mid-number is dropped rather than guessed, and so is an
+  object that was still open inside an array, e.g. a half-written line item).
+
+Every repair is named in the result and counted in
+``llm_json_repairs_total``; downstream math validation still decides
+whether a repaired (possibly shortened) invoice can be trusted.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+
+from .metrics import LLM_JSON_PARSES_TOTAL, LLM_JSON_REPAIRS_TOTAL
+
+try:
+    import orjson  # type: ignore
+
+    def _loads(text: str) -> Any:
+        return orjson.loads(text)
+
+    JSON_BACKEND = "orjson"
+except ImportError:  # pragma: no cover - optional speed-up
+    _loads = json.loads
+    JSON_BACKEND = "json"
+
+
+class JSONRecoveryError(ValueError):
+    """The text holds no JSON object or array that could be repaired."""
+
+
+@dataclass
+class RecoveredJSON:
+    value: Any
+    repairs: List[str] = field(default_factory=list)
+
+    @property
+    def repaired(self) -> bool:
+        return bool(self.repairs)
+
+
+# Whole strings (escapes included), structural characters, runs of anything
+# else, or a lone quote that opens a string the text never closes
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\],:]|[^"{}\[\],:]+|"', re.S)
+_FENCE = re.compile(r"^```[\w-]*[ \t]*\r?\n?|\r?\n?```\s*$")
+_CLOSERS = {"{": "}", "[": "]"}
+_LITERAL_END = re.compile(r"(?:true|false|null)\s*$")
+
+
+def parse_model_json(text: str, *, provider: str = "") -> RecoveredJSON:
+    """Parse ``text`` strictly, falling back to :func:`recover_json`.
+
+    Raises :class:`JSONRecoveryError` when nothing usable is found.
+    """
+
+    try:
+        value = _loads(text)
+    except ValueError:
+        pass
+    else:
+        LLM_JSON_PARSES_TOTAL.inc(provider=provider, outcome="clean")
+        return RecoveredJSON(value)
+
+    try:
+        result = recover_json(text)
+    except JSONRecoveryError:
+        LLM_JSON_PARSES_TOTAL.inc(provider=provider, outcome="failed")
+        raise
+    LLM_JSON_PARSES_TOTAL.inc(provider=provider, outcome="repaired" if result.repaired else "clean")
+    for repair in result.repairs:
+        LLM_JSON_REPAIRS_TOTAL.inc(provider=provider, repair=repair)
+    return result
+
+
+def recover_json(text: str) -> RecoveredJSON:
+    """Single repair pass over ``text``; see the module docstring.
+
+    >>> recover_json('{"line_items":[{"item_name":"x","quantity":2},{"item_name":"y","quantity":1').value
+    {'line_items': [{'item_name': 'x', 'quantity': 2}]}
+    >>> recover_json('{"invoice_number":"A-1","total":12.5,"notes":"paid in fu').value
+    {'invoice_number': 'A-1', 'total': 12.5}
+    """
+
+    repairs: List[str] = []
+    stripped = text.strip()
+    unfenced = _FENCE.sub("", stripped)
+    if unfenced != stripped:
+        repairs.append("code_fence")
+
+    start = min((i for i in (unfenced.find("{"), unfenced.find("[")) if i != -1), default=-1)
+    if start == -1:
+        raise JSONRecoveryError("No JSON object or array in response")
+    if unfenced[:start].strip():
+        repairs.append("leading_text")
+
+    out: List[str] = []
+    stack: List[str] = []
+    # len(out) before each open container's opener, parallel to ``stack``
+    opened: List[int] = []
+    # (len(out), open containers) at the last value boundary: the root
+    # opener, a comma or a closed container. A truncated document is cut
+    # back to it, so a half-written nested item is dropped, not emptied
+    safe: Optional[Tuple[int, Tuple[str, ...]]] = None
+    trailing_comma = False
+    end = len(unfenced)
+    truncated_string = False
+
+    for match in _TOKEN.finditer(unfenced, start):
+        token = match.group()
+        if token in ("{", "["):
+            stack.append(token)
+            opened.append(len(out))
+            out.append(token)
+            if len(stack) == 1:
+                safe = (len(out), tuple(stack))
+        elif token in ("}", "]"):
+            if not stack or _CLOSERS[stack[-1]] != token:
+                raise JSONRecoveryError(f"Unbalanced {token!r} at offset {match.start()}")
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+                trailing_comma = True
+            stack.pop()
+            opened.pop()
+            out.append(token)
+            if not stack:
+                end = match.end()
+                break
+            safe = (len(out), tuple(stack))
+        elif token == ",":
+            safe = (len(out), tuple(stack))
+            out.append(token)
+        elif token == '"':
+            truncated_string = True
+            break
+        else:
+            out.append(token)
+
+    if trailing_comma:
+        repairs.append("trailing_comma")
+
+    if stack:
+        repairs.append("truncated")
+        # An object still open inside an array is a partial element (a line
+        # item without its amounts): cut back to before the outermost one
+        element = next((i + 1 for i in range(len(stack) - 1) if stack[i] == "[" and stack[i + 1] == "{"), None)
+        if element is not None:
+            candidate = "".join(out[: opened[element]]).rstrip().rstrip(",")
+            if element == 1 and candidate == stack[0]:
+                raise JSONRecoveryError("Truncated before the first complete value")
+            closed = candidate + "".join(_CLOSERS[opener] for opener in reversed(stack[:element]))
+            try:
+                return RecoveredJSON(_loads(closed), repairs)
+            except ValueError as exc:
+                raise JSONRecoveryError(f"Could not repair JSON: {exc}") from exc
+        candidate = "".join(out).rstrip()
+        tail_complete = not truncated_string and (
+            candidate.endswith(('"', "}", "]")) or _LITERAL_END.search(candidate) is not None
+        )
+        if tail_complete and not candidate.endswith((",", ":")):
+            closed = candidate + "".join(_CLOSERS[opener] for opener in reversed(stack))
+            try:
+                return RecoveredJSON(_loads(closed), repairs)
+            except ValueError:
+                pass
+        length, open_stack = safe if safe is not None else (0, ())
+        if len(open_stack) == 1 and length == 1:
+            raise JSONRecoveryError("Truncated before the first complete value")
+        candidate = "".join(out[:length]).rstrip().rstrip(",")
+        closed = candidate + "".join(_CLOSERS[opener] for opener in reversed(open_stack))
+    else:
+        closed = "".join(out)
+        if unfenced[end:].strip():
+            repairs.append("trailing_text")
+
+    try:
+        return RecoveredJSON(_loads(closed), repairs)
+    except ValueError as exc:
+        raise JSONRecoveryError(f"Could not repair JSON: {exc}") from exc
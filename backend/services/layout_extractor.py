@@ -0,0 +1,464 @@
+"""Deterministic fast path for digitally generated invoices.
+
+Machine-generated PDFs from billing systems have a real text layer with a
+regular layout: a header row naming the columns, one row per line item and a
+labelled totals block. :func:`extract_layout_invoice` reads PyMuPDF word
+coordinates, rebuilds the visual rows, and produces the same JSON shape the
+LLM providers return (``services/invoice_schema.py``) without any network call.
+
+:class:`LayoutInvoiceExtractor` wraps a provider extractor and only keeps the
+local result when it is fully consistent: every candidate table row parsed,
+``validate_invoice_math`` passes, the critical fields are present and the
+layout confidence clears the threshold. Anything else falls back to the
+provider, so the fast path can skip work but never lowers accuracy.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .cpu_pool import run_cpu_bound
+from .entities import extract_entities
+from .validation import parse_currency, validate_invoice_math
+
+
+# Bump when the parsing rules change so cached fast-path results are not replayed
+LAYOUT_VERSION = "1"
+
+_NUMBER = re.compile(r"^\(?-?[$€£]?-?\d[\d,]*(?:\.\d+)?\)?$")
+_CODE = re.compile(r"^(?=.*\d)(?=.*[A-Za-z-])[A-Za-z0-9][A-Za-z0-9._/-]*$")
+_PAGE_NUMBER = re.compile(r"^page\s+\d+(\s+(of|/)\s+\d+)?$|^\d+\s*(of|/)\s*\d+$", re.IGNORECASE)
+
+_INVOICE_NUMBER = re.compile(
+    r"\binvoice\s*(?:no\.?|number|num\.?|#)?\s*[:#]?\s*([A-Za-z0-9][A-Za-z0-9/-]*\d[A-Za-z0-9/-]*)",
+    re.IGNORECASE,
+)
+_ORDER_ID = re.compile(
+    r"\b(?:PO|P\.O\.|order)\s*(?:no\.?|number|#|id)?\s*[:#]?\s*([A-Za-z0-9-]*\d[A-Za-z0-9-]*)",
+    re.IGNORECASE,
+)
+_BILL_TO = re.compile(r"\bbill(?:ed)?\s+to\s*:?\s*(.+)$", re.IGNORECASE)
+_TERMS = re.compile(r"^(?:payment\s+)?terms\s*:\s*(.{1,40})$", re.IGNORECASE)
+
+# Header words that name table columns
+_COLUMN_WORDS = {
+    "quantity": {"qty", "qty.", "quantity", "units", "hrs", "hours"},
+    "rate": {"rate", "price", "unit", "each", "cost"},
+    "amount": {"amount", "total", "ext", "extended", "line"},
+    "item_name": {"item", "description", "product", "service", "details"},
+    "product_code": {"sku", "code", "part", "ref"},
+}
+_NUMERIC_COLUMNS = ("quantity", "rate", "amount")
+
+# Totals-block labels, most specific first
+_TOTAL_LABELS: Sequence[Tuple[str, Tuple[str, ...]]] = (
+    ("subtotal", ("subtotal", "sub total", "sub-total")),
+    ("balance_due", ("balance due", "amount due", "total due")),
+    ("discount", ("discount",)),
+    ("shipping", ("shipping", "freight", "delivery", "s&h")),
+    ("tax", ("tax", "vat", "gst", "sales tax")),
+    ("total", ("grand total", "total", "invoice total")),
+)
+
+
+@dataclass
+class Word:
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    text: str
+
+
+@dataclass
+class Row:
+    page: int
+    words: List[Word]
+
+    @property
+    def text(self) -> str:
+        return " ".join(word.text for word in self.words)
+
+    @property
+    def top(self) -> float:
+        return min(word.y0 for word in self.words)
+
+
+def extract_layout_invoice(file_bytes: bytes) -> Tuple[Optional[dict], Dict[str, Any]]:
+    """Extract an invoice from a PDF's text layer, or explain why not.
+
+    Returns ``(invoice_json, diagnostics)``. ``invoice_json`` is None when
+    the layout could not be read with full confidence; ``diagnostics``
+    always carries a ``reason`` and timing. Module-level so it can run in
+    the CPU process pool.
+    """
+
+    start = time.perf_counter()
+    diagnostics: Dict[str, Any] = {"reason": None}
+
+    def _reject(reason: str) -> Tuple[None, Dict[str, Any]]:
+        diagnostics["reason"] = reason
+        diagnostics["layout_time"] = (time.perf_counter() - start) * 1000
+        return None, diagnostics
+
+    rows, page_count = read_rows(file_bytes)
+    diagnostics["pages"] = page_count
+    if not rows:
+        return _reject("no_text_layer")
+
+    columns = _find_columns(rows)
+    items, totals, unparsed = _parse_table(rows, columns)
+    diagnostics.update(
+        {
+            "header_found": columns is not None,
+            "line_items": len(items),
+            "unparsed_rows": len(unparsed),
+        }
+    )
+    if unparsed:
+        # A row we could not read may be a line item; never drop it silently
+        diagnostics["unparsed_sample"] = unparsed[:3]
+        return _reject("unparsed_table_rows")
+    if not items:
+        return _reject("no_line_items")
+
+    invoice = _build_invoice(rows, items, totals)
+    financial = invoice["financial_summary"]
+    if not invoice["invoice_number"] or not invoice["date"] or not financial.get("total"):
+        return _reject("missing_critical_fields")
+
+    validation = validate_invoice_math(validation_view(invoice))
+    if not validation["overall_valid"]:
+        return _reject("math_validation_failed")
+
+    confidence = 1.0
+    if financial.get("subtotal") is None:
+        confidence -= 0.1  # one cross-check fewer
+    if columns is None:
+        confidence -= 0.1  # column order inferred from arithmetic
+    if not invoice["vendor"]["name"]:
+        confidence -= 0.05
+    diagnostics["confidence"] = round(confidence, 2)
+    diagnostics["layout_time"] = (time.perf_counter() - start) * 1000
+    return invoice, diagnostics
+
+
+def read_rows(file_bytes: bytes) -> Tuple[List[Row], int]:
+    import fitz  # type: ignore
+
+    rows: List[Row] = []
+    document = fitz.open(stream=file_bytes, filetype="pdf")
+    try:
+        page_count = len(document)
+        for page_index in range(page_count):
+            words = [
+                Word(x0, y0, x1, y1, text)
+                for x0, y0, x1, y1, text, *_ in document[page_index].get_text("words")
+                if text.strip()
+            ]
+            rows.extend(Row(page_index, row_words) for row_words in _group_rows(words))
+    finally:
+        document.close()
+    return rows, page_count
+
+
+def _group_rows(words: List[Word]) -> List[List[Word]]:
+    """Cluster words into visual rows by vertical position."""
+
+    rows: List[List[Word]] = []
+    row_center = None
+    for word in sorted(words, key=lambda w: ((w.y0 + w.y1) / 2, w.x0)):
+        center = (word.y0 + word.y1) / 2
+        tolerance = max(2.0, (word.y1 - word.y0) * 0.4)
+        if rows and row_center is not None and abs(center - row_center) <= tolerance:
+            rows[-1].append(word)
+        else:
+            rows.append([word])
+            row_center = center
+    return [sorted(row, key=lambda w: w.x0) for row in rows]
+
+
+def is_number(token: str) -> bool:
+    return bool(_NUMBER.match(token))
+
+
+def to_number(token: str) -> float:
+    return parse_currency(token)
+
+
+def is_page_number(text: str) -> bool:
+    return bool(_PAGE_NUMBER.match(text))
+
+
+def is_code(token: str) -> bool:
+    """SKU / part-number shaped token (letters or dashes mixed with digits)."""
+    return bool(_CODE.match(token))
+
+
+def _column_kind(token: str) -> Optional[str]:
+    lowered = token.lower().strip(":")
+    for kind, words in _COLUMN_WORDS.items():
+        if lowered in words:
+            return kind
+    return None
+
+
+def _find_columns(rows: Sequence[Row]) -> Optional[List[str]]:
+    """Return the numeric column order from the first table header row."""
+
+    for row in rows:
+        kinds = [_column_kind(word.text) for word in row.words]
+        if any(is_number(word.text) for word in row.words):
+            continue
+        numeric = []
+        for kind in kinds:
+            if kind in _NUMERIC_COLUMNS and kind not in numeric:
+                numeric.append(kind)
+        # "Unit Price" / "Line Total" style headers repeat a kind; keep first
+        if {"quantity", "amount"} <= set(numeric) and any(kind == "item_name" for kind in kinds):
+            return numeric
+    return None
+
+
+def _is_header_row(row: Row) -> bool:
+    kinds = {_column_kind(word.text) for word in row.words}
+    return "quantity" in kinds and "amount" in kinds and not any(is_number(w.text) for w in row.words)
+
+
+def _total_label(row: Row) -> Optional[str]:
+    label = " ".join(word.text for word in row.words if not is_number(word.text)).lower().strip(" :")
+    label = re.sub(r"\s*\(.*?\)|\s*[\d.]+%", "", label).strip(" :")
+    for field, names in _TOTAL_LABELS:
+        if label in names:
+            return field
+    return None
+
+
+def _parse_table(
+    rows: Sequence[Row],
+    columns: Optional[List[str]],
+) -> Tuple[List[dict], Dict[str, float], List[str]]:
+    items: List[dict] = []
+    totals: Dict[str, float] = {}
+    unparsed: List[str] = []
+    header_pages = {row.page for row in rows if _is_header_row(row)}
+    in_table = {page: page not in header_pages for page in {row.page for row in rows}}
+    totals_started = False
+
+    for row in rows:
+        if _is_header_row(row):
+            in_table[row.page] = True
+            continue
+        label = _total_label(row)
+        numbers = [word.text for word in row.words if is_number(word.text)]
+        if label and numbers:
+            totals_started = True
+            totals.setdefault(label, to_number(numbers[-1]))
+            continue
+        if totals_started or not in_table[row.page] or len(numbers) < 2:
+            continue
+        if is_page_number(row.text):
+            continue
+        item = _parse_item_row(row, columns)
+        if item is None:
+            unparsed.append(row.text)
+        else:
+            items.append(item)
+    return items, totals, unparsed
+
+
+def _parse_item_row(row: Row, columns: Optional[List[str]]) -> Optional[dict]:
+    # Numbers at the right-hand end of the row are the numeric columns
+    trailing: List[str] = []
+    for word in reversed(row.words):
+        if not is_number(word.text):
+            break
+        trailing.insert(0, word.text)
+    text_words = [word.text for word in row.words[: len(row.words) - len(trailing)]]
+    if not text_words:
+        return None
+
+    order = columns or list(_NUMERIC_COLUMNS)
+    if len(trailing) != len(order):
+        return None
+    values = dict(zip(order, (to_number(token) for token in trailing)))
+    if "rate" not in values:
+        if not values.get("quantity"):
+            return None
+        values["rate"] = round(values["amount"] / values["quantity"], 2)
+    if abs(values["quantity"] * values["rate"] - values["amount"]) > 0.01:
+        return None
+
+    product_code = None
+    if len(text_words) > 1 and is_code(text_words[-1]):
+        product_code = text_words.pop()
+    quantity = values["quantity"]
+    return {
+        "item_name": " ".join(text_words),
+        "description": None,
+        "product_code": product_code,
+        "quantity": int(quantity) if float(quantity).is_integer() else quantity,
+        "rate": values["rate"],
+        "amount": values["amount"],
+    }
+
+
+def _build_invoice(rows: Sequence[Row], items: List[dict], totals: Dict[str, float]) -> dict:
+    first_page = [row.text for row in rows if row.page == 0]
+    first_page_text = "\n".join(first_page)
+
+    invoice_number = _first_group(_INVOICE_NUMBER, first_page_text)
+    dates = [entity["text"] for entity in extract_entities(first_page_text) if entity["type"] == "DATE"]
+    order_id = _first_group(_ORDER_ID, first_page_text)
+    customer = None
+    terms = None
+    for line in first_page:
+        customer = customer or _first_group(_BILL_TO, line)
+    for row in rows:
+        terms = terms or _first_group(_TERMS, row.text)
+
+    total = totals.get("total", totals.get("balance_due"))
+    return {
+        "invoice_number": invoice_number,
+        "date": dates[0] if dates else None,
+        "vendor": {"name": _vendor_name(first_page), "address": None},
+        "customer": {"name": customer, "billing_address": None},
+        "shipping_info": None,
+        "order_id": order_id,
+        "line_items": items,
+        "financial_summary": {
+            "subtotal": totals.get("subtotal"),
+            "discount": {"percent": None, "amount": totals.get("discount")},
+            "shipping": totals.get("shipping"),
+            "tax": totals.get("tax"),
+            "total": total,
+            "balance_due": totals.get("balance_due"),
+        },
+        "payment_terms": terms,
+        "notes": None,
+    }
+
+
+def _first_group(pattern: re.Pattern, text: str) -> Optional[str]:
+    match = pattern.search(text)
+    return match.group(1).strip() if match else None
+
+
+def _vendor_name(first_page: Sequence[str]) -> Optional[str]:
+    # Billing systems put the seller's name first; only trust a plain text line
+    if not first_page:
+        return None
+    candidate = first_page[0].split("|")[0].strip()
+    if not candidate or any(char.isdigit() for char in candidate) or "invoice" in candidate.lower():
+        return None
+    return candidate
+
+
+def validation_view(invoice: dict) -> dict:
+    """Map provider-shaped JSON onto the fields validate_invoice_math reads."""
+
+    financial = invoice["financial_summary"]
+    return {
+        "line_items": [
+            {"item": item["item_name"], "quantity": item["quantity"], "rate": item["rate"], "amount": item["amount"]}
+            for item in invoice["line_items"]
+        ],
+        "subtotal": financial.get("subtotal") or 0,
+        "total_amount": financial.get("total") or 0,
+        "shipping": financial.get("shipping") or 0,
+        "discount_amount": (financial.get("discount") or {}).get("amount") or 0,
+        "tax": financial.get("tax") or 0,
+    }
+
+
+class LayoutInvoiceExtractor:
+    """Tries the local layout fast path before delegating to a provider extractor."""
+
+    def __init__(self, inner: Any, *, min_confidence: float = 0.9) -> None:
+        self._inner = inner
+        self._min_confidence = min_confidence
+        self.name = inner.name
+        self._model = getattr(inner, "_model", None)
+        self.prompt_version = f"{getattr(inner, 'prompt_version', 'unversioned')}+layout{LAYOUT_VERSION}"
+        self._stats: Dict[str, Any] = {"attempts": 0, "hits": 0, "fallbacks": {}}
+
+    @property
+    def inner(self) -> Any:
+        return self._inner
+
+    async def aclose(self) -> None:
+        close = getattr(self._inner, "aclose", None)
+        if close is not None:
+            await close()
+
+    def fast_path_stats(self) -> Dict[str, Any]:
+        attempts = self._stats["attempts"]
+        return {
+            **self._stats,
+            "fallbacks": dict(self._stats["fallbacks"]),
+            "hit_rate": round(self._stats["hits"] / attempts, 3) if attempts else 0.0,
+        }
+
+    async def extract_invoice(
+        self,
+        *,
+        file_bytes: bytes,
+        filename: str,
+        mime_type: str,
+    ) -> dict:
+        if mime_type != "application/pdf":
+            return await self._inner.extract_invoice(
+                file_bytes=file_bytes, filename=filename, mime_type=mime_type
+            )
+
+        start = time.time()
+        self._stats["attempts"] += 1
+        try:
+            (invoice_json, diagnostics), timings = await run_cpu_bound(extract_layout_invoice, file_bytes)
+        except Exception as exc:
+            invoice_json, diagnostics = None, {"reason": f"layout_error: {exc}"}
+            timings = {"queue_wait_time": 0.0, "compute_time": 0.0}
+
+        if invoice_json is not None and diagnostics.get("confidence", 0) < self._min_confidence:
+            invoice_json, diagnostics["reason"] = None, "low_confidence"
+
+        if invoice_json is None:
+            reason = str(diagnostics.get("reason")).split(":")[0]
+            self._stats["fallbacks"][reason] = self._stats["fallbacks"].get(reason, 0) + 1
+            result = await self._inner.extract_invoice(
+                file_bytes=file_bytes, filename=filename, mime_type=mime_type
+            )
+            performance = result.get("performance") or {}
+            performance["fast_path"] = False
+            performance["fast_path_reason"] = diagnostics.get("reason")
+            performance["layout_time"] = timings["compute_time"]
+            result["performance"] = performance
+            return result
+
+        self._stats["hits"] += 1
+        breakdown = {
+            "provider": "layout",
+            "model": None,
+            "text_extraction_time": timings["compute_time"],
+            "text_queue_wait_time": timings["queue_wait_time"],
+            "api_call_time": 0,
+            "json_parse_time": 0,
+        }
+        return {
+            "result_json": invoice_json,
+            "result_markdown": json.dumps(invoice_json, indent=2),
+            "pages": diagnostics.get("pages", 1),
+            "duration": round(time.time() - start, 2),
+            "images": {},
+            "performance": {
+                **breakdown,
+                "provider_breakdown": breakdown,
+                "fast_path": True,
+                "layout_confidence": diagnostics.get("confidence"),
+                "layout_time": timings["compute_time"],
+            },
+        }
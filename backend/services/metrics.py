@@ -0,0 +1,229 @@
+"""In-process metrics registry exported in the Prometheus text format.
+
+Per-batch ``performance_metrics`` only describe one response; these series
+accumulate across requests so latency distributions per stage, provider and
+model can be scraped from ``GET /metrics``. The registry is deliberately
+tiny (counters, gauges and fixed-bucket histograms behind one lock) so the
+hot path pays a dict lookup and an addition per observation.
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], lock: threading.Lock) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = lock
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple("" if labels[name] is None else str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> Iterable[str]:  # pragma: no cover - abstract
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> Iterable[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._bounds = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (+Inf last), sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self._bounds) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def _samples(self) -> Iterable[str]:
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self._bounds + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}"
+            labels = _label_text(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total[0])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """Named metrics plus the text exposition served at ``/metrics``."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                raise ValueError(f"Metric {metric.name} already registered with a different shape")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames, self._lock))  # type: ignore[return-value]
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, self._lock))  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Optional[Sequence[float]] = None,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, self._lock, buckets=buckets or DEFAULT_BUCKETS)
+        return self._register(metric)  # type: ignore[return-value]
+
+    def render(self) -> str:
+        with self._lock:
+            lines: List[str] = []
+            for metric in self._metrics.values():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "invoice_stage_duration_seconds",
+    "Time spent per pipeline stage.",
+    ("stage", "provider", "model"),
+)
+INVOICES_TOTAL = REGISTRY.counter(
+    "invoices_processed_total",
+    "Invoices processed, by review status (or error).",
+    ("provider", "status"),
+)
+EXTRACTION_PATH_TOTAL = REGISTRY.counter(
+    "invoice_extraction_path_total",
+    "How each invoice's data was obtained.",
+    ("path",),
+)
+INVOICES_IN_FLIGHT = REGISTRY.gauge(
+    "invoices_in_flight",
+    "Invoices currently being processed.",
+)
+BATCHES_TOTAL = REGISTRY.counter(
+    "invoice_batches_total",
+    "Batch requests handled, by endpoint.",
+    ("endpoint",),
+)
+BATCH_SECONDS = REGISTRY.histogram(
+    "invoice_batch_duration_seconds",
+    "End-to-end batch latency.",
+    ("endpoint",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+LLM_JSON_PARSES_TOTAL = REGISTRY.counter(
+    "llm_json_parses_total",
+    "Provider JSON responses parsed, by outcome (clean, repaired, failed).",
+    ("provider", "outcome"),
+)
+LLM_JSON_REPAIRS_TOTAL = REGISTRY.counter(
+    "llm_json_repairs_total",
+    "Repairs applied to provider JSON responses, by kind.",
+    ("provider", "repair"),
+)
+LLM_TOKENS_TOTAL = REGISTRY.counter(
+    "llm_tokens_total",
+    "Provider tokens billed, by direction (input, output).",
+    ("provider", "direction"),
+)
+LLM_OUTPUT_TOKENS = REGISTRY.histogram(
+    "llm_output_tokens",
+    "Output tokens per provider response.",
+    ("provider",),
+    buckets=(128, 256, 512, 1024, 2048, 3072, 4096, 8192),
+)
+ANALYZE_RESPONSE_BYTES = REGISTRY.histogram(
+    "analyze_response_bytes",
+    "Size of each /ocr/analyze JSON body, by image mode (assets, inline, none).",
+    ("images",),
+    buckets=(1024, 8192, 32768, 131072, 524288, 2097152, 8388608, 33554432),
+)
+ANALYZE_SERIALIZE_SECONDS = REGISTRY.histogram(
+    "analyze_serialize_duration_seconds",
+    "Time spent serialising each /ocr/analyze response, by image mode.",
+    ("images",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
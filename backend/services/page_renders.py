@@ -0,0 +1,136 @@
+"""Rendered page images for the review UI, cached on local disk.
+
+The review screen only needs a preview of each page, not the whole PDF or a
+base64 image embedded in an OCR response. :func:`render_page` rasterises a
+single page of a stored PDF with PyMuPDF, and :class:`PageRenderCache`
+keeps the encoded PNG/WebP files under a byte budget, evicting the least
+recently served renders first. Blobs are content-addressed, so a render is
+keyed on the blob hash, page, DPI and format and never goes stale.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+RENDER_FORMATS = {"png": "image/png", "webp": "image/webp"}
+MIN_DPI = 36
+MAX_DPI = 300
+DEFAULT_DPI = 110
+
+
+class PageNotFound(LookupError):
+    """Requested page index is outside the document."""
+
+
+def render_page(pdf_path: str, page_index: int, dpi: int, fmt: str) -> bytes:
+    """Rasterise one page (0-based) of the PDF at ``pdf_path``."""
+
+    try:
+        import fitz  # type: ignore
+    except ImportError as exc:  # pragma: no cover - library availability
+        raise RuntimeError(
+            "PyMuPDF (fitz) is required for PDF processing. Install with: pip install PyMuPDF"
+        ) from exc
+
+    document = fitz.open(pdf_path)
+    try:
+        if not 0 <= page_index < len(document):
+            raise PageNotFound(f"Page {page_index + 1} not in document ({len(document)} pages)")
+        pixmap = document[page_index].get_pixmap(dpi=dpi, alpha=False)
+        if fmt == "png":
+            return pixmap.tobytes("png")
+        # MuPDF has no WebP encoder; Pillow does
+        try:
+            import PIL  # noqa: F401
+        except ImportError as exc:  # pragma: no cover - library availability
+            raise RuntimeError("Pillow is required for WebP rendering. Install with: pip install Pillow") from exc
+        return pixmap.pil_tobytes(format="WEBP", quality=80)
+    finally:
+        document.close()
+
+
+class PageRenderCache:
+    """Directory of encoded page renders with size-based LRU eviction."""
+
+    def __init__(self, root: Path, *, max_bytes: int) -> None:
+        self._root = Path(root)
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Rebuild the LRU order from the previous run, oldest access first
+        existing = [
+            (path.stat().st_mtime, path.name, path.stat().st_size)
+            for path in self._root.iterdir()
+            if path.is_file() and not path.name.endswith(".part")
+        ]
+        for _, name, size in sorted(existing):
+            self._entries[name] = size
+            self._total_bytes += size
+
+    @staticmethod
+    def key(sha256: str, page_index: int, dpi: int, fmt: str) -> str:
+        return f"{sha256}-p{page_index + 1}-{dpi}dpi.{fmt}"
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self._root / key
+        with self._lock:
+            if key not in self._entries or not path.is_file():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # mtime doubles as last access so the order survives restarts
+        os.utime(path)
+        return path
+
+    def put(self, key: str, contents: bytes) -> Path:
+        path = self._root / key
+        temp_path = self._root / f"{uuid.uuid4().hex}.part"
+        temp_path.write_bytes(contents)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(contents)
+            self._total_bytes += len(contents)
+            while self._total_bytes > self._max_bytes and len(self._entries) > 1:
+                victim, size = self._entries.popitem(last=False)
+                (self._root / victim).unlink(missing_ok=True)
+                self._total_bytes -= size
+                self.evictions += 1
+        return path
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_page_render_cache() -> PageRenderCache:
+    """Process-wide cache at ``PAGE_RENDER_CACHE_DIR`` bounded by ``PAGE_RENDER_CACHE_MAX_BYTES``."""
+
+    return PageRenderCache(
+        Path(os.getenv("PAGE_RENDER_CACHE_DIR", ".cache/page_renders")),
+        max_bytes=int(os.getenv("PAGE_RENDER_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    )
@@ -0,0 +1,239 @@
+"""Shrink extracted document text before it is pasted into a provider prompt.
+
+Raw PDF text carries a lot of weight the model doesn't need: the same
+letterhead and "Page N of M" footer on every page, runs of layout
+whitespace, and legal boilerplate (terms & conditions, remittance
+disclaimers). All of it costs input tokens and latency on every request.
+
+:func:`compact_pages` removes that noise page by page (legal boilerplate
+only below a page's last figure, never among line items; what was dropped
+is listed in the stats), and
+:func:`enforce_token_budget` caps what is left at a configurable budget,
+keeping the start and end of the document (header block and totals) when
+something has to go.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+# Characters per token is a rough average for English invoice text; good
+# enough to budget without shipping a tokenizer.
+CHARS_PER_TOKEN = 4
+
+DEFAULT_TOKEN_BUDGET = 24000
+
+# Lines only this close to the top/bottom of a page are header/footer candidates
+_EDGE_LINES = 4
+
+_HORIZONTAL_WS = re.compile(r"[ \t\u00a0]+")
+_PAGE_NUMBER = re.compile(r"^(page\s*\d+(\s*(of|/)\s*\d+)?|\d+\s*(of|/)\s*\d+)$", re.IGNORECASE)
+_AMOUNT = re.compile(r"\d\.\d{2}\b")
+_PAGE_NUMBER_KEY = "<page-number>"
+
+# Removed boilerplate lines reported in the stats, each cut to this length
+_REPORTED_LINES = 5
+_REPORTED_CHARS = 120
+
+# (side of the page, lines from that edge, normalised text)
+EdgeKey = Tuple[str, int, str]
+
+_BOILERPLATE_PHRASES = (
+    "terms and conditions",
+    "terms & conditions",
+    "all rights reserved",
+    "governing law",
+    "jurisdiction",
+    "limitation of liability",
+    "liable for",
+    "indemnif",
+    "warrant",
+    "confidential",
+    "intended recipient",
+    "subject to the",
+    "late payment",
+    "retention of title",
+    "privacy policy",
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return _tokens_for(len(text))
+
+
+def _tokens_for(chars: int) -> int:
+    return (chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+@dataclass
+class CompactionStats:
+    chars_before: int = 0
+    chars_after: int = 0
+    header_footer_lines_removed: int = 0
+    boilerplate_lines_removed: int = 0
+    # The first few removed boilerplate lines, for review
+    boilerplate_removed: List[str] = field(default_factory=list)
+    truncated: bool = False
+
+    def record_boilerplate(self, line: str) -> None:
+        self.boilerplate_lines_removed += 1
+        if len(self.boilerplate_removed) < _REPORTED_LINES:
+            self.boilerplate_removed.append(line[:_REPORTED_CHARS])
+
+    def as_metrics(self) -> Dict[str, object]:
+        return {
+            "document_chars_before": self.chars_before,
+            "document_chars_after": self.chars_after,
+            "document_tokens_before": _tokens_for(self.chars_before),
+            "document_tokens_after": _tokens_for(self.chars_after),
+            "header_footer_lines_removed": self.header_footer_lines_removed,
+            "boilerplate_lines_removed": self.boilerplate_lines_removed,
+            "boilerplate_removed": list(self.boilerplate_removed),
+            "prompt_truncated": self.truncated,
+        }
+
+
+def compact_pages(pages: Sequence[str]) -> Tuple[List[str], CompactionStats]:
+    """Strip repeated headers/footers, boilerplate and redundant whitespace."""
+
+    stats = CompactionStats(chars_before=sum(len(page) for page in pages))
+    page_lines = [_clean_lines(page) for page in pages]
+    repeated = _repeated_edge_lines(page_lines)
+
+    compacted: List[str] = []
+    already_kept: set = set()
+    for lines in page_lines:
+        kept: List[str] = []
+        edge_keys = _edge_keys(lines)
+        footer_start = _footer_start(lines)
+        for position, line in enumerate(lines):
+            keys = [key for key in edge_keys.get(position, ()) if key in repeated]
+            if keys:
+                # Keep the first copy of a running header (it may hold the
+                # vendor or invoice number); page numbers carry nothing.
+                if any(key[2] == _PAGE_NUMBER_KEY for key in keys) or already_kept.issuperset(keys):
+                    stats.header_footer_lines_removed += 1
+                    continue
+                already_kept.update(keys)
+            if position >= footer_start and _is_boilerplate(line):
+                stats.record_boilerplate(line)
+                continue
+            kept.append(line)
+        compacted.append("\n".join(_squeeze_blank_lines(kept)))
+
+    stats.chars_after = sum(len(page) for page in compacted)
+    return compacted, stats
+
+
+def enforce_token_budget(
+    text: str,
+    token_budget: int,
+    stats: Optional[CompactionStats] = None,
+) -> Tuple[str, bool]:
+    """Trim ``text`` to roughly ``token_budget`` tokens.
+
+    Keeps the first two thirds and the last third of the allowance, since
+    invoices put identifying fields at the top and totals at the bottom.
+    Returns the (possibly) trimmed text and whether anything was removed;
+    ``stats`` is updated when given.
+    """
+
+    if token_budget <= 0 or estimate_tokens(text) <= token_budget:
+        return text, False
+
+    max_chars = token_budget * CHARS_PER_TOKEN
+    head = (max_chars * 2) // 3
+    tail = max_chars - head
+    omitted = len(text) - head - tail
+    if stats is not None:
+        stats.chars_after -= omitted
+        stats.truncated = True
+    marker = f"\n[... {omitted} characters omitted to fit the prompt budget ...]\n"
+    return text[:head] + marker + text[-tail:], True
+
+
+def _clean_lines(page: str) -> List[str]:
+    return [_HORIZONTAL_WS.sub(" ", line).strip() for line in page.splitlines()]
+
+
+def _squeeze_blank_lines(lines: Sequence[str]) -> List[str]:
+    squeezed: List[str] = []
+    for line in lines:
+        if not line and (not squeezed or not squeezed[-1]):
+            continue
+        squeezed.append(line)
+    while squeezed and not squeezed[-1]:
+        squeezed.pop()
+    return squeezed
+
+
+def _edge_key(line: str) -> Optional[str]:
+    """Key used to spot running headers/footers, or None if never one."""
+
+    if not line or _AMOUNT.search(line):
+        # A line with an amount is far more likely a repeated line item
+        return None
+    if _PAGE_NUMBER.match(line):
+        # "Page 2 of 7" and "Page 3 of 7" are the same footer
+        return _PAGE_NUMBER_KEY
+    return line.lower()
+
+
+def _edge_keys(lines: Sequence[str]) -> Dict[int, List[EdgeKey]]:
+    """Map line positions near the top/bottom of a page to their edge keys.
+
+    Keys include the distance from the page edge, so only lines that recur
+    at the same spot on many pages (a running header, not a table cell that
+    happens to repeat) are treated as headers/footers.
+    """
+
+    non_blank = [position for position, line in enumerate(lines) if line]
+    edges = [("top", non_blank[:_EDGE_LINES]), ("bottom", non_blank[::-1][:_EDGE_LINES])]
+    keys: Dict[int, List[EdgeKey]] = {}
+    for side, positions in edges:
+        for rank, position in enumerate(positions):
+            text_key = _edge_key(lines[position])
+            if text_key is not None:
+                keys.setdefault(position, []).append((side, rank, text_key))
+    return keys
+
+
+def _repeated_edge_lines(page_lines: Sequence[Sequence[str]]) -> set:
+    if len(page_lines) < 2:
+        return set()
+
+    counts: Counter = Counter()
+    for lines in page_lines:
+        counts.update({key for keys in _edge_keys(lines).values() for key in keys})
+
+    threshold = max(2, (len(page_lines) + 1) // 2)
+    return {key for key, seen in counts.items() if seen >= threshold}
+
+
+def _footer_start(lines: Sequence[str]) -> int:
+    """Position after the page's last line with a digit.
+
+    PyMuPDF puts table cells on their own lines, so a line-item description
+    ("Extended warranty coverage plan ...") is always followed by its
+    quantity and amount; only the prose below the last figure on the page
+    (terms, disclaimers) is eligible as boilerplate.
+    """
+
+    for position in range(len(lines) - 1, -1, -1):
+        line = lines[position]
+        if any(char.isdigit() for char in line) and not _PAGE_NUMBER.match(line):
+            return position + 1
+    return 0
+
+
+def _is_boilerplate(line: str) -> bool:
+    # Short lines are usually field labels ("Terms: Net 30") and lines with
+    # digits may carry amounts, rates or dates; only drop long prose.
+    if len(line) < 80 or any(char.isdigit() for char in line):
+        return False
+    lowered = line.lower()
+    return any(phrase in lowered for phrase in _BOILERPLATE_PHRASES)
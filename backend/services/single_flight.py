@@ -0,0 +1,82 @@
+"""Single-flight coalescing of identical in-flight extractions.
+
+Double-submits and two reviewers uploading the same PDF at the same moment
+both miss the result cache, because neither call has finished yet.
+:class:`CoalescingInvoiceExtractor` keys calls on a hash of the file bytes
+and MIME type: the first caller starts the extraction and every identical
+call that arrives while it is running awaits the same task instead of
+starting another provider round-trip. Callers that already hashed the
+upload (the spool does) pass ``content_sha256`` so the bytes are not hashed
+again here or in the result cache.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import hashlib
+from typing import Any, Dict, Optional
+
+
+class CoalescingInvoiceExtractor:
+    """Wraps an invoice extractor so concurrent identical requests share one call."""
+
+    accepts_content_sha256 = True
+
+    def __init__(self, inner: Any) -> None:
+        self._inner = inner
+        self.name = inner.name
+        self._model = getattr(inner, "_model", None)
+        self.prompt_version = getattr(inner, "prompt_version", "unversioned")
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._started = 0
+        self._coalesced = 0
+
+    @property
+    def inner(self) -> Any:
+        return self._inner
+
+    async def aclose(self) -> None:
+        close = getattr(self._inner, "aclose", None)
+        if close is not None:
+            await close()
+
+    def coalesce_stats(self) -> Dict[str, int]:
+        return {
+            "started": self._started,
+            "coalesced": self._coalesced,
+            "in_flight": len(self._in_flight),
+        }
+
+    async def extract_invoice(
+        self,
+        *,
+        file_bytes: bytes,
+        filename: str,
+        mime_type: str,
+        content_sha256: Optional[str] = None,
+    ) -> dict:
+        digest = content_sha256 or hashlib.sha256(file_bytes).hexdigest()
+        key = digest + "|" + (mime_type or "")
+        task = self._in_flight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self._coalesced += 1
+        else:
+            self._started += 1
+            # Hand the digest on to the result cache when it is the next layer
+            extra = {"content_sha256": digest} if getattr(self._inner, "accepts_content_sha256", False) else {}
+            task = asyncio.ensure_future(
+                self._inner.extract_invoice(file_bytes=file_bytes, filename=filename, mime_type=mime_type, **extra)
+            )
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # Shield so one caller disconnecting does not cancel the others' result
+        result = await asyncio.shield(task)
+        # Callers annotate the result dict; give each one its own copy
+        result = copy.deepcopy(result)
+        performance = result.get("performance") or {}
+        performance["coalesced"] = coalesced
+        result["performance"] = performance
+        return result
@@ -0,0 +1,275 @@
+"""Per-request trace spans with a Chrome trace exporter.
+
+Batch timings say a request was slow, not whether the time went to the
+batch semaphore, reading the upload, the thread/process pool queue, the
+provider limiter, the HTTP call or retry backoff. :func:`span` records
+nested, named intervals in the current request's trace (tracked with
+``contextvars``, so tasks spawned inside a request inherit it). Spans that
+had to wait for a resource record that wait separately via
+:meth:`Span.set_wait`, so queueing and service time are never conflated.
+
+Tracing is off unless ``OCR_TRACE_DIR`` is set; then every traced request
+is written to that directory in the Chrome trace event format (open it in
+``chrome://tracing`` or https://ui.perfetto.dev). Outside a trace
+:func:`span` returns a shared no-op object, so instrumented code pays one
+context variable lookup.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+_trace_dir: Optional[Path] = None
+_trace_keep = 50
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("span", default=None)
+
+
+def configure_tracing(trace_dir: Optional[str], keep: int = 50) -> None:
+    """Enable tracing into ``trace_dir`` (falsy disables), keeping the newest ``keep`` files."""
+
+    global _trace_dir, _trace_keep
+    _trace_dir = Path(trace_dir) if trace_dir else None
+    _trace_keep = max(1, keep)
+    if _trace_dir is not None:
+        _trace_dir.mkdir(parents=True, exist_ok=True)
+
+
+def tracing_enabled() -> bool:
+    return _trace_dir is not None
+
+
+def _reset(var: contextvars.ContextVar, token: contextvars.Token) -> None:
+    try:
+        var.reset(token)
+    except ValueError:
+        # Exited from another context (e.g. an async generator closed by a
+        # different task); just clear the value there
+        var.set(None)
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "lane", "attrs", "start", "end", "wait_ms", "_token")
+
+    def __init__(self, trace: "Trace", name: str, parent: Optional["Span"], lane: int, attrs: Dict[str, Any]) -> None:
+        self.trace = trace
+        self.name = name
+        self.span_id = next(trace.ids)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.lane = lane
+        self.attrs = attrs
+        self.start = 0.0
+        self.end = 0.0
+        self.wait_ms = 0.0
+        self._token: Optional[contextvars.Token] = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def set_wait(self, wait_ms: float) -> None:
+        """Portion of this span (from its start) spent queued rather than served."""
+        self.wait_ms = max(0.0, wait_ms)
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end = time.perf_counter()
+        if self._token is not None:
+            _reset(_current_span, self._token)
+        if exc is not None:
+            self.attrs["error"] = f"{type(exc).__name__}: {exc}"[:200]
+        self.trace.spans.append(self)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def set_wait(self, wait_ms: float) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, name: str) -> None:
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.wall_start = time.time()
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self.ids = itertools.count(1)
+        self._lanes = itertools.count(1)
+        self.lane_names: Dict[int, str] = {0: name}
+
+    def new_lane(self, label: str) -> int:
+        lane = next(self._lanes)
+        self.lane_names[lane] = label
+        return lane
+
+
+def span(name: str, *, lane: Optional[str] = None, **attrs: Any):
+    """Context manager timing ``name`` inside the current trace.
+
+    ``lane`` starts a new row in the trace viewer (e.g. one per invoice) so
+    concurrent work does not render as overlapping slices on one row.
+    """
+
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP
+    parent = _current_span.get()
+    if lane is not None:
+        lane_id = trace.new_lane(lane)
+    else:
+        lane_id = parent.lane if parent is not None else 0
+    return Span(trace, name, parent, lane_id, attrs)
+
+
+def traced(name: Optional[str] = None) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Decorator recording a span around each call of a sync function."""
+
+    def decorator(func: Callable[..., T]) -> Callable[..., T]:
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> T:
+            with span(label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+async def traced_to_thread(name: str, func: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+    """``asyncio.to_thread`` that records the thread-pool queue wait separately."""
+
+    traced_span = span(name)
+    if traced_span is _NOOP:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    with traced_span:
+        submitted = time.perf_counter()
+        started = submitted
+
+        def _run() -> T:
+            nonlocal started
+            started = time.perf_counter()
+            return func(*args, **kwargs)
+
+        result = await asyncio.to_thread(_run)
+        traced_span.set_wait((started - submitted) * 1000)
+    return result
+
+
+@contextlib.asynccontextmanager
+async def trace_request(name: str, **attrs: Any) -> AsyncIterator[Optional[Trace]]:
+    """Collect spans for one request and write them out when it finishes."""
+
+    if _trace_dir is None or _current_trace.get() is not None:
+        yield None
+        return
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        with span(name, **attrs):
+            yield trace
+    finally:
+        _reset(_current_trace, token)
+        await asyncio.to_thread(_write_trace, trace, _trace_dir, _trace_keep)
+
+
+def to_chrome_trace(trace: Trace) -> Dict[str, Any]:
+    """Chrome trace event format: one complete ("X") event per span, plus its wait."""
+
+    events: List[Dict[str, Any]] = [
+        {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": f"{trace.name} {trace.trace_id}"}}
+    ]
+    for lane, label in trace.lane_names.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": lane, "args": {"name": label}})
+        events.append({"name": "thread_sort_index", "ph": "M", "pid": 1, "tid": lane, "args": {"sort_index": lane}})
+
+    for item in sorted(trace.spans, key=lambda s: (s.start, s.span_id)):
+        ts = (item.start - trace.origin) * 1e6
+        duration_ms = (item.end - item.start) * 1000
+        args = {
+            **item.attrs,
+            "span_id": item.span_id,
+            "parent_id": item.parent_id,
+        }
+        if item.wait_ms:
+            args["wait_ms"] = round(item.wait_ms, 3)
+            args["service_ms"] = round(max(0.0, duration_ms - item.wait_ms), 3)
+        events.append(
+            {
+                "name": item.name,
+                "cat": "span",
+                "ph": "X",
+                "ts": round(ts, 1),
+                "dur": round(duration_ms * 1000, 1),
+                "pid": 1,
+                "tid": item.lane,
+                "args": args,
+            }
+        )
+        if item.wait_ms:
+            events.append(
+                {
+                    "name": f"{item.name} (wait)",
+                    "cat": "wait",
+                    "ph": "X",
+                    "ts": round(ts, 1),
+                    "dur": round(min(item.wait_ms, duration_ms) * 1000, 1),
+                    "pid": 1,
+                    "tid": item.lane,
+                    "args": {"parent_id": item.span_id},
+                }
+            )
+    return {
+        "traceEvents": events,
+        "displayTimeUnit": "ms",
+        "otherData": {"trace_id": trace.trace_id, "name": trace.name, "started_at": trace.wall_start},
+    }
+
+
+def export_chrome_trace(trace: Trace, path: Path) -> Path:
+    path = Path(path)
+    temp_path = path.with_suffix(".part")
+    temp_path.write_text(json.dumps(to_chrome_trace(trace)), encoding="utf-8")
+    os.replace(temp_path, path)
+    return path
+
+
+def _write_trace(trace: Trace, trace_dir: Path, keep: int) -> None:
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(trace.wall_start))
+    export_chrome_trace(trace, trace_dir / f"{stamp}-{trace.name}-{trace.trace_id}.json")
+    files = sorted(trace_dir.glob("*.json"), key=lambda p: p.stat().st_mtime)
+    for stale in files[:-keep]:
+        stale.unlink(missing_ok=True)
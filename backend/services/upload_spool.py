@@ -0,0 +1,121 @@
+"""Stream uploads to disk instead of buffering them in memory.
+
+``await upload.read()`` materialises the whole file, and the router used to
+keep that copy alive for the entire batch and then write it out again for the
+PDF viewer. :func:`spool_upload` copies the upload into the content-addressed
+:class:`~services.blob_store.BlobStore` in fixed size chunks while hashing
+it, so the same document is only stored once. The bytes are read back from
+disk right before extraction, inside the batch's concurrency bound, so a
+batch holds at most its in-flight invoices in memory rather than every upload.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .blob_store import BlobStore, blob_extension
+from .tracing import traced_to_thread
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None  # type: ignore
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class SpooledUpload:
+    path: Path
+    sha256: str
+    ext: str
+    size: int
+    filename: str
+    mime_type: Optional[str]
+    spool_time: float  # ms
+
+    async def read_bytes(self) -> bytes:
+        return await traced_to_thread("spool.read_bytes", self.path.read_bytes)
+
+
+async def write_upload(upload: Any, path: Path, *, chunk_size: int = CHUNK_SIZE) -> Tuple[str, int]:
+    """Stream an ``UploadFile`` to ``path``; returns its SHA-256 and size.
+
+    A partially written file is removed if the copy fails.
+    """
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                await asyncio.to_thread(out.write, chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return digest.hexdigest(), size
+
+
+async def spool_upload(upload: Any, store: BlobStore, *, chunk_size: int = CHUNK_SIZE) -> SpooledUpload:
+    """Copy an ``UploadFile`` into ``store`` chunk by chunk."""
+
+    start = time.perf_counter()
+    part = store.incoming_path()
+    ext = blob_extension(upload.filename)
+    sha256, size = await write_upload(upload, part, chunk_size=chunk_size)
+    try:
+        target = await asyncio.to_thread(store.adopt, part, sha256, ext)
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+
+    return SpooledUpload(
+        path=target,
+        sha256=sha256,
+        ext=ext,
+        size=size,
+        filename=upload.filename,
+        mime_type=upload.content_type,
+        spool_time=(time.perf_counter() - start) * 1000,
+    )
+
+
+class UploadMemoryTracker:
+    """Counts upload bytes held in memory at once during a batch."""
+
+    def __init__(self) -> None:
+        self.current_bytes = 0
+        self.peak_bytes = 0
+        self.total_bytes = 0
+
+    @contextlib.contextmanager
+    def hold(self, nbytes: int) -> Iterator[None]:
+        self.current_bytes += nbytes
+        self.total_bytes += nbytes
+        self.peak_bytes = max(self.peak_bytes, self.current_bytes)
+        try:
+            yield
+        finally:
+            self.current_bytes -= nbytes
+
+    def summary(self) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {
+            "upload_bytes_total": self.total_bytes,
+            "upload_bytes_peak": self.peak_bytes,
+        }
+        if resource is not None:
+            # ru_maxrss is KiB on Linux; process-lifetime high-water mark
+            summary["process_peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        return summary
@@ -25,6 +25,11 @@ import re
 from typing import Dict, List, Any
 from decimal import Decimal, InvalidOperation
 
+from .app_logging import get_logger
+from .tracing import traced
+
+logger = get_logger(__name__)
+
 
 def parse_currency(value: str) -> float:
     """
@@ -72,7 +77,7 @@ def parse_currency(value: str) -> float:
         result = float(value)
         return -result if is_negative else result
     except ValueError:
-        print(f"WARNING: Could not parse currency value: {value}")
+        logger.warning("Could not parse currency value: %s", value)
         return 0.0
 
 
@@ -140,6 +145,7 @@ def validate_line_item(item: Dict[str, Any]) -> Dict[str, Any]:
         }
 
 
+@traced("validation.validate_invoice_math")
 def validate_invoice_math(invoice_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Comprehensive mathematical validation of entire invoice.
@@ -285,6 +291,7 @@ def calculate_validation_confidence(validation_results: Dict[str, Any]) -> float
         return 0.20  # Multiple critical issues
 
 
+@traced("validation.determine_review_status")
 def determine_review_status(confidence: float, validation_results: Dict[str, Any], 
                            has_critical_fields: bool) -> Dict[str, Any]:
     """
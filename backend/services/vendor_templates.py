@@ -0,0 +1,608 @@
+"""Learned per-vendor layout templates.
+
+Most invoices come from a small set of repeat suppliers whose billing system
+prints every document the same way. When an extraction is auto-approved, the
+router asks :class:`TemplateInvoiceExtractor` to learn where each field sat on
+the page: header fields by row position and neighbouring label words, totals
+by their label, and line items by column order between the table header and
+the first totals row. Templates are keyed by a fingerprint of the first-page
+layout above the line-item table.
+
+A new document with a known fingerprint is replayed against its template
+locally. The replay is kept only under the same rules as the layout fast path
+(every table row read, math validates, critical fields present); any mismatch
+falls back to the provider and counts against the template's hit rate.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .cpu_pool import run_cpu_bound
+from .layout_extractor import Row, is_code, is_number, is_page_number, read_rows, to_number, validation_view
+from .validation import validate_invoice_math
+
+
+TEMPLATE_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vendor_templates (
+    fingerprint TEXT PRIMARY KEY,
+    vendor_name TEXT,
+    template TEXT NOT NULL,
+    learned INTEGER NOT NULL DEFAULT 0,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+# Layout grid (points) used for fingerprints and row matching
+_GRID = 6.0
+_ROW_TOLERANCE = 3.0
+_MAX_FINGERPRINT_ROWS = 15
+
+# Provider JSON paths for header fields replayed by position
+_HEADER_FIELDS = {
+    "invoice_number": ("invoice_number",),
+    "date": ("date",),
+    "order_id": ("order_id",),
+    "vendor_name": ("vendor", "name"),
+    "customer_name": ("customer", "name"),
+    "payment_terms": ("payment_terms",),
+}
+_REQUIRED_FIELDS = ("invoice_number", "date")
+_TOTAL_FIELDS = ("subtotal", "discount", "shipping", "tax", "total", "balance_due")
+_NUMERIC_COLUMNS = ("quantity", "rate", "amount")
+
+
+def layout_fingerprint(rows: Sequence[Row]) -> Optional[str]:
+    """Hash the first-page layout above the line-item table.
+
+    Uses each row's grid position and its leading word when that word is a
+    plain label, so invoice numbers, dates and amounts do not change the
+    fingerprint but a different vendor's letterhead does.
+    """
+
+    signature: List[str] = []
+    for row in rows:
+        if row.page != 0:
+            break
+        if _looks_like_table_row(row) or len(signature) >= _MAX_FINGERPRINT_ROWS:
+            break
+        first = row.words[0].text.strip(":").lower()
+        label = first if first.isalpha() else "#"
+        signature.append(f"{round(row.top / _GRID)}:{round(row.words[0].x0 / _GRID)}:{label}")
+    if not signature:
+        return None
+    return hashlib.sha256("|".join(signature).encode("utf-8")).hexdigest()[:16]
+
+
+def _looks_like_table_row(row: Row) -> bool:
+    # Addresses carry a street number and postcode; item rows carry amounts
+    numbers = [word.text for word in row.words if is_number(word.text)]
+    return len(numbers) >= 3 or sum("." in number for number in numbers) >= 2
+
+
+# ----------------------------------------------------------------------------
+# Learning
+# ----------------------------------------------------------------------------
+
+
+def build_template(file_bytes: bytes, invoice_json: dict) -> Tuple[Optional[str], Optional[dict], str]:
+    """Derive a template from an approved extraction of ``file_bytes``.
+
+    Returns ``(fingerprint, template, reason)``. The template is only
+    returned when replaying it on the same document reproduces the approved
+    line items and total.
+    """
+
+    rows, page_count = read_rows(file_bytes)
+    fingerprint = layout_fingerprint(rows)
+    if fingerprint is None:
+        return None, None, "no_text_layer"
+
+    table = _learn_table(rows, invoice_json.get("line_items") or [])
+    if table is None:
+        return fingerprint, None, "line_items_not_located"
+
+    financial = invoice_json.get("financial_summary") or {}
+    totals: Dict[str, str] = {}
+    for field in _TOTAL_FIELDS:
+        value = _total_value(financial, field)
+        if value:
+            label = _learn_total(rows, value)
+            if label:
+                totals[field] = label
+    if "total" not in totals and "balance_due" not in totals:
+        return fingerprint, None, "total_not_located"
+    labels = set(totals.values())
+    end_index = next(index for index, row in enumerate(rows) if _row_label(row) in labels)
+    table["end_label"] = _row_label(rows[end_index])
+
+    fields: Dict[str, dict] = {}
+    for field, path in _HEADER_FIELDS.items():
+        value = _get_path(invoice_json, path)
+        if value:
+            spec = _learn_field(rows, str(value), end_index)
+            if spec:
+                fields[field] = spec
+    if any(field not in fields for field in _REQUIRED_FIELDS):
+        return fingerprint, None, "header_fields_not_located"
+
+    template = {
+        "version": TEMPLATE_VERSION,
+        "vendor_name": _get_path(invoice_json, ("vendor", "name")),
+        "fields": fields,
+        "totals": totals,
+        "table": table,
+    }
+
+    replayed, diagnostics = _replay(rows, page_count, template)
+    if replayed is None:
+        return fingerprint, None, f"self_check_failed:{diagnostics['reason']}"
+    expected_total = _total_value(financial, "total") or _total_value(financial, "balance_due")
+    replayed_total = replayed["financial_summary"]["total"]
+    if len(replayed["line_items"]) != len(invoice_json["line_items"]) or abs(replayed_total - expected_total) > 0.01:
+        return fingerprint, None, "self_check_mismatch"
+    return fingerprint, template, "learned"
+
+
+def _get_path(data: dict, path: Tuple[str, ...]) -> Any:
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _total_value(financial: dict, field: str) -> Optional[float]:
+    value = financial.get(field)
+    if field == "discount":
+        value = value.get("amount") if isinstance(value, dict) else None
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_label(token: str) -> bool:
+    return not any(char.isdigit() for char in token)
+
+
+def _learn_field(rows: Sequence[Row], value: str, end_index: int) -> Optional[dict]:
+    tokens = value.split()
+    for index, row in enumerate(rows):
+        texts = [word.text.strip(",") for word in row.words]
+        for start in range(len(texts) - len(tokens) + 1):
+            if texts[start : start + len(tokens)] != tokens:
+                continue
+            end = start + len(tokens)
+            prefix = texts[start - 1] if start > 0 and _is_label(texts[start - 1]) else None
+            suffix = texts[end] if end < len(texts) and _is_label(texts[end]) else None
+            below_table = index >= end_index
+            if below_table and prefix is None:
+                return None
+            return {
+                # Rows below the totals move with the item count; find them by label on the last page
+                "page": -1 if below_table else row.page,
+                "top": None if below_table else round(row.top, 1),
+                "x": round(row.words[start].x0, 1),
+                "prefix": prefix,
+                "suffix": suffix,
+                "to_end": end == len(texts),
+                "words": len(tokens),
+            }
+    return None
+
+
+def _row_label(row: Row) -> str:
+    return " ".join(word.text for word in row.words if not is_number(word.text)).lower().strip(" :")
+
+
+def _learn_total(rows: Sequence[Row], value: float) -> Optional[str]:
+    for row in reversed(rows):
+        numbers = [word.text for word in row.words if is_number(word.text)]
+        if numbers and abs(to_number(numbers[-1]) - value) <= 0.005:
+            label = _row_label(row)
+            if label:
+                return label
+    return None
+
+
+def _learn_table(rows: Sequence[Row], line_items: Sequence[dict]) -> Optional[dict]:
+    if not line_items:
+        return None
+    positions: Dict[str, List[float]] = {column: [] for column in _NUMERIC_COLUMNS}
+    code_positions: List[float] = []
+    first_index = last_index = None
+    search_from = 0
+    for item in line_items:
+        found = None
+        for index in range(search_from, len(rows)):
+            columns = _match_item(rows[index], item)
+            if columns is not None:
+                found = index, columns
+                break
+        if found is None:
+            return None
+        index, columns = found
+        first_index = index if first_index is None else first_index
+        last_index = index
+        search_from = index + 1
+        for column, word in columns.items():
+            if column == "product_code":
+                code_positions.append(word.x0)
+            else:
+                positions[column].append((word.x0 + word.x1) / 2)
+
+    header = None
+    if first_index and not any(is_number(word.text) for word in rows[first_index - 1].words):
+        header = rows[first_index - 1].text.lower()
+    order = sorted(_NUMERIC_COLUMNS, key=lambda column: sum(positions[column]) / len(positions[column]))
+    return {
+        "header": header,
+        "columns": order,
+        "product_code": bool(code_positions),
+    }
+
+
+def _match_item(row: Row, item: dict) -> Optional[dict]:
+    matched: Dict[str, Any] = {}
+    used = set()
+    for column in _NUMERIC_COLUMNS:
+        try:
+            target = float(item.get(column))
+        except (TypeError, ValueError):
+            return None
+        for index, word in enumerate(row.words):
+            if index not in used and is_number(word.text) and abs(to_number(word.text) - target) <= 0.005:
+                matched[column] = word
+                used.add(index)
+                break
+        else:
+            return None
+    code = item.get("product_code")
+    if code:
+        for word in row.words:
+            if word.text == code:
+                matched["product_code"] = word
+    return matched
+
+
+# ----------------------------------------------------------------------------
+# Replay
+# ----------------------------------------------------------------------------
+
+
+def replay_template(file_bytes: bytes, templates: Dict[str, dict]) -> Tuple[Optional[str], Optional[dict], Dict[str, Any]]:
+    """Fingerprint ``file_bytes`` and replay its template if one is known."""
+
+    start = time.perf_counter()
+    rows, page_count = read_rows(file_bytes)
+    fingerprint = layout_fingerprint(rows)
+    template = templates.get(fingerprint) if fingerprint else None
+    if template is None:
+        invoice, diagnostics = None, {"reason": "no_template"}
+    else:
+        invoice, diagnostics = _replay(rows, page_count, template)
+    diagnostics["pages"] = page_count
+    diagnostics["template_time"] = (time.perf_counter() - start) * 1000
+    return fingerprint, invoice, diagnostics
+
+
+def _replay(rows: Sequence[Row], page_count: int, template: dict) -> Tuple[Optional[dict], Dict[str, Any]]:
+    values: Dict[str, Optional[str]] = {}
+    for field, spec in template["fields"].items():
+        values[field] = _replay_field(rows, page_count, spec)
+        if not values[field] and field in _REQUIRED_FIELDS:
+            return None, {"reason": f"field_not_found:{field}"}
+
+    totals: Dict[str, float] = {}
+    for field, label in template["totals"].items():
+        row = next((row for row in reversed(rows) if _row_label(row) == label), None)
+        numbers = [word.text for word in row.words if is_number(word.text)] if row else []
+        if not numbers:
+            return None, {"reason": f"total_not_found:{field}"}
+        totals[field] = to_number(numbers[-1])
+
+    items, unparsed = _replay_table(rows, template["table"])
+    if unparsed:
+        return None, {"reason": "unparsed_table_rows", "unparsed_sample": unparsed[:3]}
+    if not items:
+        return None, {"reason": "no_line_items"}
+
+    total = totals.get("total", totals.get("balance_due"))
+    invoice = {
+        "invoice_number": values.get("invoice_number"),
+        "date": values.get("date"),
+        "vendor": {"name": values.get("vendor_name") or template.get("vendor_name"), "address": None},
+        "customer": {"name": values.get("customer_name"), "billing_address": None},
+        "shipping_info": None,
+        "order_id": values.get("order_id"),
+        "line_items": items,
+        "financial_summary": {
+            "subtotal": totals.get("subtotal"),
+            "discount": {"percent": None, "amount": totals.get("discount")},
+            "shipping": totals.get("shipping"),
+            "tax": totals.get("tax"),
+            "total": total,
+            "balance_due": totals.get("balance_due"),
+        },
+        "payment_terms": values.get("payment_terms"),
+        "notes": None,
+    }
+    if not invoice["invoice_number"] or not invoice["date"] or not total:
+        return None, {"reason": "missing_critical_fields"}
+    if not validate_invoice_math(validation_view(invoice))["overall_valid"]:
+        return None, {"reason": "math_validation_failed"}
+    return invoice, {"reason": None, "line_items": len(items)}
+
+
+def _replay_field(rows: Sequence[Row], page_count: int, spec: dict) -> Optional[str]:
+    page = spec["page"] + page_count if spec["page"] < 0 else spec["page"]
+    page_rows = [row for row in rows if row.page == page]
+    if spec["top"] is None:
+        candidates = [row for row in page_rows if any(word.text == spec["prefix"] for word in row.words)]
+    else:
+        candidates = [row for row in page_rows if abs(row.top - spec["top"]) <= _ROW_TOLERANCE]
+
+    for row in candidates:
+        texts = [word.text.strip(",") for word in row.words]
+        if spec["prefix"]:
+            if spec["prefix"] not in texts:
+                continue
+            start = texts.index(spec["prefix"]) + 1
+        else:
+            start = next(
+                (index for index, word in enumerate(row.words) if word.x0 >= spec["x"] - _ROW_TOLERANCE),
+                len(texts),
+            )
+        if spec["suffix"]:
+            if spec["suffix"] not in texts[start:]:
+                continue
+            end = texts.index(spec["suffix"], start)
+        else:
+            end = len(texts) if spec["to_end"] else start + spec["words"]
+        value = " ".join(texts[start:end]).strip()
+        if value:
+            return value
+    return None
+
+
+def _replay_table(rows: Sequence[Row], table: dict) -> Tuple[List[dict], List[str]]:
+    header = table["header"]
+    end_label = table["end_label"]
+    columns = table["columns"]
+    header_pages = {row.page for row in rows if header and row.text.lower() == header}
+    in_table = {row.page: row.page not in header_pages for row in rows}
+    items: List[dict] = []
+    unparsed: List[str] = []
+    for row in rows:
+        if header and row.text.lower() == header:
+            in_table[row.page] = True
+            continue
+        if end_label and _row_label(row) == end_label:
+            break
+        numbers = [index for index, word in enumerate(row.words) if is_number(word.text)]
+        if not in_table[row.page] or len(numbers) < 2 or is_page_number(row.text):
+            continue
+        item = _replay_item(row, numbers, columns, table["product_code"])
+        if item is None:
+            unparsed.append(row.text)
+        else:
+            items.append(item)
+    return items, unparsed
+
+
+def _replay_item(row: Row, numbers: List[int], columns: List[str], has_code: bool) -> Optional[dict]:
+    if len(numbers) < len(columns):
+        return None
+    # Numbers inside a description precede the numeric columns; take the last ones
+    column_words = numbers[-len(columns) :]
+    values = {column: to_number(row.words[index].text) for column, index in zip(columns, column_words)}
+    if abs(values["quantity"] * values["rate"] - values["amount"]) > 0.01:
+        return None
+    text = [word.text for index, word in enumerate(row.words) if index not in column_words]
+    product_code = None
+    if has_code:
+        codes = [token for token in text if is_code(token)]
+        if codes:
+            product_code = codes[-1]
+            text.remove(product_code)
+    if not text:
+        return None
+    quantity = values["quantity"]
+    return {
+        "item_name": " ".join(text),
+        "description": None,
+        "product_code": product_code,
+        "quantity": int(quantity) if float(quantity).is_integer() else quantity,
+        "rate": values["rate"],
+        "amount": values["amount"],
+    }
+
+
+# ----------------------------------------------------------------------------
+# Storage and extractor wrapper
+# ----------------------------------------------------------------------------
+
+
+class TemplateStore:
+    """SQLite-backed template table, mirrored in memory for lookups."""
+
+    def __init__(self, path: Path) -> None:
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self._path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        self._templates: Dict[str, dict] = {}
+        for fingerprint, payload in self._conn.execute("SELECT fingerprint, template FROM vendor_templates"):
+            template = json.loads(payload)
+            if template.get("version") == TEMPLATE_VERSION:
+                self._templates[fingerprint] = template
+
+    def snapshot(self) -> Dict[str, dict]:
+        return dict(self._templates)
+
+    def __contains__(self, fingerprint: str) -> bool:
+        return fingerprint in self._templates
+
+    def put(self, fingerprint: str, template: dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO vendor_templates (fingerprint, vendor_name, template, learned, created_at, updated_at) "
+                "VALUES (?, ?, ?, 1, ?, ?) "
+                "ON CONFLICT(fingerprint) DO UPDATE SET vendor_name = excluded.vendor_name, "
+                "template = excluded.template, learned = learned + 1, updated_at = excluded.updated_at",
+                (fingerprint, template.get("vendor_name"), json.dumps(template), now, now),
+            )
+            self._conn.commit()
+            self._templates[fingerprint] = template
+
+    def record(self, fingerprint: str, hit: bool) -> None:
+        column = "hits" if hit else "misses"
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE vendor_templates SET {column} = {column} + 1 WHERE fingerprint = ?",
+                (fingerprint,),
+            )
+            self._conn.commit()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT fingerprint, vendor_name, learned, hits, misses, updated_at "
+                "FROM vendor_templates ORDER BY hits + misses DESC"
+            ).fetchall()
+        templates = []
+        for fingerprint, vendor_name, learned, hits, misses, updated_at in rows:
+            lookups = hits + misses
+            templates.append(
+                {
+                    "fingerprint": fingerprint,
+                    "vendor_name": vendor_name,
+                    "learned": learned,
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                    "updated_at": updated_at,
+                }
+            )
+        hits = sum(template["hits"] for template in templates)
+        lookups = hits + sum(template["misses"] for template in templates)
+        return {
+            "templates": len(templates),
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "by_template": templates,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class TemplateInvoiceExtractor:
+    """Replays learned vendor templates before delegating to a provider extractor."""
+
+    def __init__(self, inner: Any, store: TemplateStore) -> None:
+        self._inner = inner
+        self._store = store
+        self.name = inner.name
+        self._model = getattr(inner, "_model", None)
+        self.prompt_version = getattr(inner, "prompt_version", "unversioned")
+
+    @property
+    def inner(self) -> Any:
+        return self._inner
+
+    @property
+    def templates(self) -> TemplateStore:
+        return self._store
+
+    async def aclose(self) -> None:
+        close = getattr(self._inner, "aclose", None)
+        if close is not None:
+            await close()
+        self._store.close()
+
+    async def learn_template(self, *, file_bytes: bytes, mime_type: str, invoice_json: dict) -> Dict[str, Any]:
+        """Record field positions from an approved extraction; returns what happened."""
+
+        if mime_type != "application/pdf":
+            return {"learned": False, "reason": "not_pdf"}
+        (fingerprint, template, reason), _ = await run_cpu_bound(build_template, file_bytes, invoice_json)
+        if template is not None:
+            await asyncio.to_thread(self._store.put, fingerprint, template)
+        return {"learned": template is not None, "fingerprint": fingerprint, "reason": reason}
+
+    async def extract_invoice(
+        self,
+        *,
+        file_bytes: bytes,
+        filename: str,
+        mime_type: str,
+    ) -> dict:
+        if mime_type != "application/pdf":
+            return await self._inner.extract_invoice(
+                file_bytes=file_bytes, filename=filename, mime_type=mime_type
+            )
+
+        start = time.time()
+        try:
+            (fingerprint, invoice_json, diagnostics), timings = await run_cpu_bound(
+                replay_template, file_bytes, self._store.snapshot()
+            )
+        except Exception as exc:
+            fingerprint, invoice_json, diagnostics = None, None, {"reason": f"template_error: {exc}"}
+            timings = {"queue_wait_time": 0.0, "compute_time": 0.0}
+
+        known = fingerprint is not None and fingerprint in self._store
+        if known:
+            await asyncio.to_thread(self._store.record, fingerprint, invoice_json is not None)
+        template_info = {
+            "fingerprint": fingerprint,
+            "status": "hit" if invoice_json is not None else ("mismatch" if known else "none"),
+            "reason": diagnostics.get("reason"),
+            "time": timings["compute_time"],
+        }
+
+        if invoice_json is None:
+            result = await self._inner.extract_invoice(
+                file_bytes=file_bytes, filename=filename, mime_type=mime_type
+            )
+            performance = result.get("performance") or {}
+            performance["template"] = template_info
+            result["performance"] = performance
+            return result
+
+        breakdown = {
+            "provider": "template",
+            "model": None,
+            "text_extraction_time": timings["compute_time"],
+            "text_queue_wait_time": timings["queue_wait_time"],
+            "api_call_time": 0,
+            "json_parse_time": 0,
+        }
+        return {
+            "result_json": invoice_json,
+            "result_markdown": json.dumps(invoice_json, indent=2),
+            "pages": diagnostics.get("pages", 1),
+            "duration": round(time.time() - start, 2),
+            "images": {},
+            "performance": {**breakdown, "provider_breakdown": breakdown, "template": template_info},
+        }
@@ -65,6 +65,7 @@ function App() {
   }, [aggregatedData, selectedInvoiceId])
 
   const selectedInvoicePdfUrl = useMemo(() => {
+    if (selectedInvoice?.pdf_url) return `http://localhost:8000${selectedInvoice.pdf_url}`
     if (!selectedInvoice?.filename) return null
     const encodedName = encodeURIComponent(selectedInvoice.filename)
     return `http://localhost:8000/files/${encodedName}`